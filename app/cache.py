@@ -0,0 +1,354 @@
+"""Module to define the caches.
+"""
+
+import fnmatch
+import logging
+import pickle
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Literal
+
+import redis
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import CACHE_REQUESTS
+
+
+class CacheBackend:
+    """Interface of the caches.
+
+    The `a` prefixed methods are the ones to await on the event loop, backends
+    doing network calls run them in the threadpool.
+
+    Hits and misses are counted in the `cache_requests_total` metric, labelled
+    with the cache name. The hit ratio of all the workers is computed from it,
+    like `sum by (cache) (rate(cache_requests_total{result="hit"}[5m])) /
+    sum by (cache) (rate(cache_requests_total[5m]))`.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name (str): Name of the cache, used as metric label.
+        """
+
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._counts_lock = threading.Lock()
+        self._hits = CACHE_REQUESTS.labels(cache=name, result="hit")
+        self._misses = CACHE_REQUESTS.labels(cache=name, result="miss")
+
+    @property
+    def hit_ratio(self) -> float:
+        """Ratio of lookups of this process that were hits, 0 before the first
+        lookup."""
+
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _count(self, hit: bool) -> None:
+        with self._counts_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        (self._hits if hit else self._misses).inc()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value from the cache.
+
+        Args:
+            key (Hashable): The key.
+            default (Any, optional): Value returned on a miss. Defaults to None.
+
+        Returns:
+            Any: The cached value or default.
+        """
+
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value.
+
+        Args:
+            key (Hashable): The key.
+            value (Any): The value.
+        """
+
+        raise NotImplementedError
+
+    def pop(self, key: Hashable) -> None:
+        """Remove a key from the cache if present.
+
+        Args:
+            key (Hashable): The key.
+        """
+
+        raise NotImplementedError
+
+    def pop_many(self, keys: Iterable[Hashable]) -> None:
+        """Remove several keys from the cache.
+
+        Args:
+            keys (Iterable[Hashable]): The keys.
+        """
+
+        for key in keys:
+            self.pop(key)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+
+        raise NotImplementedError
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        """See get."""
+
+        return self.get(key, default)
+
+    async def aset(self, key: Hashable, value: Any) -> None:
+        """See set."""
+
+        self.set(key, value)
+
+    async def apop(self, key: Hashable) -> None:
+        """See pop."""
+
+        self.pop(key)
+
+    async def apop_many(self, keys: Iterable[Hashable]) -> None:
+        """See pop_many."""
+
+        self.pop_many(keys)
+
+
+class TTLCache(CacheBackend):
+    """Bounded in-process LRU cache whose entries expire after a TTL.
+
+    It is thread safe, so it can be shared by the event loop and the threadpool.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Args:
+            name (str): Name of the cache, used as metric label.
+            maxsize (int): Maximum number of entries, 0 disables the cache.
+            ttl (float): Seconds an entry is valid.
+            timer (Callable[[], float], optional): Clock. Defaults to time.monotonic.
+        """
+
+        super().__init__(name)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > self._timer():
+                    self._data.move_to_end(key)
+                    self._count(hit=True)
+                    return value
+                del self._data[key]
+
+        self._count(hit=False)
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entry if full.
+
+        Args:
+            key (Hashable): The key.
+            value (Any): The value.
+        """
+
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (self._timer() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class InMemoryStore:
+    """In-memory stand-in of a shared key-value store, for tests.
+
+    It implements the subset of the redis-py client used by `SharedCache`, but
+    it is only shared by the users of the same instance, in the same process.
+    """
+
+    def __init__(self, timer: Callable[[], float] = time.monotonic) -> None:
+        """
+        Args:
+            timer (Callable[[], float], optional): Clock. Defaults to time.monotonic.
+        """
+
+        self._timer = timer
+        self._data: dict[str, tuple[float | None, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> bytes | None:
+        with self._lock:
+            item = self._data.get(name)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires <= self._timer():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name: str, value: bytes, ex: int | None = None) -> bool:
+        with self._lock:
+            expires = self._timer() + ex if ex is not None else None
+            self._data[name] = (expires, value)
+        return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+    def keys(self, pattern: str = "*") -> list[str]:
+        with self._lock:
+            return fnmatch.filter(self._data, pattern)
+
+
+class SharedCache(CacheBackend):
+    """Cache kept in a store shared by all the workers, such as Redis.
+
+    The client needs the `get`, `set(..., ex=ttl)`, `delete` and `keys` methods
+    of the redis-py client. Values are pickled and keys are prefixed with the
+    cache name. The client blocks, so the `a` methods run in the threadpool. A
+    failing store is handled as a miss on reads and skipped on writes. Failed
+    invalidations are logged, the entries expire after the TTL: the write they
+    follow is committed already and must not fail.
+    """
+
+    def __init__(self, name: str, client: Any, ttl: int) -> None:
+        """
+        Args:
+            name (str): Name of the cache, used as metric label and key prefix.
+            client (Any): The store client.
+            ttl (int): Seconds an entry is valid.
+        """
+
+        super().__init__(name)
+        self.client = client
+        self.ttl = ttl
+        self._prefix = f"cache:{name}:"
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            data = self.client.get(f"{self._prefix}{key}")
+        except Exception:
+            logging.exception("Could not get key %s from cache %s" % (key, self.name))
+            data = None
+
+        self._count(hit=data is not None)
+        return default if data is None else pickle.loads(data)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        try:
+            self.client.set(f"{self._prefix}{key}", pickle.dumps(value), ex=self.ttl)
+        except Exception:
+            logging.exception("Could not set key %s in cache %s" % (key, self.name))
+
+    def pop(self, key: Hashable) -> None:
+        self.pop_many([key])
+
+    def pop_many(self, keys: Iterable[Hashable]) -> None:
+        if names := [f"{self._prefix}{key}" for key in keys]:
+            try:
+                self.client.delete(*names)
+            except Exception:
+                logging.exception(
+                    "Could not delete %d keys from cache %s, they expire in %ds"
+                    % (len(names), self.name, self.ttl)
+                )
+
+    def clear(self) -> None:
+        if names := self.client.keys(f"{self._prefix}*"):
+            self.client.delete(*names)
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        return await run_in_threadpool(self.get, key, default)
+
+    async def aset(self, key: Hashable, value: Any) -> None:
+        await run_in_threadpool(self.set, key, value)
+
+    async def apop(self, key: Hashable) -> None:
+        await run_in_threadpool(self.pop, key)
+
+    async def apop_many(self, keys: Iterable[Hashable]) -> None:
+        await run_in_threadpool(self.pop_many, list(keys))
+
+
+def create_cache(
+    name: str,
+    backend: Literal["local", "shared"],
+    maxsize: int,
+    ttl: int,
+    url: str | None = None,
+    client: Any = None,
+    timeout: float = 0.25,
+) -> CacheBackend:
+    """Create a cache.
+
+    Args:
+        name (str): Name of the cache.
+        backend (Literal["local", "shared"]): `local` for a per process LRU cache,
+        `shared` for a `SharedCache`.
+        maxsize (int): Maximum number of entries of a local cache, 0 disables
+        any backend.
+        ttl (int): Seconds an entry is valid.
+        url (str | None, optional): Redis URL of the shared store. Defaults to None.
+        client (Any, optional): Client of the shared store, instead of the url.
+        Defaults to None.
+        timeout (float, optional): Seconds to connect to the store of the url and
+        to wait for its answers. Defaults to 0.25.
+
+    Raises:
+        ValueError: Unknown backend, or shared backend without a store.
+
+    Returns:
+        CacheBackend: The cache.
+    """
+
+    if backend == "local" or maxsize <= 0:
+        return TTLCache(name, maxsize=maxsize, ttl=ttl)
+    if backend == "shared":
+        if client is None and url is None:
+            raise ValueError(f"The shared cache {name} needs the URL of a store")
+        if client is None:
+            client = redis.Redis.from_url(
+                url, socket_connect_timeout=timeout, socket_timeout=timeout
+            )
+        return SharedCache(name, client, ttl=ttl)
+
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -2,7 +2,7 @@
 """
 
 import logging
-from typing import Any
+from typing import Any, Literal
 
 from functools import lru_cache
 
@@ -13,22 +13,136 @@ class Settings(BaseSettings):
     PROJECT_NAME: str
     ENV_NAME: str
     BACKEND_CORS_ORIGINS: list[AnyHttpUrl] = []
+    # Address and worker processes of `python -m app.server`, 0 starts one per CPU
+    WEB_BIND: str = "0.0.0.0:8000"
+    WEB_WORKERS: int = 0
+    # On SIGTERM workers keep serving with a failing readiness check for
+    # WEB_DRAIN_SECONDS, so load balancers stop routing to them, then have
+    # WEB_GRACEFUL_TIMEOUT seconds to finish their requests before being killed
+    WEB_DRAIN_SECONDS: float = 0
+    WEB_GRACEFUL_TIMEOUT: float = 30
+    # Seconds the readiness check waits for a database round trip
+    HEALTH_CHECK_TIMEOUT: float = 2
+    # Compress text and JSON responses of COMPRESSION_MIN_SIZE bytes or more with
+    # zstd, brotli or gzip. Chunks of COMPRESSION_THREADPOOL_SIZE bytes or more
+    # are compressed in the threadpool.
+    COMPRESSION: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_THREADPOOL_SIZE: int = 65536
+    # Record HTTP and SQL metrics and serve all the metrics at /metrics
+    METRICS: bool = True
+    # Profile a PROFILING_SAMPLE_RATE fraction of the requests, and the ones with
+    # an `X-Profile` header if PROFILING_ON_DEMAND. Their responses get a
+    # Server-Timing header and statements run PROFILING_REPEATED_STATEMENTS
+    # times or more in one of them are logged as N+1 queries.
+    PROFILING_SAMPLE_RATE: float = 0
+    PROFILING_ON_DEMAND: bool = False
+    PROFILING_REPEATED_STATEMENTS: int = 5
 
     POSTGRES_SERVER: str
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
     DATABASE_URI: PostgresDsn | None = None
+    # Use the asyncpg engine and AsyncSession instead of the sync engine
+    DATABASE_ASYNC: bool = False
+    # Connections kept open per worker, extra ones opened under load and seconds
+    # a checkout waits for a connection before failing
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    # Connections older than DB_POOL_RECYCLE seconds are replaced, -1 keeps them
+    DB_POOL_RECYCLE: int = 1800
+    # Test connections with a round trip on every checkout
+    DB_POOL_PRE_PING: bool = False
+    # Open DB_POOL_SIZE connections at startup
+    DB_POOL_WARM: bool = True
+    # Read replicas serving GET, HEAD and OPTIONS requests. Clients that wrote in
+    # the last DATABASE_REPLICA_STICKY_SECONDS keep reading from the primary, and
+    # a replica that fails is skipped for DATABASE_REPLICA_DOWN_SECONDS.
+    DATABASE_REPLICA_URIS: list[PostgresDsn] = []
+    DATABASE_REPLICA_STICKY_SECONDS: int = 5
+    DATABASE_REPLICA_DOWN_SECONDS: float = 10
+    # Seconds a migration waits for a table lock before failing, 0 waits forever.
+    # Statements queued behind the lock would wait as long.
+    MIGRATIONS_LOCK_TIMEOUT: float = 5
 
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    # Refresh tokens mint new access tokens without the password, each one is
+    # valid once and for REFRESH_TOKEN_EXPIRE_DAYS days
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    # Resolved users are cached by id for USER_CACHE_TTL seconds, 0 disables it
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_TTL: int = 60
+    # Build the user from the JWT claims without a database lookup. Deleted users
+    # keep access until their token expires.
+    AUTH_TRUST_JWT_CLAIMS: bool = False
+    # bcrypt cost factor, hashes with another cost are rehashed on login
+    BCRYPT_ROUNDS: int = 12
+    # Processes running bcrypt, 0 runs it in the threadpool shared with the handlers
+    PASSWORD_HASH_WORKERS: int = 2
+    # Passwords hashed or verified at the same time. Further requests wait up to
+    # PASSWORD_HASH_QUEUE_TIMEOUT seconds for a slot, then get a 503.
+    PASSWORD_HASH_CONCURRENCY: int = 2
+    PASSWORD_HASH_QUEUE_TIMEOUT: float = 5
+
+    # Largest offset accepted by the records list, deeper pages must use the cursor
+    RECORDS_MAX_SKIP: int = 10000
+    # Largest page of the records list and search
+    RECORDS_MAX_LIMIT: int = 1000
+    # Rows fetched at a time from the server-side cursor of the records export
+    RECORDS_EXPORT_BATCH_SIZE: int = 1000
+    # Rows per INSERT statement and maximum number of items of a bulk creation
+    RECORDS_BULK_BATCH_SIZE: int = 1000
+    RECORDS_BULK_MAX_ITEMS: int = 100000
+    # Exact counts of the records list `count=cached` mode are reused for
+    # RECORDS_COUNT_CACHE_TTL seconds, and estimates for RECORDS_COUNT_ESTIMATE_TTL
+    # seconds, by set of filters
+    RECORDS_COUNT_CACHE_SIZE: int = 1024
+    RECORDS_COUNT_CACHE_TTL: int = 300
+    RECORDS_COUNT_ESTIMATE_TTL: int = 5
+    # Records read by id are cached for RECORD_CACHE_TTL seconds, 0 size disables
+    # it. A `local` cache lives in each worker, so other workers can serve a stale
+    # record and ETag until the TTL expires, it only fits a single worker. A
+    # `shared` cache is kept in the Redis server of RECORD_CACHE_URL, seen by all
+    # the workers, answering within RECORD_CACHE_TIMEOUT seconds.
+    RECORD_CACHE_BACKEND: Literal["local", "shared"] = "local"
+    RECORD_CACHE_SIZE: int = 0
+    RECORD_CACHE_TTL: int = 30
+    RECORD_CACHE_URL: str | None = None
+    RECORD_CACHE_TIMEOUT: float = 0.25
+
+    # Adaptive concurrency limits of the auth, records and records export routes.
+    # Limits move between 1 and the max concurrency, shrinking when responses
+    # start later than the target latency (seconds). Requests over the limit are
+    # queued up to ADMISSION_QUEUE_TIMEOUT seconds, then get a 503. Exports keep
+    # their slot while streaming, so they have their own group.
+    ADMISSION_CONTROL: bool = True
+    ADMISSION_QUEUE_TIMEOUT: float = 1
+    ADMISSION_AUTH_MAX_CONCURRENCY: int = 16
+    ADMISSION_AUTH_TARGET_LATENCY: float = 1
+    ADMISSION_RECORDS_MAX_CONCURRENCY: int = 128
+    ADMISSION_RECORDS_TARGET_LATENCY: float = 0.25
+    ADMISSION_EXPORT_MAX_CONCURRENCY: int = 8
+    ADMISSION_EXPORT_TARGET_LATENCY: float = 1
 
     class Config:
         case_sensitive = True
         env_file = ".env"
 
-    @validator("BACKEND_CORS_ORIGINS", pre=True)
+        @classmethod
+        def parse_env_var(cls, field_name: str, raw_val: str) -> Any:
+            # Lists may be comma separated instead of JSON, see the validators
+            if field_name in (
+                "BACKEND_CORS_ORIGINS",
+                "DATABASE_REPLICA_URIS",
+            ) and not raw_val.startswith("["):
+                return raw_val
+            return cls.json_loads(raw_val)
+
+    @validator("BACKEND_CORS_ORIGINS", "DATABASE_REPLICA_URIS", pre=True)
     def assemble_cors_origins(cls, value: str | list[str]) -> list[str] | str:
         if isinstance(value, str) and not value.startswith("["):
             return [i.strip() for i in value.split(",")]
@@ -0,0 +1,55 @@
+"""Module to add all crud operations
+
+Every function receives a sync Session as first argument so it can run either
+in the threadpool or through `AsyncSession.run_sync`, see `app.database.run_db`.
+"""
+
+from .user import read_user, read_user_by_email, create_user, update_user_password
+from .refresh_token import (
+    hash_refresh_token,
+    create_refresh_token,
+    rotate_refresh_token,
+)
+from .record import (
+    SORT_KEYS,
+    LIST_SORTS,
+    list_sort_supported,
+    read_record,
+    read_records,
+    count_records,
+    estimate_count_records,
+    search_records,
+    record_exists,
+    create_record,
+    create_records,
+    update_record,
+    delete_record,
+    update_records,
+    delete_records,
+)
+
+
+__all__ = [
+    "read_user",
+    "read_user_by_email",
+    "create_user",
+    "update_user_password",
+    "hash_refresh_token",
+    "create_refresh_token",
+    "rotate_refresh_token",
+    "SORT_KEYS",
+    "LIST_SORTS",
+    "list_sort_supported",
+    "read_record",
+    "read_records",
+    "count_records",
+    "estimate_count_records",
+    "search_records",
+    "record_exists",
+    "create_record",
+    "create_records",
+    "update_record",
+    "delete_record",
+    "update_records",
+    "delete_records",
+]
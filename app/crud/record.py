@@ -0,0 +1,477 @@
+"""Module to add record crud operations
+"""
+
+import json
+from typing import Any
+
+from sqlalchemy import (
+    ColumnElement,
+    Double,
+    Row,
+    and_,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import websearch_to_tsquery
+from sqlalchemy.orm import Session
+
+from app import models
+from app import schemas
+from app.database import Explain
+from app.models.record import IMG_C, IMG_HOST, SEARCH_CONFIG, TITLE_C
+
+
+# Read only queries select plain rows, skipping ORM identity map bookkeeping
+RECORD_COLUMNS = (
+    models.Record.id,
+    models.Record.title,
+    models.Record.img,
+    models.Record.version,
+)
+
+
+def read_record(db: Session, record_id: int) -> Row | None:
+    """Get record by id.
+
+    Args:
+        db (Session): The databse session.
+        record_id (int): The record's id.
+
+    Returns:
+        Row | None: The record row if exists otherwise None.
+    """
+
+    statement = select(*RECORD_COLUMNS).where(models.Record.id == record_id)
+
+    return db.execute(statement).first()
+
+
+# Sort keys of the records list, in the order of their index columns
+SORT_KEYS = {"id": ("id",), "title": ("title", "id")}
+SORT_COLUMNS = {"id": models.Record.id, "title": TITLE_C}
+
+# Sorts allowed by each set of filters, id_gte/id_lte count as "id". Each
+# combination is served by an index: the primary key, `ix_records_title_c_id`,
+# `ix_records_img_c` or `ix_records_img_host_id`. Any other combination could
+# only be served by a full scan, so it is not supported.
+LIST_SORTS: dict[frozenset[str], set[str]] = {
+    frozenset(): {"id", "title"},
+    frozenset({"id"}): {"id"},
+    frozenset({"title"}): {"id", "title"},
+    frozenset({"title", "id"}): {"id", "title"},
+    frozenset({"title_prefix"}): {"id", "title"},
+    frozenset({"img_host"}): {"id"},
+    frozenset({"img_host", "id"}): {"id"},
+    frozenset({"img_prefix"}): {"id"},
+}
+
+
+def like_prefix(prefix: str) -> str:
+    """Get a LIKE pattern matching the values starting with prefix."""
+
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%"
+
+
+def filter_clauses(filters: schemas.RecordFilters) -> list[ColumnElement]:
+    """Get the WHERE clauses of the records list filters.
+
+    Args:
+        filters (schemas.RecordFilters): The filters.
+
+    Returns:
+        list[ColumnElement]: The clauses.
+    """
+
+    clauses = []
+    if filters.title is not None:
+        clauses.append(TITLE_C == filters.title)
+    if filters.title_prefix is not None:
+        clauses.append(TITLE_C.like(like_prefix(filters.title_prefix)))
+    if filters.img_host is not None:
+        clauses.append(IMG_HOST == filters.img_host.lower())
+    if filters.img_prefix is not None:
+        clauses.append(IMG_C.like(like_prefix(filters.img_prefix)))
+    if filters.id_gte is not None:
+        clauses.append(models.Record.id >= filters.id_gte)
+    if filters.id_lte is not None:
+        clauses.append(models.Record.id <= filters.id_lte)
+
+    return clauses
+
+
+def list_sort_supported(filters: schemas.RecordFilters, sort: str) -> bool:
+    """Check if an index can serve the records list with these filters and sort.
+
+    Args:
+        filters (schemas.RecordFilters): The filters.
+        sort (str): The sort key, `-` prefixed when descending.
+
+    Returns:
+        bool: Whether the combination is supported.
+    """
+
+    names = {
+        "id" if name in ("id_gte", "id_lte") else name
+        for name, value in filters.dict().items()
+        if value is not None
+    }
+
+    return sort.lstrip("-") in LIST_SORTS.get(frozenset(names), ())
+
+
+def read_records(
+    db: Session,
+    limit: int,
+    skip: int = 0,
+    filters: schemas.RecordFilters | None = None,
+    sort: str = "id",
+    after: tuple[Any, ...] | None = None,
+) -> list[Row]:
+    """Get a page of records.
+
+    Titles are sorted byte-wise, ties are sorted by id.
+
+    Args:
+        db (Session): The databse session.
+        limit (int): The number of records we want to retrieve from the db.
+        skip (int, optional): The offset where we want to start searching in the db. Defaults to 0.
+        filters (schemas.RecordFilters | None, optional): The filters. Defaults to None.
+        sort (str, optional): The sort key, `-` prefixed when descending. Defaults to "id".
+        after (tuple[Any, ...] | None, optional): Only get records sorted after these
+        values of the sort keys (see `SORT_KEYS`). Defaults to None.
+
+    Returns:
+        list[Row]: The record rows.
+    """
+
+    descending = sort.startswith("-")
+    columns = [SORT_COLUMNS[key] for key in SORT_KEYS[sort.lstrip("-")]]
+
+    statement = select(*RECORD_COLUMNS).order_by(
+        *(column.desc() if descending else column for column in columns)
+    )
+
+    if filters is not None:
+        statement = statement.where(*filter_clauses(filters))
+    if after is not None:
+        keys, values = tuple_(*columns), tuple_(*after)
+        statement = statement.where(keys < values if descending else keys > values)
+    if skip:
+        statement = statement.offset(skip)
+
+    return db.execute(statement.limit(limit)).all()
+
+
+def count_records(db: Session, filters: schemas.RecordFilters | None = None) -> int:
+    """Count the records matching the filters with COUNT(*).
+
+    Args:
+        db (Session): The databse session.
+        filters (schemas.RecordFilters | None, optional): The filters. Defaults to None.
+
+    Returns:
+        int: The number of records.
+    """
+
+    statement = select(func.count()).select_from(models.Record)
+    if filters is not None:
+        statement = statement.where(*filter_clauses(filters))
+
+    return db.scalar(statement)
+
+
+def estimate_count_records(
+    db: Session, filters: schemas.RecordFilters | None = None
+) -> int | None:
+    """Estimate the number of records matching the filters without scanning them.
+
+    Unfiltered counts come from the table statistics in `pg_class.reltuples`,
+    filtered ones from the row estimate of the planner. Both are made up until
+    the table is first analyzed, there is no estimate until then.
+
+    Args:
+        db (Session): The databse session.
+        filters (schemas.RecordFilters | None, optional): The filters. Defaults to None.
+
+    Returns:
+        int | None: The estimated number of records, None if the table has no
+        statistics.
+    """
+
+    statement = text(
+        "SELECT reltuples FROM pg_class WHERE oid = CAST(:table AS regclass)"
+    )
+    reltuples = db.scalar(statement, {"table": models.Record.__tablename__})
+    # It is -1 (0 before Postgres 14) until the table is first analyzed. Empty
+    # tables have no estimate either, counting them is cheap.
+    if reltuples is None or reltuples <= 0:
+        return None
+
+    clauses = filter_clauses(filters) if filters is not None else []
+    if not clauses:
+        return int(reltuples)
+
+    statement = select(literal(1)).select_from(models.Record).where(*clauses)
+    plan = db.scalar(Explain(statement))
+    # asyncpg does not decode the json of the textual EXPLAIN output
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def search_records(
+    db: Session,
+    query: str,
+    limit: int,
+    after: tuple[float, int] | None = None,
+) -> list[Row]:
+    """Get a page of the records whose title matches a web search query.
+
+    Records are ranked by `ts_rank` and the id breaks ties, matches are found
+    with the GIN index on the title search vector.
+
+    Args:
+        db (Session): The databse session.
+        query (str): The query, with the syntax of `websearch_to_tsquery`.
+        limit (int): The number of records we want to retrieve from the db.
+        after (tuple[float, int] | None, optional): Only get records ranked after
+        this (rank, id). Defaults to None.
+
+    Returns:
+        list[Row]: The record rows, with their `rank`.
+    """
+
+    tsquery = websearch_to_tsquery(SEARCH_CONFIG, query)
+    # ts_rank is a real, read back as a rounded decimal that would not compare
+    # equal to itself in the cursor, a double round trips through the JSON
+    rank = func.ts_rank(models.Record.search_vector, tsquery).cast(Double)
+
+    statement = (
+        select(*RECORD_COLUMNS, rank.label("rank"))
+        .where(models.Record.search_vector.bool_op("@@")(tsquery))
+        .order_by(rank.desc(), models.Record.id)
+    )
+
+    if after is not None:
+        after_rank, after_id = after
+        statement = statement.where(
+            or_(
+                rank < after_rank,
+                and_(rank == after_rank, models.Record.id > after_id),
+            )
+        )
+
+    return db.execute(statement.limit(limit)).all()
+
+
+def create_record(db: Session, data: dict[str, Any]) -> Row:
+    """Create a record with a single `INSERT ... RETURNING` statement.
+
+    Args:
+        db (Session): The databse session.
+        data (dict[str, Any]): The record fields.
+
+    Returns:
+        Row: The new record row.
+    """
+
+    statement = insert(models.Record).values(**data).returning(*RECORD_COLUMNS)
+
+    row = db.execute(statement).one()
+    db.commit()
+
+    return row
+
+
+def create_records(
+    db: Session, rows: list[dict[str, Any]], batch_size: int
+) -> list[int]:
+    """Create many records in a single transaction.
+
+    Rows are sent as multi-row `INSERT ... VALUES ... RETURNING id` statements
+    of batch_size rows each.
+
+    Args:
+        db (Session): The databse session.
+        rows (list[dict[str, Any]]): The fields of each record.
+        batch_size (int): Number of rows per INSERT statement.
+
+    Returns:
+        list[int]: The ids of the new records, in the same order as rows.
+    """
+
+    if not rows:
+        return []
+
+    statement = (
+        insert(models.Record)
+        .returning(models.Record.id, sort_by_parameter_order=True)
+        .execution_options(insertmanyvalues_page_size=batch_size)
+    )
+    ids = db.scalars(statement, rows).all()
+    db.commit()
+
+    return list(ids)
+
+
+def record_exists(db: Session, record_id: int) -> bool:
+    """Check if a record exists.
+
+    Args:
+        db (Session): The databse session.
+        record_id (int): The record's id.
+
+    Returns:
+        bool: Whether the record exists.
+    """
+
+    statement = select(exists().where(models.Record.id == record_id))
+
+    return db.scalar(statement)
+
+
+def update_record(
+    db: Session,
+    record_id: int,
+    data: dict[str, Any],
+    versions: list[int] | None = None,
+) -> Row | None:
+    """Update a record with a single conditional UPDATE statement.
+
+    Args:
+        db (Session): The databse session.
+        record_id (int): The record's id.
+        data (dict[str, Any]): The fields to update.
+        versions (list[int] | None, optional): Only update the record if its
+        version is one of these. Defaults to None, any version.
+
+    Returns:
+        Row | None: The updated record row, None if the record does not exist
+        or its version does not match.
+    """
+
+    statement = (
+        update(models.Record)
+        .where(models.Record.id == record_id)
+        .values(**data, version=models.Record.version + 1)
+        .returning(*RECORD_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    if versions is not None:
+        statement = statement.where(models.Record.version.in_(versions))
+
+    row = db.execute(statement).first()
+    db.commit()
+
+    return row
+
+
+def delete_record(
+    db: Session, record_id: int, versions: list[int] | None = None
+) -> bool:
+    """Delete a record with a single conditional DELETE statement.
+
+    Args:
+        db (Session): The databse session.
+        record_id (int): The record's id.
+        versions (list[int] | None, optional): Only delete the record if its
+        version is one of these. Defaults to None, any version.
+
+    Returns:
+        bool: Whether the record was deleted.
+    """
+
+    statement = (
+        delete(models.Record)
+        .where(models.Record.id == record_id)
+        .returning(models.Record.id)
+        .execution_options(synchronize_session=False)
+    )
+    if versions is not None:
+        statement = statement.where(models.Record.version.in_(versions))
+
+    deleted = db.execute(statement).first() is not None
+    db.commit()
+
+    return deleted
+
+
+def selection_clauses(selection: schemas.RecordSelection) -> list[ColumnElement]:
+    """Build the WHERE clauses of a selection of records.
+
+    Args:
+        selection (schemas.RecordSelection): The ids, title and/or img.
+
+    Returns:
+        list[ColumnElement]: The clauses, to be combined with AND.
+    """
+
+    clauses = []
+    if selection.ids is not None:
+        clauses.append(models.Record.id.in_(selection.ids))
+    if selection.title is not None:
+        clauses.append(models.Record.title == selection.title)
+    if selection.img is not None:
+        clauses.append(models.Record.img == selection.img)
+
+    return clauses
+
+
+def update_records(
+    db: Session, selection: schemas.RecordSelection, data: dict[str, Any]
+) -> list[int]:
+    """Update the selected records with a single UPDATE statement.
+
+    Args:
+        db (Session): The databse session.
+        selection (schemas.RecordSelection): The records to update.
+        data (dict[str, Any]): The fields to update.
+
+    Returns:
+        list[int]: The ids of the updated records.
+    """
+
+    statement = (
+        update(models.Record)
+        .where(*selection_clauses(selection))
+        .values(**data, version=models.Record.version + 1)
+        .returning(models.Record.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = db.scalars(statement).all()
+    db.commit()
+
+    return list(ids)
+
+
+def delete_records(db: Session, selection: schemas.RecordSelection) -> list[int]:
+    """Delete the selected records with a single DELETE statement.
+
+    Args:
+        db (Session): The databse session.
+        selection (schemas.RecordSelection): The records to delete.
+
+    Returns:
+        list[int]: The ids of the deleted records.
+    """
+
+    statement = (
+        delete(models.Record)
+        .where(*selection_clauses(selection))
+        .returning(models.Record.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = db.scalars(statement).all()
+    db.commit()
+
+    return list(ids)
@@ -0,0 +1,111 @@
+"""Module to add refresh token crud operations
+"""
+
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+
+
+def hash_refresh_token(token: str) -> str:
+    """Hash a refresh token to store or look it up.
+
+    Tokens are random and long, so a fast hash is enough to keep the stored
+    value useless to whoever reads the table.
+
+    Args:
+        token (str): The refresh token.
+
+    Returns:
+        str: The hex sha256 of the token.
+    """
+
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_refresh_token(db: Session, user_id: int, family: str | None = None) -> str:
+    """Create a refresh token.
+
+    Args:
+        db (Session): The databse session.
+        user_id (int): The user's id.
+        family (str | None, optional): Family of the rotated token. Defaults to
+        None, a new family.
+
+    Returns:
+        str: The refresh token, only its hash is stored.
+    """
+
+    token = secrets.token_urlsafe(32)
+    db.add(
+        models.RefreshToken(
+            user_id=user_id,
+            token_hash=hash_refresh_token(token),
+            family=family or secrets.token_hex(16),
+            expires_at=datetime.utcnow()
+            + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+    )
+    db.commit()
+
+    return token
+
+
+def rotate_refresh_token(db: Session, token: str) -> tuple[models.User, str] | None:
+    """Revoke a refresh token and create the next one of its family.
+
+    The token is revoked with a single conditional UPDATE, so it is only
+    rotated once even by concurrent requests. A token that was already rotated
+    is a replay, the whole family is revoked.
+
+    Args:
+        db (Session): The databse session.
+        token (str): The refresh token.
+
+    Returns:
+        tuple[models.User, str] | None: The user and the new refresh token if
+        the token was valid otherwise None.
+    """
+
+    now = datetime.utcnow()
+    token_hash = hash_refresh_token(token)
+
+    rotated = db.execute(
+        update(models.RefreshToken)
+        .where(
+            models.RefreshToken.token_hash == token_hash,
+            models.RefreshToken.revoked_at.is_(None),
+            models.RefreshToken.expires_at > now,
+        )
+        .values(revoked_at=now)
+        .returning(models.RefreshToken.user_id, models.RefreshToken.family)
+    ).first()
+
+    if rotated is None:
+        replayed_family = (
+            select(models.RefreshToken.family)
+            .where(
+                models.RefreshToken.token_hash == token_hash,
+                models.RefreshToken.revoked_at.is_not(None),
+            )
+            .scalar_subquery()
+        )
+        db.execute(
+            update(models.RefreshToken)
+            .where(
+                models.RefreshToken.family == replayed_family,
+                models.RefreshToken.revoked_at.is_(None),
+            )
+            .values(revoked_at=now)
+        )
+        db.commit()
+        return None
+
+    db_user = db.get(models.User, rotated.user_id)
+
+    return db_user, create_refresh_token(db, rotated.user_id, rotated.family)
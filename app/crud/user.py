@@ -0,0 +1,73 @@
+"""Module to add user crud operations
+"""
+
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+def read_user(db: Session, user_id: int) -> models.User | None:
+    """Get user by id.
+
+    Args:
+        db (Session): The databse session.
+        user_id (int): The user's id.
+
+    Returns:
+        models.User | None: The user if exists otherwise None.
+    """
+
+    return db.query(models.User).get(user_id)
+
+
+def read_user_by_email(db: Session, email: str) -> models.User | None:
+    """Get user by email.
+
+    Args:
+        db (Session): The databse session.
+        email (str): The user's email.
+
+    Returns:
+        models.User | None: The user if exists otherwise None.
+    """
+
+    return db.query(models.User).filter(models.User.email == email).first()
+
+
+def create_user(db: Session, email: str, hashed_password: str) -> models.User:
+    """Create a user.
+
+    Args:
+        db (Session): The databse session.
+        email (str): The user's email.
+        hashed_password (str): The already hashed password.
+
+    Returns:
+        models.User: The new user.
+    """
+
+    db_user = models.User(email=email, hashed_password=hashed_password)
+    db.add(db_user)
+    db.commit()
+
+    return db_user
+
+
+def update_user_password(
+    db: Session, db_user: models.User, hashed_password: str
+) -> models.User:
+    """Replace the password hash of a user.
+
+    Args:
+        db (Session): The databse session.
+        db_user (models.User): The user, loaded in this session.
+        hashed_password (str): The new hash.
+
+    Returns:
+        models.User: The updated user.
+    """
+
+    db_user.hashed_password = hashed_password
+    db.commit()
+
+    return db_user
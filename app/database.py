@@ -1,17 +1,563 @@
 """Module to define all database releated stuff.
 """
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+import math
+import threading
+import time
+from contextlib import AsyncExitStack, ExitStack
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Sequence, TypeVar
+
+from prometheus_client import Gauge
+
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from sqlalchemy import (
+    ClauseElement,
+    Engine,
+    Executable,
+    Row,
+    create_engine,
+    event,
+    exc,
+)
+from sqlalchemy.engine import ExceptionContext, make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from app.config import settings
+from app.profiling import PROFILING, profile_statements
+from app.metrics import (
+    DB_POOL_CHECKED_IN,
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_CHECKOUT_SECONDS,
+    DB_POOL_OVERFLOW,
+    DB_POOL_TIMEOUTS,
+    SQL_STATEMENT_SECONDS,
+)
+
+
+T = TypeVar("T")
+
+DBSession = Session | AsyncSession
+
+
+@lru_cache
+def pool_gauges(label: str) -> tuple[Gauge, Gauge, Gauge]:
+    """Get the checked out, checked in and overflow gauges of an engine label."""
+
+    return (
+        DB_POOL_CHECKED_OUT.labels(engine=label),
+        DB_POOL_CHECKED_IN.labels(engine=label),
+        DB_POOL_OVERFLOW.labels(engine=label),
+    )
+
+
+class _PoolMetricsMixin:
+    """Record how long checkouts wait for a connection of a queue pool, and
+    report the state of the pool in the pool gauges.
+
+    The gauges are set whenever a connection is checked out or returned, not
+    read from the pool at collection: with `PROMETHEUS_MULTIPROC_DIR` only the
+    values written by the workers are collected.
+    """
+
+    metric_label = "sync"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._gauges_lock = threading.Lock()
+
+    def report(self) -> None:
+        """Set the pool gauges to the current state of the pool."""
+
+        checked_out, checked_in, overflow = pool_gauges(self.metric_label)
+        # Held while reading the pool, so the last value set is the newest one
+        with self._gauges_lock:
+            checked_out.set(self.checkedout())
+            checked_in.set(self.checkedin())
+            # QueuePool counts the free slots below the pool size as negative overflow
+            overflow.set(max(0, self.overflow()))
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.labels(engine=self.metric_label).inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(engine=self.metric_label).observe(
+                time.perf_counter() - start
+            )
+            self.report()
+
+    def _do_return_conn(self, record):
+        try:
+            super()._do_return_conn(record)
+        finally:
+            self.report()
+
+    def dispose(self):
+        super().dispose()
+        self.report()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metric_label = self.metric_label
+        pool.report()
+        return pool
+
+
+class TimedQueuePool(_PoolMetricsMixin, QueuePool):
+    """QueuePool of the sync engine, with checkout and state metrics."""
+
+
+class TimedAsyncAdaptedQueuePool(_PoolMetricsMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool of the async engine, with checkout and state metrics."""
+
+    metric_label = "async"
+
+
+# Operation label values of the SQL metrics, other statements are counted as OTHER
+SQL_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE", "OTHER")
+
+
+def track_statements(db_engine: Engine, label: str) -> None:
+    """Time the statements executed by an engine in the SQL metrics.
+
+    Args:
+        db_engine (Engine): The engine, the sync one of an AsyncEngine.
+        label (str): Engine label of the metrics.
+    """
+
+    histograms = {
+        operation: SQL_STATEMENT_SECONDS.labels(engine=label, operation=operation)
+        for operation in SQL_OPERATIONS
+    }
+    other = histograms["OTHER"]
+
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def _observe_statement(conn, cursor, statement, parameters, context, executemany):
+        histogram = histograms.get(statement[:6].upper(), other)
+        histogram.observe(time.perf_counter() - context._metrics_start)
+
+
+def async_database_url(url: str) -> str:
+    """Get the asyncpg URL of a database URL.
 
+    Args:
+        url (str): The database URL.
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_SERVER}/{settings.POSTGRES_DB}"
+    Returns:
+        str: The same URL with the asyncpg driver.
+    """
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    return (
+        make_url(url)
+        .set(drivername="postgresql+asyncpg")
+        .render_as_string(hide_password=False)
+    )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+POOL_OPTIONS = {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+}
+
+
+def create_engines(url: str, label_prefix: str = "") -> tuple[Engine, AsyncEngine]:
+    """Create the sync and the async engine of a database, with tracked pools.
+
+    Args:
+        url (str): The database URL.
+        label_prefix (str, optional): Prefix of the `sync` and `async` engine
+        labels of the pool metrics. Defaults to "".
+
+    Returns:
+        tuple[Engine, AsyncEngine]: The engines.
+    """
+
+    sync_engine = create_engine(url, poolclass=TimedQueuePool, **POOL_OPTIONS)
+    async_engine = create_async_engine(
+        async_database_url(url), poolclass=TimedAsyncAdaptedQueuePool, **POOL_OPTIONS
+    )
+
+    sync_engine.pool.metric_label = f"{label_prefix}sync"
+    async_engine.sync_engine.pool.metric_label = f"{label_prefix}async"
+    if settings.METRICS:
+        track_statements(sync_engine, f"{label_prefix}sync")
+        track_statements(async_engine.sync_engine, f"{label_prefix}async")
+    if PROFILING:
+        profile_statements(sync_engine)
+        profile_statements(async_engine.sync_engine)
+
+    return sync_engine, async_engine
+
+
+class Replica:
+    """Read replica of the database.
+
+    A replica that fails to connect or drops its connections is marked down
+    for `down_seconds`, reads go to the primary meanwhile.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        down_seconds: float,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Args:
+            name (str): Name of the replica, prefix of its pool metrics labels.
+            url (str): The database URL.
+            down_seconds (float): Seconds a failed replica is skipped.
+            timer (Callable[[], float], optional): Clock. Defaults to time.monotonic.
+        """
+
+        self.name = name
+        self.down_seconds = down_seconds
+        self.engine, self.async_engine = create_engines(url, f"{name}-")
+        self._timer = timer
+        self._down_until = -math.inf
+
+        event.listen(self.engine, "handle_error", self._handle_error)
+        event.listen(self.async_engine.sync_engine, "handle_error", self._handle_error)
+
+    @property
+    def available(self) -> bool:
+        """Whether the replica is not marked down."""
+
+        return self._timer() >= self._down_until
+
+    def mark_down(self) -> None:
+        """Skip the replica for `down_seconds`."""
+
+        self._down_until = self._timer() + self.down_seconds
+        logging.warning("Marked database %s down" % self.name)
+
+    def _handle_error(self, context: ExceptionContext) -> None:
+        # Connection errors have no connection, dropped ones are disconnects
+        if context.connection is None or context.is_disconnect:
+            self.mark_down()
+
+
+class ReplicaSet:
+    """Round robin over the available read replicas."""
+
+    def __init__(self, replicas: list[Replica]) -> None:
+        self.replicas = replicas
+        self._next = 0
+
+    def pick(self) -> Replica | None:
+        """Get the next available replica.
+
+        Returns:
+            Replica | None: The replica, None if all of them are down or there
+            is none.
+        """
+
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next]
+            self._next = (self._next + 1) % len(self.replicas)
+            if replica.available:
+                return replica
+
+        return None
+
+
+SQLALCHEMY_DATABASE_URL = str(settings.DATABASE_URI)
+SQLALCHEMY_ASYNC_DATABASE_URL = async_database_url(SQLALCHEMY_DATABASE_URL)
+
+engine, async_engine = create_engines(SQLALCHEMY_DATABASE_URL)
+
+replicas = ReplicaSet(
+    [
+        Replica(f"replica-{i}", str(url), settings.DATABASE_REPLICA_DOWN_SECONDS)
+        for i, url in enumerate(settings.DATABASE_REPLICA_URIS)
+    ]
+)
+
+# Handlers are coroutines and FastAPI validates their response on the event loop,
+# so objects must stay loaded after commit instead of lazily refreshing there.
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=async_engine
+)
 
 Base = declarative_base()
+
+
+def replica_session_options(replica: Replica, use_async: bool) -> dict[str, Any]:
+    """Get the session factory arguments that bind a session to a replica.
+
+    Args:
+        replica (Replica): The replica.
+        use_async (bool): Whether the session is an AsyncSession.
+
+    Returns:
+        dict[str, Any]: The arguments.
+    """
+
+    return {
+        "bind": replica.async_engine if use_async else replica.engine,
+        "info": {"replica": replica},
+    }
+
+
+async def use_primary(db: DBSession) -> None:
+    """Rebind a replica session to the primary, dropping its transaction.
+
+    Args:
+        db (DBSession): The database session.
+    """
+
+    db.info.pop("replica", None)
+    if isinstance(db, AsyncSession):
+        await db.rollback()
+        db.bind = async_engine
+        db.sync_session.bind = async_engine.sync_engine
+    else:
+        await run_in_threadpool(db.rollback)
+        db.bind = engine
+
+
+async def _run_db(db: DBSession, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    if isinstance(db, scoped_session):
+        # The registry is thread-local, get the session of the calling thread
+        db = db()
+
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+async def run_db(db: DBSession, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a function that uses a sync session without blocking the event loop.
+
+    With an AsyncSession the function runs through `AsyncSession.run_sync`, so the
+    driver I/O is awaited. With a Session it runs in the threadpool. When the
+    session reads from a replica that went down the function runs again on the
+    primary, so it must only read.
+
+    Args:
+        db (DBSession): The database session.
+        fn (Callable[..., T]): Function that receives a Session as first argument.
+
+    Returns:
+        T: Whatever fn returns.
+    """
+
+    try:
+        return await _run_db(db, fn, *args, **kwargs)
+    except (exc.DBAPIError, OSError) as error:
+        replica = db.info.get("replica")
+        if replica is None:
+            raise
+        if isinstance(error, OSError):
+            # asyncpg connection errors are neither wrapped nor seen by handle_error
+            replica.mark_down()
+        elif replica.available:
+            raise
+
+    logging.warning("Database %s is down, reading from the primary" % replica.name)
+    await use_primary(db)
+
+    return await _run_db(db, fn, *args, **kwargs)
+
+
+async def warm_pool(db_engine: Engine | AsyncEngine, size: int) -> None:
+    """Open connections of an engine pool so the first requests do not pay for it.
+
+    The connections are all checked out at once, so the pool has to open a new
+    one for each, and then given back to it.
+
+    Args:
+        db_engine (Engine | AsyncEngine): The engine.
+        size (int): Number of connections to open, at most the pool size is kept.
+    """
+
+    if isinstance(db_engine, AsyncEngine):
+        async with AsyncExitStack() as stack:
+            for _ in range(size):
+                await stack.enter_async_context(db_engine.connect())
+    else:
+
+        def connect_all() -> None:
+            with ExitStack() as stack:
+                for _ in range(size):
+                    stack.enter_context(db_engine.connect())
+
+        await run_in_threadpool(connect_all)
+
+    logging.debug("Warmed the database pool with %d connections" % size)
+
+
+async def ping(db_engine: Engine | AsyncEngine) -> None:
+    """Make a round trip to the database on a connection of an engine pool.
+
+    Args:
+        db_engine (Engine | AsyncEngine): The engine.
+
+    Raises:
+        exc.SQLAlchemyError: No connection could be checked out or used.
+    """
+
+    if isinstance(db_engine, AsyncEngine):
+        async with db_engine.connect() as connection:
+            await connection.exec_driver_sql("SELECT 1")
+    else:
+
+        def round_trip() -> None:
+            with db_engine.connect() as connection:
+                connection.exec_driver_sql("SELECT 1")
+
+        await run_in_threadpool(round_trip)
+
+
+def _all_engines() -> list[tuple[Engine, AsyncEngine]]:
+    return [
+        (engine, async_engine),
+        *((replica.engine, replica.async_engine) for replica in replicas.replicas),
+    ]
+
+
+def forget_inherited_connections() -> None:
+    """Empty the pools of the engines in a forked process.
+
+    A forked process shares the sockets of its parent, both would use the same
+    connections. They are dropped without closing them, the parent still owns
+    them, and the child opens its own.
+    """
+
+    for sync_engine, db_async_engine in _all_engines():
+        sync_engine.dispose(close=False)
+        db_async_engine.sync_engine.dispose(close=False)
+
+
+async def close_engines() -> None:
+    """Close the pooled connections of all the engines."""
+
+    for sync_engine, db_async_engine in _all_engines():
+        await run_in_threadpool(sync_engine.dispose)
+        await db_async_engine.dispose()
+
+
+async def stream_db(
+    db: DBSession, statement: Executable, batch_size: int
+) -> AsyncIterator[Sequence[Row]]:
+    """Stream the rows of a statement in batches from a server-side cursor.
+
+    Only one batch is held in memory at a time, and the next one is fetched
+    when the consumer asks for it.
+
+    Args:
+        db (DBSession): The database session.
+        statement (Executable): The statement to execute.
+        batch_size (int): Number of rows fetched at a time.
+
+    Yields:
+        Sequence[Row]: Batches of at most batch_size rows.
+    """
+
+    statement = statement.execution_options(yield_per=batch_size)
+
+    if isinstance(db, AsyncSession):
+        result = await db.stream(statement)
+        try:
+            async for rows in result.partitions():
+                yield rows
+        finally:
+            await result.close()
+    else:
+        result = await run_in_threadpool(db.execute, statement)
+        try:
+            async for rows in iterate_in_threadpool(result.partitions()):
+                yield rows
+        finally:
+            await run_in_threadpool(result.close)
+
+
+class Explain(Executable, ClauseElement):
+    """`EXPLAIN (FORMAT JSON)` of a statement, to read the planner estimates
+    without running it."""
+
+    inherit_cache = False
+
+    def __init__(self, statement: Executable) -> None:
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler, **kwargs) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kwargs)
+
+
+class LazySession:
+    """Database session that is only created the first time it is used.
+
+    Requests that never reach the database (CORS preflights, 401s, invalid
+    tokens) do not create a session nor check out a connection.
+    """
+
+    def __init__(self, factory: Callable[[], DBSession]) -> None:
+        self._factory = factory
+        self._session: DBSession | None = None
+
+    @property
+    def opened(self) -> bool:
+        """Whether the session has been created."""
+
+        return self._session is not None
+
+    def get(self) -> DBSession:
+        """Get the session, creating it if needed.
+
+        Returns:
+            DBSession: The database session.
+        """
+
+        if self._session is None:
+            self._session = self._factory()
+
+        return self._session
+
+    async def close(self) -> None:
+        """Close the session if it was created."""
+
+        if self._session is not None:
+            await close_db(self._session)
+            self._session = None
+
+
+async def close_db(db: DBSession) -> None:
+    """Close a database session of either kind.
+
+    Args:
+        db (DBSession): The database session.
+    """
+
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        db.close()
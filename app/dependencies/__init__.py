@@ -3,7 +3,7 @@
 
 from .user import get_user
 from .database import get_db
-from .record import get_record
+from .record import get_record, record_cache
 from .auth import get_current_user, user_is_authenticated
 
 
@@ -11,6 +11,7 @@ __all__ = [
     "get_db",
     "get_user",
     "get_record",
+    "record_cache",
     "get_current_user",
     "user_is_authenticated",
 ]
@@ -2,17 +2,21 @@
 """
 
 from fastapi import Request
-from sqlalchemy.orm import Session
 
+from app.database import DBSession
 
-def get_db(request: Request) -> Session:
+
+def get_db(request: Request) -> DBSession:
     """Get database session from request state
 
+    The session is created on the first call, see LazySession.
+
     Args:
         request (Request): The request
 
     Returns:
-        Session: The database session
+        DBSession: The database session, a Session or an AsyncSession
+        depending on `settings.DATABASE_ASYNC`.
     """
 
-    return request.state.db
+    return request.state.db.get()
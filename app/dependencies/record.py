@@ -6,27 +6,49 @@ from typing import Annotated
 
 from fastapi import Depends
 
-from sqlalchemy.orm import Session
+from sqlalchemy import Row
 
-from app.models import Record
+from app import crud
+from app.cache import create_cache
+from app.config import settings
+from app.database import DBSession, run_db
 
 from .database import get_db
 
 
-def get_record(
-    record_id: int, db: Annotated[Session, Depends(get_db)]
-) -> Record | None:
-    """Get record from database
+# Read-through cache of the record rows by id, the record endpoints update or
+# invalidate it on writes
+record_cache = create_cache(
+    "record",
+    settings.RECORD_CACHE_BACKEND,
+    maxsize=settings.RECORD_CACHE_SIZE,
+    ttl=settings.RECORD_CACHE_TTL,
+    url=settings.RECORD_CACHE_URL,
+    timeout=settings.RECORD_CACHE_TIMEOUT,
+)
+
+
+async def get_record(
+    record_id: int, db: Annotated[DBSession, Depends(get_db)]
+) -> Row | None:
+    """Get record from the cache, or from database on a miss
 
     Args:
         record_id (int): The record's id
-        db (Session): The databse session.
+        db (DBSession): The databse session.
 
     Returns:
-        Record | None: The record if exists otherwise None.
+        Row | None: The record row (id, title, img, version) if exists otherwise None.
     """
 
+    record = await record_cache.aget(record_id)
+    if record is not None:
+        return record
+
     logging.debug("Getting record with id %d from database" % record_id)
-    record = db.query(Record).get(record_id)
+    record = await run_db(db, crud.read_record, record_id)
+
+    if record is not None:
+        await record_cache.aset(record_id, record)
 
     return record
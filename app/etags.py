@@ -0,0 +1,112 @@
+"""Module to add ETag helpers for conditional requests.
+
+ETags are weak validators built from the record `version` column, which is
+incremented by every update.
+"""
+
+import hashlib
+from typing import Iterable
+
+from sqlalchemy import Row
+
+
+def record_etag(record_id: int, version: int) -> str:
+    """Get the ETag of a record.
+
+    Args:
+        record_id (int): The record's id.
+        version (int): The record's version.
+
+    Returns:
+        str: The ETag.
+    """
+
+    return f'W/"{record_id}-{version}"'
+
+
+def records_etag(rows: Iterable[Row]) -> str:
+    """Get the ETag of a list of records, it changes if any record changes.
+
+    Args:
+        rows (Iterable[Row]): Rows with the id and version of the records.
+
+    Returns:
+        str: The ETag.
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(b"%d-%d," % (row.id, row.version))
+
+    return f'W/"{digest.hexdigest()}"'
+
+
+def parse_etags(header: str) -> list[str]:
+    """Get the opaque tags of an If-Match/If-None-Match header, without W/.
+
+    Args:
+        header (str): The header value.
+
+    Returns:
+        list[str]: The tags, `*` is returned as is.
+    """
+
+    tags = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag:
+            tags.append(tag.strip('"'))
+
+    return tags
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header with an ETag.
+
+    Args:
+        header (str | None): The If-None-Match header value.
+        etag (str): The current ETag.
+
+    Returns:
+        bool: Whether the header matches, so the client copy is fresh.
+    """
+
+    if not header:
+        return False
+
+    tags = parse_etags(header)
+
+    return "*" in tags or parse_etags(etag)[0] in tags
+
+
+def if_match_versions(header: str | None, record_id: int) -> list[int] | None:
+    """Get the record versions accepted by an If-Match header.
+
+    If-Match compares the record version, so the weak ETags of this API are
+    accepted.
+
+    Args:
+        header (str | None): The If-Match header value.
+        record_id (int): The record's id.
+
+    Returns:
+        list[int] | None: None if any version is accepted (no header or `*`),
+        otherwise the accepted versions, empty if no tag belongs to the record.
+    """
+
+    if not header:
+        return None
+
+    tags = parse_etags(header)
+    if "*" in tags:
+        return None
+
+    versions = []
+    for tag in tags:
+        tag_id, _, version = tag.partition("-")
+        if tag_id == str(record_id) and version.isdigit():
+            versions.append(int(version))
+
+    return versions
@@ -5,11 +5,21 @@ import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.middlewares import AuthMiddleware, DatabaseSessionMiddleware
+from app.middlewares import (
+    AdmissionControlMiddleware,
+    AuthMiddleware,
+    CompressionMiddleware,
+    DatabaseSessionMiddleware,
+    MetricsMiddleware,
+    ProfilingMiddleware,
+)
+from app.middlewares.admission import default_groups
 
 from app.config import settings
-from app.routers import api_router
-from app.database import Base, engine
+from app.routers import api_router, health_router, metrics_router
+from app.database import async_engine, close_engines, engine, warm_pool
+from app.profiling import PROFILING
+from app.security import password_hasher
 
 
 app = FastAPI(title=settings.PROJECT_NAME)
@@ -19,22 +29,57 @@ app = FastAPI(title=settings.PROJECT_NAME)
 # RequestData needs to be initialized before everything else.
 app.add_middleware(AuthMiddleware)
 app.add_middleware(DatabaseSessionMiddleware)
+# Around the auth middleware, so the user lookup is profiled too
+if PROFILING:
+    app.add_middleware(ProfilingMiddleware)
+# Shed load before authenticating or opening a database session
+if settings.ADMISSION_CONTROL:
+    app.add_middleware(AdmissionControlMiddleware, groups=default_groups())
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[str(origin) for origin in settings.BACKEND_CORS_ORIGINS],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag",
+        "Link",
+        "Server-Timing",
+        "X-Total-Count",
+        "X-Total-Count-Mode",
+    ],
 )
+# Outside admission control, compressing does not count as route latency
+if settings.COMPRESSION:
+    app.add_middleware(
+        CompressionMiddleware,
+        min_size=settings.COMPRESSION_MIN_SIZE,
+        threadpool_size=settings.COMPRESSION_THREADPOOL_SIZE,
+    )
+# Outermost, so shed and rejected requests are measured too
+if settings.METRICS:
+    app.add_middleware(MetricsMiddleware)
 
 
 app.include_router(api_router)
+app.include_router(health_router)
+if settings.METRICS:
+    app.include_router(metrics_router)
 
 
 @app.on_event("startup")
-def startup_event():
-    # Create all tables defined in the database models
-    Base.metadata.create_all(bind=engine)
+async def startup_event():
+    # The schema is migrated beforehand by `python -m app.migrate upgrade head`
+    if settings.DB_POOL_WARM:
+        db_engine = async_engine if settings.DATABASE_ASYNC else engine
+        await warm_pool(db_engine, settings.DB_POOL_SIZE)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    password_hasher.shutdown()
+    # The server already finished the requests in flight
+    await close_engines()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+"""Module to define all app metrics.
+
+Metrics are process-local Prometheus collectors, cheap enough to be updated
+on every request.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "Time to answer an HTTP request, until the whole body is sent, by method and route.",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests being handled by a route, by method and route.",
+    ["method", "route"],
+)
+
+HTTP_RESPONSES = Counter(
+    "http_responses",
+    "HTTP responses, by method, route and status code.",
+    ["method", "route", "status"],
+)
+
+HTTP_COMPRESSION_SAVED_BYTES = Counter(
+    "http_compression_saved_bytes",
+    "Bytes of response bodies saved by compression, by content coding.",
+    ["encoding"],
+)
+
+SQL_STATEMENT_SECONDS = Histogram(
+    "sql_statement_seconds",
+    "Time to execute a SQL statement, by engine and operation (SELECT, INSERT, ...).",
+    ["engine", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5),
+)
+
+DB_SESSION_REQUESTS = Counter(
+    "db_session_requests",
+    "HTTP requests handled by DatabaseSessionMiddleware, by whether they opened a database session.",
+    ["opened"],
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections checked out from the pool, by engine (sync or async).",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKED_IN = Gauge(
+    "db_pool_checked_in",
+    "Idle connections in the pool, by engine.",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Connections open over the pool size, by engine.",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a connection from the pool, opening it included, by engine.",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts",
+    "Checkouts that gave up waiting for a connection, by engine.",
+    ["engine"],
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests",
+    "Lookups in the in-process caches, by cache and result (hit or miss).",
+    ["cache", "result"],
+)
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds",
+    "Time to hash or verify a password, waiting for a free slot included, by operation.",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected",
+    "Password hash or verify requests rejected because no slot was free in time, by operation.",
+    ["operation"],
+)
+
+ADMISSION_LIMIT = Gauge(
+    "admission_limit",
+    "Current adaptive concurrency limit, by route group.",
+    ["group"],
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Requests admitted and not finished yet, by route group.",
+    ["group"],
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Requests waiting for a slot, by route group.",
+    ["group"],
+)
+
+ADMISSION_REJECTED = Counter(
+    "admission_rejected",
+    "Requests shed with a 503, by route group and reason (queue_full or timeout).",
+    ["group", "reason"],
+)
@@ -1,11 +1,20 @@
 """Module to add all middlewares
 """
 
+from .admission import AdmissionControlMiddleware
 from .auth import AuthMiddleware
+from .compression import CompressionMiddleware
 from .database_session import DatabaseSessionMiddleware
+from .metrics import InstrumentedRoute, MetricsMiddleware
+from .profiling import ProfilingMiddleware
 
 
 __all__ = [
+    "AdmissionControlMiddleware",
     "AuthMiddleware",
+    "CompressionMiddleware",
     "DatabaseSessionMiddleware",
+    "InstrumentedRoute",
+    "MetricsMiddleware",
+    "ProfilingMiddleware",
 ]
@@ -0,0 +1,262 @@
+"""Module that defines the admission control middleware class
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Callable
+
+from fastapi import status
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.metrics import (
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_LIMIT,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_REJECTED,
+)
+
+
+class Overloaded(Exception):
+    """The request can not be admitted, it must be shed."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """Concurrency limit of a group of routes, adapted to the observed latency.
+
+    The limit follows AIMD: it grows by one every `limit` requests answered
+    within `target_latency` and it is multiplied by `backoff` when they are
+    slower, at most once per `target_latency`. Requests above the limit wait
+    in a FIFO queue of at most `max_limit` requests for up to `queue_timeout`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_limit: int,
+        target_latency: float,
+        queue_timeout: float,
+        min_limit: int = 1,
+        initial_limit: int | None = None,
+        backoff: float = 0.9,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Args:
+            name (str): Name of the group, used as metric label.
+            max_limit (int): Highest limit, also the size of the queue.
+            target_latency (float): Seconds to the response start that are not
+            considered overload.
+            queue_timeout (float): Seconds a request waits for a slot.
+            min_limit (int, optional): Lowest limit. Defaults to 1.
+            initial_limit (int | None, optional): Limit at start. Defaults to None,
+            a quarter of max_limit.
+            backoff (float, optional): Decrease factor. Defaults to 0.9.
+            timer (Callable[[], float], optional): Clock. Defaults to time.monotonic.
+        """
+
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.limit = float(initial_limit or max(min_limit, max_limit // 4))
+        self.in_flight = 0
+        self._timer = timer
+        self._last_decrease = -math.inf
+        self._waiters: deque[asyncio.Future] = deque()
+
+        self._limit_gauge = ADMISSION_LIMIT.labels(group=name)
+        self._in_flight_gauge = ADMISSION_IN_FLIGHT.labels(group=name)
+        self._queue_gauge = ADMISSION_QUEUE_DEPTH.labels(group=name)
+        self._limit_gauge.set(self.limit)
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests waiting for a slot."""
+
+        return len(self._waiters)
+
+    def _update_gauges(self) -> None:
+        self._limit_gauge.set(self.limit)
+        self._in_flight_gauge.set(self.in_flight)
+        self._queue_gauge.set(len(self._waiters))
+
+    async def acquire(self) -> None:
+        """Wait for a slot.
+
+        Raises:
+            Overloaded: The queue is full or no slot was free in time.
+        """
+
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self._update_gauges()
+            return
+
+        if len(self._waiters) >= self.max_limit:
+            raise Overloaded("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        try:
+            # The slot is handed over by release, in_flight is already counted
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done():
+                # Got the slot just after the deadline, give it back
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            self._update_gauges()
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            raise Overloaded("timeout")
+
+    def release(self) -> None:
+        """Free a slot, handing it to the next waiter if the limit allows it."""
+
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+        self._update_gauges()
+
+    def observe(self, latency: float) -> None:
+        """Adapt the limit to the latency of an admitted request.
+
+        Args:
+            latency (float): Seconds from admission to the response start.
+        """
+
+        if latency > self.target_latency:
+            now = self._timer()
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+                logging.debug(
+                    "Decreased %s concurrency limit to %.1f" % (self.name, self.limit)
+                )
+        elif self.in_flight + 1 >= int(self.limit):
+            # Only grow while the limit is actually used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+        self._update_gauges()
+
+
+class AdmissionControlMiddleware:
+    """Admission control middleware
+
+    Requests whose path starts with one of the prefixes of a group must get a
+    slot of the group limiter first, the first matching group wins. The slot
+    is held until the response body is sent, streamed ones included. When the limiter sheds them they get a
+    503 with `Retry-After` right away, without touching auth nor the database.
+    """
+
+    def __init__(
+        self, app: ASGIApp, groups: list[tuple[tuple[str, ...], AdaptiveLimiter]]
+    ) -> None:
+        """
+        Args:
+            app (ASGIApp): The app.
+            groups (list[tuple[tuple[str, ...], AdaptiveLimiter]]): Path prefixes
+            and limiter of each group of routes.
+        """
+
+        self.app = app
+        self.groups = groups
+
+    def limiter(self, path: str) -> AdaptiveLimiter | None:
+        """Get the limiter of a path, if it belongs to a group."""
+
+        for prefixes, limiter in self.groups:
+            if path.startswith(prefixes):
+                return limiter
+
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limiter = self.limiter(scope["path"]) if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except Overloaded as exc:
+            ADMISSION_REJECTED.labels(group=limiter.name, reason=exc.reason).inc()
+            response = PlainTextResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content="Server overloaded, try again later",
+                headers={"Retry-After": str(math.ceil(limiter.queue_timeout))},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        observed = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal observed
+            if message["type"] == "http.response.start" and not observed:
+                observed = True
+                limiter.observe(time.perf_counter() - start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            limiter.release()
+
+
+def default_groups() -> list[tuple[tuple[str, ...], AdaptiveLimiter]]:
+    """Get the route groups of the app and their limiters, from the settings.
+
+    Returns:
+        list[tuple[tuple[str, ...], AdaptiveLimiter]]: The groups.
+    """
+
+    return [
+        (
+            ("/api/v1/signin/", "/api/v1/login/", "/api/v1/token/"),
+            AdaptiveLimiter(
+                "auth",
+                max_limit=settings.ADMISSION_AUTH_MAX_CONCURRENCY,
+                target_latency=settings.ADMISSION_AUTH_TARGET_LATENCY,
+                queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+            ),
+        ),
+        # Before records, exports hold their slot for the whole stream
+        (
+            ("/api/v1/records/export",),
+            AdaptiveLimiter(
+                "export",
+                max_limit=settings.ADMISSION_EXPORT_MAX_CONCURRENCY,
+                target_latency=settings.ADMISSION_EXPORT_TARGET_LATENCY,
+                queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+            ),
+        ),
+        (
+            ("/api/v1/records",),
+            AdaptiveLimiter(
+                "records",
+                max_limit=settings.ADMISSION_RECORDS_MAX_CONCURRENCY,
+                target_latency=settings.ADMISSION_RECORDS_TARGET_LATENCY,
+                queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+            ),
+        ),
+    ]
@@ -5,19 +5,55 @@ import logging
 
 from jose import jwt, JWTError
 
-from fastapi import Request, Response, HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from fastapi import Request, HTTPException, status
 from fastapi.responses import PlainTextResponse
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.types import ASGIApp, Receive, Scope, Send
 
+from app import crud
 from app import models
 
+from app.cache import TTLCache
 from app.config import settings
+from app.database import run_db
+from app.dependencies import get_db
+from app.profiling import profile_span
+
+
+user_cache = TTLCache(
+    "user", maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL
+)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _mark_user_changed(mapper, connection, target: models.User) -> None:
+    """Remember changed users so they are evicted from the cache on commit."""
+
+    if session := object_session(target):
+        session.info.setdefault("changed_users", set()).add(target.id)
+
 
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session) -> None:
+    for user_id in session.info.pop("changed_users", ()):
+        user_cache.pop(user_id)
 
-class AuthMiddleware(BaseHTTPMiddleware):
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session: Session) -> None:
+    session.info.pop("changed_users", None)
+
+
+class AuthMiddleware:
     """Validates the JWT and sets user on the request."""
 
-    def handle_token(self, request: Request, token: str) -> models.User:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def handle_token(self, request: Request, token: str) -> models.User:
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -37,20 +73,42 @@ class AuthMiddleware(BaseHTTPMiddleware):
             logging.error(f"Invalid user id: {user_id}")
             raise credentials_exception
 
+        if settings.AUTH_TRUST_JWT_CLAIMS:
+            return models.User(id=user_id, email=payload.get("email"))
+
+        if user := user_cache.get(user_id):
+            return user
+
         logging.debug("Getting user with id %d from database" % user_id)
-        user = request.state.db.query(models.User).get(user_id)
+        user = await run_db(get_db(request), crud.read_user, user_id)
 
         if not user:
             logging.error(f"INVALID_JWT_TOKEN: User with id {user_id} not found")
             raise credentials_exception
 
+        # Cache a copy that is not bound to the request session
+        user = models.User(
+            id=user.id, email=user.email, hashed_password=user.hashed_password
+        )
+        user_cache.set(user_id, user)
+
         return user
 
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
+    async def authenticate(self, request: Request) -> models.User | None:
+        """Get the user from the bearer token of the request, if any.
+
+        Args:
+            request (Request): The request.
+
+        Raises:
+            HTTPException: 401 error if the Authorization header or the token are
+            not valid.
+
+        Returns:
+            models.User | None: The user if the request has a token otherwise None.
+        """
+
         token: str = None
-        user: models.User = None
 
         if auth_header := request.headers.get("Authorization"):
             try:
@@ -65,13 +123,27 @@ class AuthMiddleware(BaseHTTPMiddleware):
                 )
 
         if token:
-            try:
-                user = self.handle_token(request=request, token=token)
-            except HTTPException as exc:
-                return PlainTextResponse(
-                    status_code=exc.status_code, content=exc.detail
-                )
+            return await self.handle_token(request=request, token=token)
+
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+
+        try:
+            with profile_span("auth"):
+                user = await self.authenticate(request)
+        except HTTPException as exc:
+            response = PlainTextResponse(
+                status_code=exc.status_code, content=exc.detail, headers=exc.headers
+            )
+            await response(scope, receive, send)
+            return
 
         request.state.user = user
 
-        return await call_next(request)
+        await self.app(scope, receive, send)
@@ -0,0 +1,281 @@
+"""Module that defines the response compression middleware class
+"""
+
+import zlib
+
+import brotli
+import zstandard
+from prometheus_client import Counter
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.metrics import HTTP_COMPRESSION_SAVED_BYTES
+
+
+# Media types worth compressing, images and archives are compressed already
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+COMPRESSIBLE_SUFFIXES = ("+json", "+xml")
+# Levels fast enough to compress responses on the fly
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+
+class GzipCompressor:
+    """Incremental gzip compressor."""
+
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(
+            GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16
+        )
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        """Compress a chunk of the body.
+
+        Args:
+            data (bytes): The chunk.
+            last (bool): Whether it is the last chunk of the body.
+
+        Returns:
+            bytes: The compressed data, decodable up to the end of the chunk.
+        """
+
+        mode = zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+class BrotliCompressor:
+    """Incremental brotli compressor."""
+
+    def __init__(self) -> None:
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        """See GzipCompressor.compress."""
+
+        result = self._compressor.process(data)
+        end = self._compressor.finish() if last else self._compressor.flush()
+        return result + end
+
+
+class ZstdCompressor:
+    """Incremental zstd compressor."""
+
+    def __init__(self) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        """See GzipCompressor.compress."""
+
+        mode = (
+            zstandard.COMPRESSOBJ_FLUSH_FINISH
+            if last
+            else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+# Compressors by content coding, in order of preference
+COMPRESSORS = {
+    "zstd": ZstdCompressor,
+    "br": BrotliCompressor,
+    "gzip": GzipCompressor,
+}
+
+
+def negotiate(accept_encoding: str, encodings: tuple[str, ...]) -> str | None:
+    """Choose the content coding of a response from the `Accept-Encoding` header.
+
+    Args:
+        accept_encoding (str): The header value, like `gzip, br;q=0.8`.
+        encodings (tuple[str, ...]): The supported codings, in order of preference.
+
+    Returns:
+        str | None: The accepted coding with the highest quality value, the
+        preferred one among ties, or None if the client accepts none of them.
+    """
+
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    default = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+def compressible(headers: Headers) -> bool:
+    """Whether a response may be compressed, from its headers."""
+
+    if "content-encoding" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", "").lower():
+        return False
+
+    media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    return media_type.startswith(COMPRESSIBLE_TYPES) or media_type.endswith(
+        COMPRESSIBLE_SUFFIXES
+    )
+
+
+class CompressionMiddleware:
+    """Response compression middleware
+
+    Compresses the text and JSON responses of `min_size` bytes or more with
+    the coding negotiated from `Accept-Encoding`: zstd, brotli or gzip.
+    Smaller ones are sent as they are. Streamed responses are buffered until
+    they reach `min_size`, then every chunk is compressed and flushed as it
+    comes. Chunks of `threadpool_size` bytes or more are compressed in the
+    threadpool, not to block the event loop.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        min_size: int = 1024,
+        threadpool_size: int = 65536,
+        encodings: tuple[str, ...] = tuple(COMPRESSORS),
+    ) -> None:
+        """
+        Args:
+            app (ASGIApp): The app.
+            min_size (int, optional): Smallest body compressed, in bytes.
+            Defaults to 1024.
+            threadpool_size (int, optional): Smallest chunk compressed in the
+            threadpool, in bytes. Defaults to 65536.
+            encodings (tuple[str, ...], optional): Codings offered, in order of
+            preference. Defaults to all the COMPRESSORS.
+        """
+
+        self.app = app
+        self.min_size = min_size
+        self.threadpool_size = threadpool_size
+        self.encodings = encodings
+        # Labelled metrics by coding, `labels` is slow for the hot path
+        self._saved_bytes: dict[str, Counter] = {}
+
+    def saved_bytes(self, encoding: str) -> Counter:
+        """Get the saved bytes counter of a coding."""
+
+        counter = self._saved_bytes.get(encoding)
+        if counter is None:
+            counter = self._saved_bytes[encoding] = HTTP_COMPRESSION_SAVED_BYTES.labels(
+                encoding=encoding
+            )
+
+        return counter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate(accept_encoding, self.encodings)
+
+        # Response start, held until the body is known to be worth compressing
+        start_message: Message | None = None
+        buffer: list[bytes] = []
+        buffered = 0
+        compressor: GzipCompressor | BrotliCompressor | ZstdCompressor | None = None
+        raw_size = compressed_size = 0
+
+        async def compress(data: bytes, last: bool) -> bytes:
+            nonlocal raw_size, compressed_size
+            if len(data) >= self.threadpool_size:
+                result = await run_in_threadpool(compressor.compress, data, last)
+            else:
+                result = compressor.compress(data, last)
+            raw_size += len(data)
+            compressed_size += len(result)
+            return result
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, buffered, compressor
+
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if message["status"] < 200 or message["status"] in (204, 304):
+                    await send(message)
+                elif not compressible(headers):
+                    await send(message)
+                else:
+                    # Caches must not serve a compressed body to other clients
+                    headers.add_vary_header("Accept-Encoding")
+                    if encoding is None:
+                        await send(message)
+                    else:
+                        start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is not None:
+                body = await compress(body, last=not more_body)
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": more_body}
+                )
+            else:
+                buffer.append(body)
+                buffered += len(body)
+                if buffered < self.min_size:
+                    if not more_body:
+                        # Too small to be worth it, send it as it is
+                        await send(start_message)
+                        await send(
+                            {"type": "http.response.body", "body": b"".join(buffer)}
+                        )
+                    return
+
+                headers = MutableHeaders(scope=start_message)
+                headers["Content-Encoding"] = encoding
+                del headers["Content-Length"]
+                # The compressed body is not byte for byte the tagged one
+                etag = headers.get("etag")
+                if etag is not None and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+
+                compressor = COMPRESSORS[encoding]()
+                body = await compress(b"".join(buffer), last=not more_body)
+                buffer.clear()
+                if not more_body:
+                    headers["Content-Length"] = str(len(body))
+
+                await send(start_message)
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": more_body}
+                )
+
+            if not more_body:
+                self.saved_bytes(encoding).inc(max(0, raw_size - compressed_size))
+
+        await self.app(scope, receive, send_wrapper)
@@ -2,24 +2,108 @@
 """
 
 import logging
+import time
+from functools import partial
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from app.database import SessionLocal
+from app.config import settings
+from app.database import (
+    SessionLocal,
+    AsyncSessionLocal,
+    LazySession,
+    ReplicaSet,
+    replicas,
+    replica_session_options,
+)
+from app.metrics import DB_SESSION_REQUESTS
 
 
-class DatabaseSessionMiddleware(BaseHTTPMiddleware):
-    """Database session middleware"""
+# Methods that do not write, served by the replicas
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+# Unix time until which the client reads from the primary, set after its writes
+PRIMARY_COOKIE = "db_primary_until"
+
+
+class DatabaseSessionMiddleware:
+    """Database session middleware
+
+    Plain ASGI middleware: a LazySession is stored in the scope state, so it is
+    available as `request.state.db`. The session is only created when `get_db`
+    asks for it and it is closed once the response, including a streamed body,
+    has been sent.
+
+    With replicas, sessions of safe methods read from one of them. Successful
+    writes set a cookie that sends the reads of the client to the primary for
+    `DATABASE_REPLICA_STICKY_SECONDS`, so it reads its own writes even if the
+    replicas lag behind.
+    """
+
+    opened_requests = DB_SESSION_REQUESTS.labels(opened="true")
+    unopened_requests = DB_SESSION_REQUESTS.labels(opened="false")
+
+    def __init__(self, app: ASGIApp, replica_set: ReplicaSet = replicas) -> None:
+        self.app = app
+        self.replicas = replica_set
+
+    def reads_from_primary(self, scope: Scope) -> bool:
+        """Whether the client wrote recently, according to its cookie."""
+
+        cookies = cookie_parser(Headers(scope=scope).get("cookie", ""))
+        try:
+            return float(cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def sticky_send(self, send: Send) -> Send:
+        """Wrap send to set the primary cookie on successful responses."""
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                sticky = settings.DATABASE_REPLICA_STICKY_SECONDS
+                MutableHeaders(scope=message).append(
+                    "set-cookie",
+                    f"{PRIMARY_COOKIE}={int(time.time()) + sticky}; Max-Age={sticky}; "
+                    "Path=/; HttpOnly; SameSite=lax",
+                )
+            await send(message)
+
+        return send_wrapper
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if settings.DATABASE_ASYNC:
+            logging.debug("Adding lazy AsyncSessionLocal to request state")
+            factory = AsyncSessionLocal
+        else:
+            logging.debug(
+                "Adding lazy database connection SessionLocal to request state"
+            )
+            factory = SessionLocal
+
+        if self.replicas.replicas:
+            if scope["method"] not in SAFE_METHODS:
+                send = self.sticky_send(send)
+            elif not self.reads_from_primary(scope):
+                if replica := self.replicas.pick():
+                    logging.debug("Reading from database %s" % replica.name)
+                    options = replica_session_options(replica, settings.DATABASE_ASYNC)
+                    factory = partial(factory, **options)
+
+        db = LazySession(factory)
+
+        scope.setdefault("state", {})["db"] = db
 
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
-        response = Response("Internal server error", status_code=500)
         try:
-            logging.debug("Adding database connection SessionLocal to request state")
-            request.state.db = SessionLocal()
-            response = await call_next(request)
+            await self.app(scope, receive, send)
         finally:
-            request.state.db.close()
-        return response
+            if db.opened:
+                self.opened_requests.inc()
+            else:
+                self.unopened_requests.inc()
+            await db.close()
@@ -0,0 +1,106 @@
+"""Module that defines the HTTP metrics middleware and route classes
+"""
+
+import time
+from typing import Any
+
+from fastapi.routing import APIRoute
+from prometheus_client import Counter, Gauge, Histogram
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT, HTTP_RESPONSES
+
+
+# Scope key where InstrumentedRoute leaves the path template of the route
+ROUTE_KEY = "metrics.route"
+# Route label of the requests answered before reaching a route (404, 401, 503)
+UNMATCHED_ROUTE = "unmatched"
+# Method label values, any other method is counted as OTHER
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+
+def method_label(scope: Scope) -> str:
+    """Get the method label of a request, bounded to the known methods."""
+
+    method = scope["method"]
+    return method if method in METHODS else "OTHER"
+
+
+class InstrumentedRoute(APIRoute):
+    """APIRoute that counts its requests in flight and tells MetricsMiddleware
+    the path template of the request, once routing has found it."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Labelled metrics by method, `labels` is slow for the hot path
+        self._in_flight: dict[str, Gauge] = {}
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send) -> None:
+        scope[ROUTE_KEY] = self.path
+        method = method_label(scope)
+        in_flight = self._in_flight.get(method)
+        if in_flight is None:
+            in_flight = self._in_flight[method] = HTTP_REQUESTS_IN_FLIGHT.labels(
+                method=method, route=self.path
+            )
+
+        in_flight.inc()
+        try:
+            await super().handle(scope, receive, send)
+        finally:
+            in_flight.dec()
+
+
+class MetricsMiddleware:
+    """HTTP metrics middleware
+
+    Records the latency until the whole body is sent and the status code of
+    every request, labelled with the route template set by InstrumentedRoute.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        # Labelled metrics by label values, `labels` is slow for the hot path
+        self._latencies: dict[tuple[str, str], Histogram] = {}
+        self._responses: dict[tuple[str, str, str], Counter] = {}
+
+    def observe(
+        self, method: str, route: str, status_code: int, latency: float
+    ) -> None:
+        """Record a finished request."""
+
+        key = (method, route)
+        if (histogram := self._latencies.get(key)) is None:
+            histogram = self._latencies[key] = HTTP_REQUEST_SECONDS.labels(
+                method=method, route=route
+            )
+        histogram.observe(latency)
+
+        key = (method, route, str(status_code))
+        if (counter := self._responses.get(key)) is None:
+            counter = self._responses[key] = HTTP_RESPONSES.labels(*key)
+        counter.inc()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.observe(
+                method_label(scope),
+                scope.get(ROUTE_KEY, UNMATCHED_ROUTE),
+                status_code,
+                time.perf_counter() - start,
+            )
@@ -0,0 +1,68 @@
+"""Module that defines the profiling middleware class
+"""
+
+import logging
+import random
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.profiling import RequestProfile, current_profile
+
+
+# Request header that asks for profiling when PROFILING_ON_DEMAND is set
+PROFILE_HEADER = b"x-profile"
+
+
+class ProfilingMiddleware:
+    """Profiling middleware
+
+    Profiles a `PROFILING_SAMPLE_RATE` fraction of the requests, and the ones
+    with an `X-Profile` header when `PROFILING_ON_DEMAND` is set. Statements
+    repeated `PROFILING_REPEATED_STATEMENTS` times or more in a profiled request
+    are logged as likely N+1 queries.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    def should_profile(self, scope: Scope) -> bool:
+        """Whether the request is sampled or asks for profiling."""
+
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            return True
+
+        return settings.PROFILING_ON_DEMAND and any(
+            name == PROFILE_HEADER for name, _ in scope["headers"]
+        )
+
+    def log_repeated_statements(self, scope: Scope, profile: RequestProfile) -> None:
+        for statement, count in profile.repeated_statements(
+            settings.PROFILING_REPEATED_STATEMENTS
+        ):
+            logging.warning(
+                "Possible N+1 queries in %s %s, statement run %d times: %s"
+                % (scope["method"], scope["path"], count, statement)
+            )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", profile.server_timing()
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            self.log_repeated_statements(scope, profile)
@@ -0,0 +1,92 @@
+"""Module to run the database migrations.
+
+Migrations are a deploy step, run once before starting or upgrading the app
+and not by every worker:
+    python -m app.migrate upgrade head
+
+It takes the commands and options of the alembic CLI, like `downgrade -1`,
+`current`, `history`, `upgrade head --sql` or
+`revision --autogenerate -m "Add records index" --rev-id 0006`.
+"""
+
+import logging
+import sys
+from pathlib import Path
+from typing import Callable
+
+from alembic.config import CommandLine, Config
+from sqlalchemy import Column, MetaData
+from sqlalchemy.sql.schema import SchemaItem
+
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+
+
+def alembic_config(url: str | None = None) -> Config:
+    """Get the alembic configuration of the app migrations.
+
+    Args:
+        url (str | None, optional): Database to migrate. Defaults to None,
+        `DATABASE_URI`.
+
+    Returns:
+        Config: The configuration.
+    """
+
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    config.set_main_option("file_template", "%%(rev)s_%%(slug)s")
+    if url is not None:
+        # Options are interpolated, percent-encoded characters must be escaped
+        config.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
+
+    return config
+
+
+def expression_index_filter(metadata: MetaData) -> Callable[..., bool]:
+    """Get an autogenerate filter skipping the indexes of expressions of metadata.
+
+    Autogenerate can not compare expressions like `title COLLATE "C"` to the
+    ones reflected from the database, it would drop and create these indexes
+    again in every revision. Their migrations are written by hand.
+
+    Args:
+        metadata (MetaData): The metadata of the models.
+
+    Returns:
+        Callable[..., bool]: The `include_object` option of the migration context.
+    """
+
+    names = {
+        index.name
+        for table in metadata.tables.values()
+        for index in table.indexes
+        if not all(isinstance(expression, Column) for expression in index.expressions)
+    }
+
+    def include_object(
+        object: SchemaItem,
+        name: str | None,
+        type_: str,
+        reflected: bool,
+        compare_to: SchemaItem | None,
+    ) -> bool:
+        return type_ != "index" or name not in names
+
+    return include_object
+
+
+def main(argv: list[str] | None = None) -> None:
+    cli = CommandLine(prog="python -m app.migrate")
+    options = cli.parser.parse_args(argv)
+    if not hasattr(options, "cmd"):
+        cli.parser.error("too few arguments")
+
+    config = alembic_config()
+    config.cmd_opts = options
+    cli.run_cmd(config, options)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    main(sys.argv[1:])
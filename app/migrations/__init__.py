@@ -0,0 +1,13 @@
+"""Module to define the database migrations.
+
+The revisions live in `versions/` and are run by `python -m app.migrate`.
+"""
+
+from .operations import backfill, create_index_concurrently, drop_index_concurrently
+
+
+__all__ = [
+    "backfill",
+    "create_index_concurrently",
+    "drop_index_concurrently",
+]
@@ -0,0 +1,67 @@
+"""Alembic environment of the app migrations.
+
+Migrations run against `DATABASE_URI`, or the `sqlalchemy.url` option of the
+configuration when it is set. Each revision runs in its own transaction, so a
+failure keeps the revisions applied before it.
+"""
+
+from alembic import context
+from sqlalchemy import create_engine, pool, text
+
+from app.config import settings
+from app.database import Base
+from app.migrate import expression_index_filter
+
+# Register all the tables in the metadata, for autogenerate
+import app.models  # noqa: F401
+
+
+config = context.config
+url = config.get_main_option("sqlalchemy.url") or str(settings.DATABASE_URI)
+
+
+def run_migrations_offline() -> None:
+    """Print the SQL of the migrations instead of running it."""
+
+    context.configure(
+        url=url,
+        target_metadata=Base.metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Run the migrations on the database."""
+
+    engine = create_engine(url, poolclass=pool.NullPool)
+
+    with engine.connect() as connection:
+        # Fail instead of queueing every query of the table behind our lock
+        connection.execute(
+            text("SELECT set_config('lock_timeout', :value, false)"),
+            {"value": f"{int(settings.MIGRATIONS_LOCK_TIMEOUT * 1000)}ms"},
+        )
+        connection.commit()
+
+        context.configure(
+            connection=connection,
+            target_metadata=Base.metadata,
+            include_object=expression_index_filter(Base.metadata),
+            transaction_per_migration=True,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+    engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
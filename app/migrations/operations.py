@@ -0,0 +1,168 @@
+"""Module to add migration operations that do not lock the records.
+
+A plain CREATE INDEX blocks the writes to the table until the index is built,
+and a single UPDATE of a whole table holds the lock of every row it changed
+until it commits. Migrations of tables in use must create and drop indexes with
+`create_index_concurrently` and `drop_index_concurrently`, and fill new columns
+with `backfill`.
+"""
+
+import logging
+import time
+from typing import Any, Sequence
+
+from alembic import op
+from sqlalchemy import TextClause, text
+
+
+def _disable_lock_timeout() -> str:
+    """Let the statements of an autocommit block wait for locks as long as needed.
+
+    Concurrent index builds wait for the transactions already running on the
+    table without blocking anyone, a lock timeout would only abort them.
+
+    Returns:
+        str: The lock timeout to restore.
+    """
+
+    bind = op.get_bind()
+    lock_timeout = bind.scalar(text("SHOW lock_timeout"))
+    bind.execute(text("SET lock_timeout = 0"))
+
+    return lock_timeout
+
+
+def _restore_lock_timeout(lock_timeout: str) -> None:
+    op.get_bind().execute(
+        text("SELECT set_config('lock_timeout', :value, false)"),
+        {"value": lock_timeout},
+    )
+
+
+def create_index_concurrently(
+    index_name: str,
+    table_name: str,
+    columns: Sequence[str | TextClause],
+    **kw: Any,
+) -> None:
+    """Create an index without blocking the writes to the table.
+
+    CREATE INDEX CONCURRENTLY can not run in a transaction, so the transaction
+    of the migration is committed first. A build that failed leaves an invalid
+    index behind, it is dropped so the migration can be run again.
+
+    Args:
+        index_name (str): Name of the index.
+        table_name (str): Name of the table.
+        columns (Sequence[str | TextClause]): Columns and expressions indexed.
+        **kw (Any): Other arguments of `op.create_index`, like `unique` or
+        `postgresql_using`.
+    """
+
+    with op.get_context().autocommit_block():
+        if op.get_context().as_sql:
+            op.create_index(
+                index_name, table_name, columns, postgresql_concurrently=True, **kw
+            )
+            return
+
+        lock_timeout = _disable_lock_timeout()
+        try:
+            invalid = op.get_bind().scalar(
+                text(
+                    "SELECT NOT indisvalid FROM pg_index "
+                    "WHERE indexrelid = to_regclass(:index_name)"
+                ),
+                {"index_name": index_name},
+            )
+            if invalid:
+                logging.warning("Dropping invalid index %s" % index_name)
+                op.drop_index(
+                    index_name, table_name=table_name, postgresql_concurrently=True
+                )
+
+            op.create_index(
+                index_name,
+                table_name,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kw,
+            )
+        finally:
+            _restore_lock_timeout(lock_timeout)
+
+
+def drop_index_concurrently(index_name: str, table_name: str) -> None:
+    """Drop an index without blocking the reads and writes of the table.
+
+    Args:
+        index_name (str): Name of the index.
+        table_name (str): Name of the table.
+    """
+
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            index_name,
+            table_name=table_name,
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def backfill(
+    table_name: str,
+    values: str,
+    where: str,
+    batch_size: int = 1000,
+    pause: float = 0,
+) -> int:
+    """Update the rows of a table in batches, committing each batch.
+
+    Rows are walked by ranges of their integer `id` primary key, so every batch
+    is an index range scan that locks at most `batch_size` rows for a short
+    transaction. Rows inserted while it runs are not visited, the app or a
+    trigger must already write the new values when the backfill starts. With
+    `--sql` it is rendered as a single UPDATE of all the rows to change.
+
+    Args:
+        table_name (str): Name of the table, it must have an integer `id`.
+        values (str): SET clause, like `title_length = length(title)`.
+        where (str): Condition of the rows to update, like `title_length IS NULL`.
+        batch_size (int, optional): Ids per batch. Defaults to 1000.
+        pause (float, optional): Seconds to sleep between batches, to let replicas
+        catch up. Defaults to 0.
+
+    Returns:
+        int: Number of rows updated, 0 with `--sql`.
+    """
+
+    if op.get_context().as_sql:
+        op.execute(f"UPDATE {table_name} SET {values} WHERE {where}")
+        return 0
+
+    statement = text(
+        f"UPDATE {table_name} SET {values} "
+        f"WHERE id > :start AND id <= :end AND ({where})"
+    )
+    updated = 0
+
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        start = bind.scalar(text(f"SELECT min(id) - 1 FROM {table_name}"))
+        last_id = bind.scalar(text(f"SELECT max(id) FROM {table_name}"))
+        if start is None:
+            return 0
+
+        while start < last_id:
+            end = start + batch_size
+            result = bind.execute(statement, {"start": start, "end": end})
+            updated += result.rowcount
+            logging.debug(
+                "Backfilled %s up to id %s, %s rows" % (table_name, end, updated)
+            )
+            start = end
+            if pause:
+                time.sleep(pause)
+
+    return updated
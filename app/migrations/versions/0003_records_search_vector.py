@@ -0,0 +1,62 @@
+"""Add the full-text search vector of the record titles
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 09:20:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.migrations import backfill, create_index_concurrently, drop_index_concurrently
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # A nullable column without default is only added to the catalog. The
+    # trigger fills it on the writes from now on, then the existing rows are
+    # backfilled in batches.
+    op.add_column(
+        "records", sa.Column("search_vector", postgresql.TSVECTOR(), nullable=True)
+    )
+    op.execute(
+        """
+        CREATE FUNCTION records_search_vector() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := to_tsvector('simple', coalesce(NEW.title, ''));
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER records_search_vector
+            BEFORE INSERT OR UPDATE OF title ON records
+            FOR EACH ROW EXECUTE FUNCTION records_search_vector()
+        """
+    )
+    backfill(
+        "records",
+        "search_vector = to_tsvector('simple', coalesce(title, ''))",
+        "search_vector IS NULL",
+    )
+    create_index_concurrently(
+        "ix_records_search_vector",
+        "records",
+        ["search_vector"],
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    drop_index_concurrently("ix_records_search_vector", "records")
+    op.execute("DROP TRIGGER records_search_vector ON records")
+    op.execute("DROP FUNCTION records_search_vector()")
+    op.drop_column("records", "search_vector")
@@ -0,0 +1,40 @@
+"""Add the indexes of the records list filters and sorts
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:30:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.migrations import create_index_concurrently, drop_index_concurrently
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_index_concurrently(
+        "ix_records_title_c_id", "records", [sa.text('title COLLATE "C"'), "id"]
+    )
+    create_index_concurrently(
+        "ix_records_img_c", "records", [sa.text('img COLLATE "C"')]
+    )
+    create_index_concurrently(
+        "ix_records_img_host_id",
+        "records",
+        [
+            sa.text("lower(substring(img, '^[^:/?#]+://(?:[^/?#@]*@)?([^/?#:]*)'))"),
+            "id",
+        ],
+    )
+
+
+def downgrade() -> None:
+    drop_index_concurrently("ix_records_img_host_id", "records")
+    drop_index_concurrently("ix_records_img_c", "records")
+    drop_index_concurrently("ix_records_title_c_id", "records")
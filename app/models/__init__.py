@@ -3,8 +3,10 @@
 
 from .user import User
 from .record import Record
+from .refresh_token import RefreshToken
 
 __all__ = [
     "User",
     "Record",
+    "RefreshToken",
 ]
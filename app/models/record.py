@@ -1,14 +1,78 @@
 """Module to add record model
 """
 
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import (
+    DDL,
+    Column,
+    Index,
+    Integer,
+    String,
+    Text,
+    event,
+    func,
+    literal_column,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
 from app.database import Base
 
 
+# Text search configuration of the title search vector. `simple` does not stem
+# nor drop stop words, so titles in any language are matched word by word.
+SEARCH_CONFIG = "simple"
+
+
 class Record(Base):
     __tablename__ = "records"
+    __table_args__ = (
+        Index("ix_records_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     img = Column(Text, index=True)
+    # Incremented by every update, used as ETag
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Kept up to date by the records_search_vector trigger on every write of the
+    # title. Unlike a generated column, it can be added to a large table without
+    # rewriting it, and then backfilled in batches.
+    search_vector = Column(TSVECTOR)
+
+
+# Tables created with `create_all` get the trigger too, the migrations create it
+# in the 0003 revision
+event.listen(
+    Record.__table__,
+    "after_create",
+    DDL(
+        f"""
+        CREATE FUNCTION records_search_vector() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.title, ''));
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER records_search_vector
+            BEFORE INSERT OR UPDATE OF title ON records
+            FOR EACH ROW EXECUTE FUNCTION records_search_vector();
+        """
+    ).execute_if(dialect="postgresql"),
+)
+
+
+# The records list filters and sorts titles and img urls byte-wise, so a single
+# btree index serves equality, prefix matches and keyset pagination. Queries
+# must use these same expressions for Postgres to pick the indexes.
+TITLE_C = Record.title.collate("C")
+IMG_C = Record.img.collate("C")
+# Lowercased host of the img url, without user info nor port
+IMG_HOST = func.lower(
+    func.substring(
+        Record.img, literal_column(r"'^[^:/?#]+://(?:[^/?#@]*@)?([^/?#:]*)'")
+    )
+)
+
+Index("ix_records_title_c_id", TITLE_C, Record.id)
+Index("ix_records_img_c", IMG_C)
+Index("ix_records_img_host_id", IMG_HOST, Record.id)
@@ -0,0 +1,21 @@
+"""Module to add refresh token model
+"""
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+
+from app.database import Base
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    # sha256 of the token, the token itself is only known by the client
+    token_hash = Column(String(64), unique=True, nullable=False)
+    # Tokens rotated from the same login share the family
+    family = Column(String(32), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime)
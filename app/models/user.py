@@ -21,6 +21,7 @@ class User(Base):
     def jwt(self) -> str:
         to_encode = {
             "user_id": self.id,
+            "email": self.email,
             "exp": datetime.utcnow()
             + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
         }
@@ -0,0 +1,66 @@
+"""Module to add pagination helpers.
+"""
+
+import json
+import base64
+import binascii
+from typing import Any
+
+from fastapi import HTTPException, status
+from starlette.datastructures import URL
+
+
+def encode_cursor(values: dict[str, Any]) -> str:
+    """Encode the sort key values of the last item of a page as an opaque cursor.
+
+    Args:
+        values (dict[str, Any]): The sort key values.
+
+    Returns:
+        str: The cursor.
+    """
+
+    data = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict[str, Any]:
+    """Decode a cursor created with encode_cursor.
+
+    Args:
+        cursor (str): The cursor.
+
+    Raises:
+        HTTPException: 400 error if the cursor is not valid.
+
+    Returns:
+        dict[str, Any]: The sort key values.
+    """
+
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        values = None
+
+    if not isinstance(values, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+    return values
+
+
+def next_page_link(url: URL, cursor: str) -> str:
+    """Build the value of a `Link` header pointing to the next page.
+
+    Args:
+        url (URL): The url of the current page.
+        cursor (str): The cursor of the next page.
+
+    Returns:
+        str: The header value.
+    """
+
+    next_url = url.remove_query_params("skip").include_query_params(cursor=cursor)
+    return f'<{next_url}>; rel="next"'
@@ -0,0 +1,146 @@
+"""Module to add per-request profiling.
+
+A profiled request gets a `RequestProfile` in the `current_profile` context
+variable, which is copied to the threadpool and kept by `AsyncSession.run_sync`,
+so SQLAlchemy events can record statements wherever they run. Its response
+gets a `Server-Timing` header, see `app.middlewares.ProfilingMiddleware`.
+"""
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session
+from app.config import settings
+
+
+# Whether any request can be profiled, otherwise the hooks are not installed
+PROFILING = bool(settings.PROFILING_SAMPLE_RATE or settings.PROFILING_ON_DEMAND)
+
+
+class RequestProfile:
+    """SQL statements and time spans of a request."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.spans: dict[str, float] = {}
+        self.statements: Counter[str] = Counter()
+
+    def add_statement(self, statement: str, duration: float, executemany: bool) -> None:
+        """Record an executed statement.
+
+        Args:
+            statement (str): The SQL, with placeholders instead of values.
+            duration (float): Seconds it took.
+            executemany (bool): Whether it ran for several sets of parameters,
+            those are batches of a single operation and are not repetitions.
+        """
+
+        self.sql_count += 1
+        self.sql_time += duration
+        if not executemany:
+            self.statements[statement] += 1
+
+    def add_span(self, name: str, duration: float) -> None:
+        """Add time to a named span."""
+
+        self.spans[name] = self.spans.get(name, 0) + duration
+
+    def repeated_statements(self, threshold: int) -> list[tuple[str, int]]:
+        """Get the statements run at least threshold times, N+1 query suspects.
+
+        Args:
+            threshold (int): Lowest number of runs.
+
+        Returns:
+            list[tuple[str, int]]: The statements and their number of runs.
+        """
+
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def server_timing(self) -> str:
+        """Get the value of the Server-Timing header.
+
+        Returns:
+            str: The SQL, span and total durations in milliseconds.
+        """
+
+        metrics = [f'sql;dur={self.sql_time * 1e3:.2f};desc="{self.sql_count} queries"']
+        metrics += [
+            f"{name};dur={duration * 1e3:.2f}" for name, duration in self.spans.items()
+        ]
+        metrics.append(f"total;dur={(time.perf_counter() - self.start) * 1e3:.2f}")
+
+        return ", ".join(metrics)
+
+
+current_profile: ContextVar[RequestProfile | None] = ContextVar(
+    "current_profile", default=None
+)
+
+
+@contextmanager
+def profile_span(name: str) -> Iterator[None]:
+    """Time a block in the span name of the current profile, if any.
+
+    Args:
+        name (str): Name of the span.
+    """
+
+    profile = current_profile.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.add_span(name, time.perf_counter() - start)
+
+
+def profile_statements(db_engine: Engine) -> None:
+    """Record the statements executed by an engine in the current profile.
+
+    Args:
+        db_engine (Engine): The engine, the sync one of an AsyncEngine.
+    """
+
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        if current_profile.get() is not None:
+            context._profile_start = time.perf_counter()
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def _add_statement(conn, cursor, statement, parameters, context, executemany):
+        if (profile := current_profile.get()) is not None:
+            duration = time.perf_counter() - context._profile_start
+            profile.add_statement(statement, duration, executemany)
+
+
+@event.listens_for(Session, "before_commit")
+def _start_commit_timer(session: Session) -> None:
+    if current_profile.get() is not None:
+        session.info["profile_commit_start"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _add_commit_span(session: Session) -> None:
+    start = session.info.pop("profile_commit_start", None)
+    if start is not None and (profile := current_profile.get()) is not None:
+        profile.add_span("commit", time.perf_counter() - start)
+
+
+class ProfiledJSONResponse(JSONResponse):
+    """JSONResponse that records its rendering in the serialize span."""
+
+    def render(self, content: Any) -> bytes:
+        with profile_span("serialize"):
+            return super().render(content)
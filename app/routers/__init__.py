@@ -2,12 +2,15 @@
 """
 
 from fastapi import APIRouter
-from fastapi.responses import JSONResponse
 
+from app.profiling import ProfiledJSONResponse
+
+from .health import health_router
+from .metrics import metrics_router
 from .v1 import v1_router
 
 
-api_router = APIRouter(prefix="/api", default_response_class=JSONResponse)
+api_router = APIRouter(prefix="/api", default_response_class=ProfiledJSONResponse)
 
 
 api_router.include_router(v1_router)
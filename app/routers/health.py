@@ -0,0 +1,81 @@
+"""Module to add the liveness and readiness handlers
+"""
+
+import asyncio
+import logging
+
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import exc
+
+from app.config import settings
+from app.database import async_engine, engine, ping, replicas
+
+
+health_router = APIRouter(prefix="/health")
+
+# Set when the worker got SIGTERM and drains its requests, see app.server
+draining = False
+
+
+def start_draining() -> None:
+    """Fail the readiness check from now on, the worker is shutting down."""
+
+    global draining
+    draining = True
+
+
+@health_router.get("/live", include_in_schema=False)
+async def live() -> dict[str, str]:
+    """Liveness check, answered as long as the event loop runs.
+
+    The database is not checked, an outage must not get the workers restarted.
+
+    Returns:
+        dict[str, str]: The status.
+    """
+
+    return {"status": "ok"}
+
+
+@health_router.get("/ready", include_in_schema=False)
+async def ready() -> JSONResponse:
+    """Readiness check, a connection of the pool must make a round trip to the
+    primary within `HEALTH_CHECK_TIMEOUT` seconds.
+
+    A saturated pool fails it too, the worker could not serve more requests.
+
+    Returns:
+        JSONResponse: The status and the state of the pool and the replicas, with
+        a 503 status code when the worker is draining or the database is not
+        reachable.
+    """
+
+    db_engine = async_engine if settings.DATABASE_ASYNC else engine
+    pool = db_engine.pool
+    content = {
+        "status": "ok",
+        "pool": {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+        },
+        "replicas": {replica.name: replica.available for replica in replicas.replicas},
+    }
+
+    if draining:
+        content["status"] = "draining"
+    else:
+        try:
+            await asyncio.wait_for(ping(db_engine), settings.HEALTH_CHECK_TIMEOUT)
+        except (asyncio.TimeoutError, exc.SQLAlchemyError) as error:
+            logging.warning("Readiness check failed: %r" % error)
+            content["status"] = "unavailable"
+
+    status_code = (
+        status.HTTP_200_OK
+        if content["status"] == "ok"
+        else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+    return JSONResponse(content, status_code=status_code)
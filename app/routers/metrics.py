@@ -0,0 +1,48 @@
+"""Module to add the metrics handler
+"""
+
+import os
+
+from fastapi import APIRouter, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+
+
+metrics_router = APIRouter()
+
+
+def metrics_registry() -> CollectorRegistry:
+    """Get the registry to expose.
+
+    With several worker processes `PROMETHEUS_MULTIPROC_DIR` must be set, the
+    metrics of all of them are then collected from that directory. Only the
+    values written by the workers are found there, so gauges must be set when
+    they change, not read with `set_function` at collection.
+
+    Returns:
+        CollectorRegistry: The registry.
+    """
+
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+
+    return registry
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    """Expose the metrics in the Prometheus text format.
+
+    Returns:
+        Response: The metrics.
+    """
+
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
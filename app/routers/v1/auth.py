@@ -4,46 +4,38 @@
 import logging
 from typing import Annotated
 
-from passlib.context import CryptContext
-
 from fastapi import APIRouter, HTTPException, status, Depends
 
-from sqlalchemy.orm import Session
-
+from app import crud
 from app import models
 from app import schemas
+from app.database import DBSession, run_db
 from app.dependencies import get_db, get_user
+from app.middlewares import InstrumentedRoute
+from app.security import password_hasher
 
 
-auth_router = APIRouter()
+auth_router = APIRouter(route_class=InstrumentedRoute)
 
 
 @auth_router.post(
     "/signin/", response_model=schemas.User, status_code=status.HTTP_201_CREATED
 )
-def signin(
-    user: schemas.UserAuth, db: Annotated[Session, Depends(get_db)]
+async def signin(
+    user: schemas.UserAuth, db: Annotated[DBSession, Depends(get_db)]
 ) -> schemas.User:
     """Signin a user.
 
     Args:
         user (schemas.UserAuth): The data needed to create a user.
-        db (Session): The db session.
+        db (DBSession): The db session.
 
     Returns:
         schemas.Record: The new user.
     """
 
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    user_data = {
-        "email": user.email,
-        "hashed_password": pwd_context.hash(user.password),
-    }
-
-    db_user = models.User(**user_data)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    hashed_password = await password_hasher.hash(user.password)
+    db_user = await run_db(db, crud.create_user, user.email, hashed_password)
 
     logging.debug("Created user with id %d" % db_user.id)
 
@@ -53,28 +45,80 @@ def signin(
 @auth_router.post(
     "/login/", response_model=schemas.Token, status_code=status.HTTP_200_OK
 )
-def login(
+async def login(
     user: schemas.UserAuth,
     db_user: Annotated[models.User, Depends(get_user)],
+    db: Annotated[DBSession, Depends(get_db)],
 ) -> schemas.Token:
     """User login.
 
+    Password hashes made with another bcrypt cost are replaced on success.
+
     Args:
         user schemas.UserAuth: The user data.
+        db_user (models.User): The user with this email if exists otherwise None.
+        db (DBSession): The db session.
 
     Raises:
-        HTTPException: Incorrect email or password .
+        HTTPException: Incorrect email or password, or too many logins at once.
 
     Returns:
-        schemas.Token: The access token.
+        schemas.Token: The access token and a refresh token.
     """
 
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    if not db_user or not pwd_context.verify(user.password, db_user.hashed_password):
+    valid, new_hash = False, None
+    if db_user:
+        valid, new_hash = await password_hasher.verify(
+            user.password, db_user.hashed_password
+        )
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    return {"jwt": db_user.jwt, "token_type": "bearer"}
+    if new_hash:
+        await run_db(db, crud.update_user_password, db_user, new_hash)
+        logging.debug("Rehashed password of user with id %d" % db_user.id)
+
+    refresh_token = await run_db(db, crud.create_refresh_token, db_user.id)
+
+    return {"jwt": db_user.jwt, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+@auth_router.post(
+    "/token/refresh/", response_model=schemas.Token, status_code=status.HTTP_200_OK
+)
+async def refresh(
+    token: schemas.TokenRefresh, db: Annotated[DBSession, Depends(get_db)]
+) -> schemas.Token:
+    """Get a new access token with a refresh token, without the password.
+
+    The refresh token is rotated: the response carries the next one and the
+    given one can not be used again.
+
+    Args:
+        token (schemas.TokenRefresh): The refresh token.
+        db (DBSession): The db session.
+
+    Raises:
+        HTTPException: Invalid, expired or already used refresh token.
+
+    Returns:
+        schemas.Token: The access token and the next refresh token.
+    """
+
+    rotated = await run_db(db, crud.rotate_refresh_token, token.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    db_user, refresh_token = rotated
+    logging.debug("Refreshed access token of user with id %d" % db_user.id)
+
+    return {"jwt": db_user.jwt, "token_type": "bearer", "refresh_token": refresh_token}
@@ -1,88 +1,581 @@
 """Module to add all records handlers
 """
 
+import json
 import logging
-from typing import Annotated
-
-from fastapi import APIRouter, HTTPException, status, Depends
+from typing import Annotated, Any, AsyncIterator, Literal
+
+from pydantic import ValidationError
+
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Header,
+    Query,
+    Request,
+    Response,
+    status,
+    Depends,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, select
 
+from app import crud
 from app import models
 from app import schemas
-from app.dependencies import get_db, get_record, user_is_authenticated
-
+from app.cache import TTLCache
+from app.config import settings
+from app.database import DBSession, run_db, stream_db
+from app.dependencies import get_db, get_record, record_cache, user_is_authenticated
+from app.middlewares import InstrumentedRoute
+from app.etags import record_etag, records_etag, etag_matches, if_match_versions
+from app.profiling import ProfiledJSONResponse
+from app.pagination import encode_cursor, decode_cursor, next_page_link
+
+
+# Types of the sort key values in the records list cursors
+CURSOR_TYPES = {"id": int, "title": str}
+
+count_cache = TTLCache(
+    "record_count",
+    maxsize=settings.RECORDS_COUNT_CACHE_SIZE,
+    ttl=settings.RECORDS_COUNT_CACHE_TTL,
+)
+estimate_cache = TTLCache(
+    "record_count_estimate",
+    maxsize=settings.RECORDS_COUNT_CACHE_SIZE,
+    ttl=settings.RECORDS_COUNT_ESTIMATE_TTL,
+)
 
 records_router = APIRouter(
-    prefix="/records", dependencies=[Depends(user_is_authenticated)]
+    prefix="/records",
+    dependencies=[Depends(user_is_authenticated)],
+    route_class=InstrumentedRoute,
 )
 
 
+def record_content(row: Row) -> dict[str, Any]:
+    """Map a record row to the content of a schemas.Record response.
+
+    Read only handlers return rows selected with Core straight in a
+    JSONResponse, skipping the ORM and the response_model validation. The
+    write schemas never let a null title or img in, so the rows are valid.
+
+    Args:
+        row (Row): The record row.
+
+    Returns:
+        dict[str, Any]: The response content.
+    """
+
+    return {"title": row.title, "img": row.img}
+
+
+async def missing_record_error(
+    db: DBSession, record_id: int, versions: list[int] | None
+) -> HTTPException:
+    """Get the error of a conditional write that did not match any record.
+
+    Args:
+        db (DBSession): The db session.
+        record_id (int): The record's id.
+        versions (list[int] | None): The versions accepted by If-Match.
+
+    Returns:
+        HTTPException: 412 if the record exists but its version did not match,
+        otherwise 404.
+    """
+
+    if versions is not None and await run_db(db, crud.record_exists, record_id):
+        return HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Record has been modified",
+        )
+
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND, detail="Record not found"
+    )
+
+
+async def total_count(
+    db: DBSession,
+    filters: schemas.RecordFilters,
+    mode: Literal["exact", "estimated", "cached"],
+) -> tuple[int, str]:
+    """Count the records matching the filters.
+
+    Args:
+        db (DBSession): The db session.
+        filters (schemas.RecordFilters): The filters.
+        mode (Literal["exact", "estimated", "cached"]): `exact` runs a COUNT(*),
+        which scans every matching row. `estimated` asks the planner, it is cheap
+        but can be off, and it is reused for `settings.RECORDS_COUNT_ESTIMATE_TTL`
+        seconds. `cached` reuses an exact count for
+        `settings.RECORDS_COUNT_CACHE_TTL` seconds.
+
+    Returns:
+        tuple[int, str]: The number of records and the mode used. `estimated`
+        falls back to `cached` while the table has no statistics.
+    """
+
+    key = tuple(sorted(filters.dict(exclude_none=True).items()))
+
+    if mode == "estimated":
+        total = estimate_cache.get(key)
+        if total is None:
+            total = await run_db(db, crud.estimate_count_records, filters)
+            if total is not None:
+                estimate_cache.set(key, total)
+        if total is not None:
+            return total, mode
+        mode = "cached"
+
+    if mode == "exact":
+        return await run_db(db, crud.count_records, filters), mode
+
+    total = count_cache.get(key)
+    if total is None:
+        total = await run_db(db, crud.count_records, filters)
+        count_cache.set(key, total)
+
+    return total, mode
+
+
 @records_router.get(
     "/", response_model=list[schemas.Record], status_code=status.HTTP_200_OK
 )
-def get_all_records(
-    db: Annotated[Session, Depends(get_db)],
-    skip: int = 0,
-    limit: int = 100,
-) -> list[schemas.Record]:
-    """Gets all records from db.
+async def get_all_records(
+    request: Request,
+    db: Annotated[DBSession, Depends(get_db)],
+    filters: Annotated[schemas.RecordFilters, Depends()],
+    sort: Literal["id", "-id", "title", "-title"] = "id",
+    count: Literal["none", "exact", "estimated", "cached"] | None = None,
+    cursor: str | None = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, gt=0, le=settings.RECORDS_MAX_LIMIT),
+) -> Response:
+    """Gets all records from db matching the filters, ordered by id by default.
+
+    Only the combinations of filters and sort served by an index are supported
+    (see `crud.LIST_SORTS`). Titles are sorted byte-wise.
+
+    Pages are fetched with keyset pagination: when the page is full, the `Link`
+    header points to the next page through an opaque `cursor`. The `skip`
+    offset is still accepted for compatibility, up to `settings.RECORDS_MAX_SKIP`.
+
+    The total number of matching records is returned in the `X-Total-Count`
+    header, and how it was computed in `X-Total-Count-Mode` (see `total_count`).
+
+    The page has an ETag, a matching `If-None-Match` gets a 304 without body.
 
     Args:
-        db (Session): The db session.
+        request (Request): The request.
+        db (DBSession): The db session.
+        filters (schemas.RecordFilters): The filters.
+        sort (str, optional): The sort key, `-` prefixed when descending. Defaults to "id".
+        count (str | None, optional): How to count the total. Defaults to None,
+        `estimated` for unfiltered lists and `none` otherwise.
+        cursor (str | None, optional): The cursor of the page we want to retrieve. Defaults to None.
         skip (int, optional): The offset where we want to start searching in the db. Defaults to 0.
         limit (int, optional): The number of records we want to retrieve from the db. Defaults to 100.
+
+    Raises:
+        HTTPException: Unsupported filters and sort, invalid cursor, skip or
+        combination of both.
+
     Returns:
-        list[schemas.Record]: A list with all records that we get from db.
+        Response: A list with all records that we get from db, or a 304 when
+        the ETag matches.
     """
 
-    logging.debug("Getting records from database (skip %d, limit %d" % (skip, limit))
-    records = db.query(models.Record).offset(skip).limit(limit).all()
+    if not crud.list_sort_supported(filters, sort):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="This combination of filters and sort is not supported",
+        )
+
+    sort_keys = crud.SORT_KEYS[sort.lstrip("-")]
+
+    after = None
+    if cursor is not None:
+        if skip:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="cursor and skip can not be used together",
+            )
+        values = decode_cursor(cursor)
+        after = tuple(values.get(key) for key in sort_keys)
+        if not all(
+            isinstance(value, CURSOR_TYPES[key]) for key, value in zip(sort_keys, after)
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+
+    if skip > settings.RECORDS_MAX_SKIP:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"skip can not be greater than {settings.RECORDS_MAX_SKIP}, use cursor instead",
+        )
 
-    return records
+    logging.debug(
+        "Getting records from database (sort %s, after %s, skip %d, limit %d)"
+        % (sort, after, skip, limit)
+    )
+    records = await run_db(
+        db, crud.read_records, limit, skip, filters=filters, sort=sort, after=after
+    )
+
+    headers = {"ETag": records_etag(records)}
+    if records and len(records) == limit:
+        last = records[-1]
+        next_cursor = encode_cursor({key: getattr(last, key) for key in sort_keys})
+        headers["Link"] = next_page_link(request.url, next_cursor)
+
+    # The client has the page already, it does not need the count either
+    if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if count is None:
+        count = "estimated" if not filters.dict(exclude_none=True) else "none"
+
+    if count != "none":
+        if cursor is None and len(records) < limit and (records or not skip):
+            # The whole list fits in this page
+            total, count = skip + len(records), "exact"
+        else:
+            total, count = await total_count(db, filters, count)
+        headers["X-Total-Count"] = str(total)
+        headers["X-Total-Count-Mode"] = count
+
+    return ProfiledJSONResponse(
+        [record_content(record) for record in records], headers=headers
+    )
 
 
 @records_router.post(
     "/", response_model=schemas.Record, status_code=status.HTTP_201_CREATED
 )
-def create_record(
-    record: schemas.RecordCreate, db: Annotated[Session, Depends(get_db)]
-) -> schemas.Record:
+async def create_record(
+    record: schemas.RecordCreate,
+    db: Annotated[DBSession, Depends(get_db)],
+) -> JSONResponse:
     """Creates a record in db.
 
     Args:
         record (schemas.RecordCreate): The data needed to create a record.
-        db (Session): The db session.
+        db (DBSession): The db session.
     Returns:
-        schemas.Record: The new record entry in db.
+        JSONResponse: The new record entry in db.
     """
 
-    db_record = models.Record(**record.dict())
-    db.add(db_record)
-    db.commit()
-    db.refresh(db_record)
+    db_record = await run_db(db, crud.create_record, record.dict())
 
     logging.debug("Created record with id %d" % db_record.id)
 
-    return db_record
+    # New records are usually read right away
+    await record_cache.aset(db_record.id, db_record)
+
+    return ProfiledJSONResponse(
+        record_content(db_record),
+        status_code=status.HTTP_201_CREATED,
+        headers={"ETag": record_etag(db_record.id, db_record.version)},
+    )
+
+
+def parse_bulk_body(body: bytes, content_type: str) -> list[Any]:
+    """Parse the body of a bulk request, a JSON array or NDJSON.
+
+    Args:
+        body (bytes): The request body.
+        content_type (str): The request content type.
+
+    Raises:
+        HTTPException: The body is not valid JSON/NDJSON or not an array.
+
+    Returns:
+        list[Any]: The items.
+    """
+
+    try:
+        if content_type.startswith("application/x-ndjson"):
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = json.loads(body)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON body"
+        )
+
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Expected a JSON array",
+        )
+
+    return items
+
+
+def validate_bulk_records(
+    items: list[Any], offset: int
+) -> tuple[list[dict[str, Any]], list[schemas.RecordBulkError]]:
+    """Validate a batch of items of a bulk creation.
+
+    Args:
+        items (list[Any]): The items of the batch.
+        offset (int): Index of the first item of the batch in the request.
+
+    Returns:
+        tuple[list[dict[str, Any]], list[schemas.RecordBulkError]]: The valid
+        records and the errors of the invalid ones.
+    """
+
+    rows, errors = [], []
+    for index, item in enumerate(items, start=offset):
+        try:
+            rows.append(schemas.RecordCreate.parse_obj(item).dict())
+        except ValidationError as exc:
+            errors.append(schemas.RecordBulkError(index=index, errors=exc.errors()))
+
+    return rows, errors
+
+
+@records_router.post(
+    "/bulk/",
+    response_model=schemas.RecordBulkCreateResult,
+    status_code=status.HTTP_201_CREATED,
+)
+async def bulk_create_records(
+    request: Request,
+    db: Annotated[DBSession, Depends(get_db)],
+    atomic: bool = True,
+    batch_size: int = Query(settings.RECORDS_BULK_BATCH_SIZE, gt=0),
+) -> schemas.RecordBulkCreateResult:
+    """Creates many records in db.
+
+    The body is a JSON array of records or, with the `application/x-ndjson`
+    content type, one record per line. Items are validated in batches in the
+    threadpool and inserted with multi-row INSERT statements of batch_size rows.
+
+    Args:
+        request (Request): The request.
+        db (DBSession): The db session.
+        atomic (bool, optional): If True nothing is created when any item is
+        invalid, otherwise the valid items are created and the invalid ones are
+        reported. Defaults to True.
+        batch_size (int, optional): Number of items validated and inserted at a
+        time. Defaults to settings.RECORDS_BULK_BATCH_SIZE.
+
+    Raises:
+        HTTPException: Invalid body, too many items or invalid items in atomic mode.
+
+    Returns:
+        schemas.RecordBulkCreateResult: The ids of the new records and the errors.
+    """
+
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    items = await run_in_threadpool(parse_bulk_body, body, content_type)
+
+    if len(items) > settings.RECORDS_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Can not create more than {settings.RECORDS_BULK_MAX_ITEMS} records at once",
+        )
+
+    rows, errors = [], []
+    for offset in range(0, len(items), batch_size):
+        batch_rows, batch_errors = await run_in_threadpool(
+            validate_bulk_records, items[offset : offset + batch_size], offset
+        )
+        rows.extend(batch_rows)
+        errors.extend(batch_errors)
+
+    if errors and atomic:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=[error.dict() for error in errors],
+        )
+
+    ids = await run_db(db, crud.create_records, rows, batch_size)
+
+    logging.debug("Created %d records, %d invalid" % (len(ids), len(errors)))
+
+    return schemas.RecordBulkCreateResult(ids=ids, errors=errors)
+
+
+@records_router.patch(
+    "/bulk/", response_model=schemas.RecordBulkResult, status_code=status.HTTP_200_OK
+)
+async def bulk_update_records(
+    record: schemas.RecordBulkUpdate, db: Annotated[DBSession, Depends(get_db)]
+) -> schemas.RecordBulkResult:
+    """Partially update many records with a single UPDATE statement.
+
+    Args:
+        record (schemas.RecordBulkUpdate): The records to update and the data
+        to update them.
+        db (DBSession): The db session.
+
+    Returns:
+        schemas.RecordBulkResult: The number and ids of the updated records.
+    """
+
+    ids = await run_db(
+        db, crud.update_records, record.where, record.values.dict(exclude_unset=True)
+    )
+
+    logging.debug("Bulk updated %d records" % len(ids))
+
+    await record_cache.apop_many(ids)
+
+    return schemas.RecordBulkResult(count=len(ids), ids=ids)
+
+
+@records_router.delete(
+    "/bulk/", response_model=schemas.RecordBulkResult, status_code=status.HTTP_200_OK
+)
+async def bulk_delete_records(
+    selection: schemas.RecordSelection, db: Annotated[DBSession, Depends(get_db)]
+) -> schemas.RecordBulkResult:
+    """Delete many records with a single DELETE statement.
+
+    Args:
+        selection (schemas.RecordSelection): The records to delete.
+        db (DBSession): The db session.
+
+    Returns:
+        schemas.RecordBulkResult: The number and ids of the deleted records.
+    """
+
+    ids = await run_db(db, crud.delete_records, selection)
+
+    logging.debug("Bulk deleted %d records" % len(ids))
+
+    await record_cache.apop_many(ids)
+
+    return schemas.RecordBulkResult(count=len(ids), ids=ids)
+
+
+@records_router.get(
+    "/search/", response_model=list[schemas.Record], status_code=status.HTTP_200_OK
+)
+async def search_records(
+    request: Request,
+    db: Annotated[DBSession, Depends(get_db)],
+    q: str = Query(..., min_length=1),
+    cursor: str | None = None,
+    limit: int = Query(100, gt=0, le=settings.RECORDS_MAX_LIMIT),
+) -> JSONResponse:
+    """Search records by the words of their title, best matches first.
+
+    The query uses the web search syntax: words, "quoted phrases", `or` and
+    `-excluded` words. Pages are fetched with keyset pagination on the rank and
+    the id, when the page is full the `Link` header points to the next page.
+
+    Args:
+        request (Request): The request.
+        db (DBSession): The db session.
+        q (str): The search query.
+        cursor (str | None, optional): The cursor of the page we want to retrieve. Defaults to None.
+        limit (int, optional): The number of records we want to retrieve from the db. Defaults to 100.
+
+    Raises:
+        HTTPException: Invalid cursor.
+
+    Returns:
+        JSONResponse: The matching records.
+    """
+
+    after = None
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        after = values.get("rank"), values.get("id")
+        if not isinstance(after[0], (int, float)) or not isinstance(after[1], int):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+
+    logging.debug("Searching records for %r (after %s)" % (q, after))
+    records = await run_db(db, crud.search_records, q, limit, after=after)
+
+    headers = {}
+    if records and len(records) == limit:
+        last = records[-1]
+        next_cursor = encode_cursor({"rank": last.rank, "id": last.id})
+        headers["Link"] = next_page_link(request.url, next_cursor)
+
+    return ProfiledJSONResponse(
+        [record_content(record) for record in records], headers=headers
+    )
+
+
+@records_router.get(
+    "/export/", response_class=StreamingResponse, status_code=status.HTTP_200_OK
+)
+async def export_records(
+    db: Annotated[DBSession, Depends(get_db)],
+    format: Literal["ndjson", "json"] = "ndjson",
+) -> StreamingResponse:
+    """Stream all records ordered by id.
+
+    Rows are read in batches of `settings.RECORDS_EXPORT_BATCH_SIZE` from a
+    server-side cursor and each batch is sent before the next one is fetched,
+    so memory does not grow with the number of records and a slow client
+    slows down the reads.
+
+    Args:
+        db (DBSession): The db session.
+        format (Literal["ndjson", "json"], optional): Newline delimited JSON or a
+        JSON array. Defaults to "ndjson".
+
+    Returns:
+        StreamingResponse: The records.
+    """
+
+    statement = select(models.Record.title, models.Record.img).order_by(
+        models.Record.id
+    )
+    batches = stream_db(db, statement, settings.RECORDS_EXPORT_BATCH_SIZE)
+
+    async def ndjson() -> AsyncIterator[str]:
+        async for rows in batches:
+            yield "".join(json.dumps(record_content(row)) + "\n" for row in rows)
+
+    async def json_array() -> AsyncIterator[str]:
+        separator = "["
+        async for rows in batches:
+            yield separator + ",".join(json.dumps(record_content(row)) for row in rows)
+            separator = ","
+        yield "[]" if separator == "[" else "]"
+
+    logging.debug("Exporting records as %s" % format)
+
+    if format == "json":
+        return StreamingResponse(json_array(), media_type="application/json")
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 @records_router.get(
     "/{record_id}/", response_model=schemas.Record, status_code=status.HTTP_200_OK
 )
-def retrieve_record(
-    db_record: Annotated[models.Record, Depends(get_record)]
-) -> schemas.Record:
+async def retrieve_record(
+    db_record: Annotated[Row, Depends(get_record)],
+    if_none_match: str | None = Header(None),
+) -> Response:
     """Get a record entry from db.
 
     Args:
-        db_record (models.Record): The db record if exists otherwise None.
+        db_record (Row): The db record row if exists otherwise None.
+        if_none_match (str | None): The `If-None-Match` header.
 
     Raises:
         HTTPException: Record not found.
 
     Returns:
-        schemas.Record: The record entry in db.
+        Response: The record entry in db, or a 304 when the ETag matches.
     """
 
     if db_record is None:
@@ -90,107 +583,138 @@ def retrieve_record(
             status_code=status.HTTP_404_NOT_FOUND, detail="Record not found"
         )
 
-    return db_record
+    headers = {"ETag": record_etag(db_record.id, db_record.version)}
+
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return ProfiledJSONResponse(record_content(db_record), headers=headers)
 
 
 @records_router.put(
     "/{record_id}/", response_model=schemas.Record, status_code=status.HTTP_200_OK
 )
-def update_record(
+async def update_record(
+    record_id: int,
     record: schemas.RecordUpdate,
-    db_record: Annotated[models.Record, Depends(get_record)],
-    db: Annotated[Session, Depends(get_db)],
-) -> schemas.Record:
+    db: Annotated[DBSession, Depends(get_db)],
+    if_match: str | None = Header(None),
+) -> JSONResponse:
     """Update a record entry in db.
 
     Args:
+        record_id (int): The record's id.
         record (schemas.RecordUpdate): The data to update the record.
-        db_record (models.Record): The db record if exists otherwise None.
-        db (Session): The db session.
+        db (DBSession): The db session.
+        if_match (str | None): The `If-Match` header.
 
     Raises:
-        HTTPException: Record not found.
+        HTTPException: Record not found or modified since `If-Match`.
 
     Returns:
-        schemas.Record: The updated record.
+        JSONResponse: The updated record.
     """
 
-    if db_record is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Record not found"
+    versions = if_match_versions(if_match, record_id)
+    db_record = None
+    if versions != []:
+        db_record = await run_db(
+            db, crud.update_record, record_id, record.dict(), versions
         )
 
-    for field, value in record.dict().items():
-        setattr(db_record, field, value)
-
-    # Commit the changes to the database session
-    db.commit()
+    if db_record is None:
+        # The cached copy, if any, is stale
+        await record_cache.apop(record_id)
+        raise await missing_record_error(db, record_id, versions)
 
     logging.debug("Updated record with id %d" % db_record.id)
 
-    return db_record
+    await record_cache.aset(db_record.id, db_record)
+
+    return ProfiledJSONResponse(
+        record_content(db_record),
+        headers={"ETag": record_etag(db_record.id, db_record.version)},
+    )
 
 
 @records_router.patch(
     "/{record_id}/", response_model=schemas.Record, status_code=status.HTTP_200_OK
 )
-def partial_update_record(
+async def partial_update_record(
+    record_id: int,
     record: schemas.RecordPartialUpdate,
-    db_record: Annotated[models.Record, Depends(get_record)],
-    db: Annotated[Session, Depends(get_db)],
-) -> schemas.Record:
+    db: Annotated[DBSession, Depends(get_db)],
+    if_match: str | None = Header(None),
+) -> JSONResponse:
     """Partially update a record entry in db.
 
     Args:
+        record_id (int): The record's id.
         record (schemas.RecordUpdate): The data to update the record.
-        db_record (models.Record): The db record if exists otherwise None.
-        db (Session): The db session.
+        db (DBSession): The db session.
+        if_match (str | None): The `If-Match` header.
 
     Raises:
-        HTTPException: Record not found.
+        HTTPException: Record not found or modified since `If-Match`.
 
     Returns:
-        schemas.Record: The updated record.
+        JSONResponse: The updated record.
     """
 
-    if db_record is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Record not found"
+    versions = if_match_versions(if_match, record_id)
+    db_record = None
+    if versions != []:
+        # Update the record fields with the values provided in the request body
+        db_record = await run_db(
+            db,
+            crud.update_record,
+            record_id,
+            record.dict(exclude_unset=True),
+            versions,
         )
 
-    # Update the record fields with the values provided in the request body
-    for field, value in record.dict(exclude_unset=True).items():
-        setattr(db_record, field, value)
-
-    # Commit the changes to the database session
-    db.commit()
+    if db_record is None:
+        # The cached copy, if any, is stale
+        await record_cache.apop(record_id)
+        raise await missing_record_error(db, record_id, versions)
 
     logging.debug("Partially updated record with id %d" % db_record.id)
 
-    return db_record
+    await record_cache.aset(db_record.id, db_record)
+
+    return ProfiledJSONResponse(
+        record_content(db_record),
+        headers={"ETag": record_etag(db_record.id, db_record.version)},
+    )
 
 
 @records_router.delete("/{record_id}/", status_code=status.HTTP_204_NO_CONTENT)
-def delete_record(
-    db_record: Annotated[models.Record, Depends(get_record)],
-    db: Annotated[Session, Depends(get_db)],
+async def delete_record(
+    record_id: int,
+    db: Annotated[DBSession, Depends(get_db)],
+    if_match: str | None = Header(None),
 ) -> None:
     """Delete a record from db.
 
     Args:
-        db_record (models.Record): The db record if exists otherwise None.
-        db (Session): The db session.
+        record_id (int): The record's id.
+        db (DBSession): The db session.
+        if_match (str | None): The `If-Match` header.
 
     Raises:
-        HTTPException: Record not found.
+        HTTPException: Record not found or modified since `If-Match`.
     """
 
-    if db_record is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Record not found"
-        )
+    versions = if_match_versions(if_match, record_id)
+    deleted = versions != [] and await run_db(
+        db, crud.delete_record, record_id, versions
+    )
+
+    if not deleted:
+        # The cached copy, if any, is stale
+        await record_cache.apop(record_id)
+        raise await missing_record_error(db, record_id, versions)
 
-    db.delete(db_record)
-    db.commit()
+    await record_cache.apop(record_id)
 
-    logging.debug("Deleted record with id %d" % db_record.id)
+    logging.debug("Deleted record with id %d" % record_id)
@@ -1,15 +1,33 @@
 """Module to add all schemas
 """
 
-from .user import User, UserAuth, Token
-from .record import Record, RecordCreate, RecordUpdate, RecordPartialUpdate
+from .user import User, UserAuth, Token, TokenRefresh
+from .record import (
+    Record,
+    RecordCreate,
+    RecordUpdate,
+    RecordPartialUpdate,
+    RecordFilters,
+    RecordBulkError,
+    RecordBulkCreateResult,
+    RecordSelection,
+    RecordBulkUpdate,
+    RecordBulkResult,
+)
 
 __all__ = [
     "User",
     "UserAuth",
     "Token",
+    "TokenRefresh",
     "Record",
     "RecordCreate",
     "RecordUpdate",
     "RecordPartialUpdate",
+    "RecordFilters",
+    "RecordBulkError",
+    "RecordBulkCreateResult",
+    "RecordSelection",
+    "RecordBulkUpdate",
+    "RecordBulkResult",
 ]
@@ -1,9 +1,10 @@
 """Module to add record schemas
 """
 
+from typing import Any
 from urllib.parse import urlparse
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, root_validator, validator
 
 
 class RecordBase(BaseModel):
@@ -30,7 +31,61 @@ class RecordPartialUpdate(RecordBase):
     title: str | None
     img: str | None
 
+    @validator("title", "img", pre=True)
+    def validate_not_null(cls, value):
+        # Fields can be left out, but records always have a title and an img
+        if value is None:
+            raise ValueError("Can not be null")
+        return value
+
 
 class Record(RecordBase):
     class Config:
         orm_mode = True
+
+
+class RecordFilters(BaseModel):
+    title: str | None
+    title_prefix: str | None
+    img_host: str | None
+    img_prefix: str | None
+    id_gte: int | None
+    id_lte: int | None
+
+
+class RecordBulkError(BaseModel):
+    index: int
+    errors: list[dict[str, Any]]
+
+
+class RecordBulkCreateResult(BaseModel):
+    ids: list[int]
+    errors: list[RecordBulkError] = []
+
+
+class RecordSelection(BaseModel):
+    ids: list[int] | None
+    title: str | None
+    img: str | None
+
+    @root_validator
+    def validate_not_empty(cls, values):
+        if all(value is None for value in values.values()):
+            raise ValueError("At least one of ids, title or img is required")
+        return values
+
+
+class RecordBulkUpdate(BaseModel):
+    where: RecordSelection
+    values: RecordPartialUpdate
+
+    @validator("values")
+    def validate_values(cls, value):
+        if not value.dict(exclude_unset=True):
+            raise ValueError("At least one field to update is required")
+        return value
+
+
+class RecordBulkResult(BaseModel):
+    count: int
+    ids: list[int]
@@ -22,3 +22,8 @@ class User(UserBase):
 class Token(BaseModel):
     jwt: str
     token_type: str
+    refresh_token: str | None = None
+
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
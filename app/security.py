@@ -0,0 +1,147 @@
+"""Module to hash and verify passwords.
+
+bcrypt is slow on purpose, so it runs in a dedicated process pool with its own
+concurrency limit: a burst of logins neither holds the event loop nor the
+threadpool shared with the other handlers.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from passlib.context import CryptContext
+
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.metrics import PASSWORD_HASH_REJECTED, PASSWORD_HASH_SECONDS
+
+
+T = TypeVar("T")
+
+# Hashes with another scheme or cost are flagged by verify_and_update
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """Runs password hashing in a process pool, with bounded concurrency.
+
+    At most `concurrency` operations run at the same time, the rest wait up to
+    `queue_timeout` seconds for a slot and then fail with a 503, so a login
+    storm sheds load instead of piling up requests.
+    """
+
+    def __init__(self, workers: int, concurrency: int, queue_timeout: float) -> None:
+        """
+        Args:
+            workers (int): Processes of the pool, 0 runs in the threadpool.
+            concurrency (int): Operations running at the same time.
+            queue_timeout (float): Seconds to wait for a free slot.
+        """
+
+        self.workers = workers
+        self.concurrency = concurrency
+        self.queue_timeout = queue_timeout
+        self._executor: Executor | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+    @property
+    def executor(self) -> Executor | None:
+        """The process pool, created on first use. None when workers is 0."""
+
+        if self._executor is None and self.workers > 0:
+            # Workers are spawned, forking a process with running threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        return self._executor
+
+    async def _run(self, operation: str, fn: Callable[..., T], *args: Any) -> T:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            PASSWORD_HASH_REJECTED.labels(operation=operation).inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent password checks, try again later",
+                headers={"Retry-After": str(max(1, round(self.queue_timeout)))},
+            )
+
+        try:
+            if self.executor is None:
+                return await run_in_threadpool(fn, *args)
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self._slots.release()
+            PASSWORD_HASH_SECONDS.labels(operation=operation).observe(
+                time.perf_counter() - start
+            )
+
+    async def hash(self, password: str) -> str:
+        """Hash a password.
+
+        Args:
+            password (str): The password.
+
+        Raises:
+            HTTPException: No slot was free in time.
+
+        Returns:
+            str: The hash.
+        """
+
+        return await self._run("hash", _hash, password)
+
+    async def verify(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """Verify a password, and rehash it if the hash is outdated.
+
+        Args:
+            password (str): The password.
+            hashed_password (str): The stored hash.
+
+        Raises:
+            HTTPException: No slot was free in time.
+
+        Returns:
+            tuple[bool, str | None]: Whether the password is valid, and the new
+            hash if it must be replaced.
+        """
+
+        return await self._run("verify", _verify_and_update, password, hashed_password)
+
+    def shutdown(self) -> None:
+        """Stop the process pool."""
+
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    concurrency=settings.PASSWORD_HASH_CONCURRENCY,
+    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,127 @@
+"""Module to serve the app in production.
+
+gunicorn imports the app once and forks `WEB_WORKERS` uvicorn workers, running
+on uvloop and httptools:
+    python -m app.server
+
+On SIGTERM each worker fails its readiness check for `WEB_DRAIN_SECONDS` while
+still serving, stops accepting connections, finishes its requests and closes
+its database pools. Workers still busy `WEB_GRACEFUL_TIMEOUT` seconds after the
+drain are killed.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import signal
+import sys
+from types import FrameType
+from typing import Any
+
+from fastapi import FastAPI
+from gunicorn.app.base import BaseApplication
+from gunicorn.arbiter import Arbiter
+from gunicorn.workers.base import Worker as BaseWorker
+from prometheus_client import multiprocess
+from uvicorn import Server
+from uvicorn.workers import UvicornWorker
+
+from app.config import settings
+from app.database import forget_inherited_connections
+from app.routers import health
+
+
+class DrainingServer(Server):
+    """uvicorn server that keeps serving for `WEB_DRAIN_SECONDS` after SIGTERM,
+    while the readiness check fails, before shutting down."""
+
+    def handle_exit(self, sig: int, frame: FrameType | None) -> None:
+        if sig == signal.SIGTERM and settings.WEB_DRAIN_SECONDS and not health.draining:
+            health.start_draining()
+            logging.info(
+                "Draining for %s seconds before shutting down"
+                % settings.WEB_DRAIN_SECONDS
+            )
+            asyncio.get_event_loop().call_later(
+                settings.WEB_DRAIN_SECONDS, super().handle_exit, sig, frame
+            )
+            return
+
+        # A second SIGTERM, or SIGINT and SIGQUIT, do not wait for the drain
+        health.start_draining()
+        super().handle_exit(sig, frame)
+
+
+class Worker(UvicornWorker):
+    """gunicorn worker running a DrainingServer on uvloop and httptools."""
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+    async def _serve(self) -> None:
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+
+def post_fork(arbiter: Arbiter, worker: BaseWorker) -> None:
+    # The engines were created when the master imported the app
+    forget_inherited_connections()
+
+
+def child_exit(arbiter: Arbiter, worker: BaseWorker) -> None:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def default_workers() -> int:
+    """Get the CPUs available to the process, one worker per CPU."""
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class Application(BaseApplication):
+    """gunicorn application serving the app, configured from the settings."""
+
+    def __init__(self, options: dict[str, Any] | None = None) -> None:
+        """
+        Args:
+            options (dict[str, Any] | None, optional): gunicorn settings overriding
+            the defaults. Defaults to None.
+        """
+
+        self.options = {
+            "bind": settings.WEB_BIND,
+            "workers": settings.WEB_WORKERS or default_workers(),
+            "worker_class": "app.server.Worker",
+            # Import the app once in the master, workers start faster and share
+            # its memory pages
+            "preload_app": True,
+            "graceful_timeout": math.ceil(
+                settings.WEB_DRAIN_SECONDS + settings.WEB_GRACEFUL_TIMEOUT
+            ),
+            "keepalive": 5,
+            "post_fork": post_fork,
+            "child_exit": child_exit,
+            **(options or {}),
+        }
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self) -> FastAPI:
+        from app.main import app
+
+        return app
+
+
+if __name__ == "__main__":
+    Application().run()
@@ -0,0 +1,5 @@
+"""Module to add all benchmarks
+
+Benchmarks are not collected by a plain `pytest` run. Run them with
+`python -m benchmarks.<name>`, and the load benchmark with `pytest benchmarks`.
+"""
@@ -0,0 +1,163 @@
+"""Fixtures of the load benchmark: a seeded database and a running server.
+
+The database is a fresh one from pytest-postgresql, or the one given with
+`--load-dsn`. The app is served by `app.server` in a subprocess, with the settings
+of the environment and `DATABASE_URI` pointing to that database.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+from alembic import command
+import httpx
+import pytest
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.migrate import alembic_config
+from app.models import Record, User
+from app.security import pwd_context
+
+from .load import DEFAULT_MIX, PASSWORD, parse_mix, user_email
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("load", "load benchmark")
+    group.addoption("--load-dsn", help="database to use instead of a temporary one")
+    group.addoption("--load-users", type=int, default=50, help="users to seed")
+    group.addoption("--load-records", type=int, default=10000, help="records to seed")
+    group.addoption(
+        "--load-concurrency", type=int, default=32, help="concurrent clients"
+    )
+    group.addoption(
+        "--load-duration", type=float, default=30, help="seconds the mix runs"
+    )
+    group.addoption("--load-workers", type=int, default=1, help="server workers")
+    group.addoption(
+        "--load-mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="operation weights, like list=40,retrieve=30,create=10",
+    )
+    group.addoption("--load-output", help="path to write the JSON report to")
+    group.addoption("--load-baseline", help="JSON report to compare against")
+    group.addoption(
+        "--load-tolerance",
+        type=float,
+        default=0.2,
+        help="accepted relative change against the baseline",
+    )
+
+
+@pytest.fixture
+def load_options(request: pytest.FixtureRequest) -> dict[str, Any]:
+    return {
+        name: request.config.getoption(f"--load-{name}")
+        for name in ("users", "records", "concurrency", "duration", "workers", "mix")
+    }
+
+
+@pytest.fixture
+def database_url(request: pytest.FixtureRequest) -> str:
+    if dsn := request.config.getoption("--load-dsn"):
+        return dsn
+
+    postgresql = request.getfixturevalue("postgresql")
+    info = postgresql.info
+
+    return f"postgresql://{info.user}:@{info.host}:{info.port}/{info.dbname}"
+
+
+@pytest.fixture
+def seeded(
+    database_url: str, load_options: dict[str, Any]
+) -> tuple[list[str], list[int]]:
+    """Create the missing users and records, return the users emails and the
+    ids of the records."""
+
+    engine = create_engine(database_url)
+    command.upgrade(alembic_config(database_url), "head")
+
+    emails = [user_email(i) for i in range(load_options["users"])]
+    hashed_password = pwd_context.hash(PASSWORD)
+
+    with Session(engine) as db:
+        existing = set(db.scalars(select(User.email).where(User.email.in_(emails))))
+        db.add_all(
+            User(email=email, hashed_password=hashed_password)
+            for email in emails
+            if email not in existing
+        )
+        db.commit()
+
+        missing = load_options["records"] - db.scalar(select(func.count(Record.id)))
+        rows = [
+            {"title": f"Record {i}", "img": f"http://benchmark.images.com/{i}.png"}
+            for i in range(missing)
+        ]
+        if rows:
+            crud.create_records(db, rows, batch_size=1000)
+
+        record_ids = list(
+            db.scalars(
+                select(Record.id).order_by(Record.id).limit(load_options["records"])
+            )
+        )
+
+    engine.dispose()
+
+    return emails, record_ids
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server(
+    database_url: str, seeded: tuple[list[str], list[int]], load_options: dict
+) -> Iterator[str]:
+    """Serve the app and return its base URL."""
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.server"],
+        cwd=ROOT,
+        env={
+            **os.environ,
+            "DATABASE_URI": database_url,
+            "WEB_BIND": f"127.0.0.1:{port}",
+            "WEB_WORKERS": str(load_options["workers"]),
+        },
+    )
+
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                pytest.fail(f"The server exited with {process.returncode}")
+            try:
+                httpx.get(f"{base_url}/health/ready").raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    pytest.fail("The server did not start in time")
+                time.sleep(0.2)
+
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
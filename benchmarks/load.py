@@ -0,0 +1,274 @@
+"""End-to-end load benchmark of the records and auth API.
+
+`--concurrency` clients, each logged in as one of the seeded users, run a mix
+of list, retrieve, create, update, delete and login requests against a
+running server for `--duration` seconds. The report has the requests per
+second and the p50/p95/p99 latencies of each operation, as JSON.
+
+The suite is run by pytest, which starts Postgres with pytest-postgresql,
+seeds it and serves the app with `app.server`, see `benchmarks/conftest.py`:
+    pytest benchmarks --load-output report.json
+    pytest benchmarks --load-baseline baseline.json
+
+Reports can also be compared afterwards, regressions make it exit with 1:
+    python -m benchmarks.load report.json baseline.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from typing import Any
+
+import httpx
+
+
+PASSWORD = "benchmark"
+
+# Relative weight of each operation in the mix
+DEFAULT_MIX = {
+    "list": 40,
+    "retrieve": 30,
+    "create": 10,
+    "update": 10,
+    "delete": 5,
+    "login": 5,
+}
+
+
+def user_email(index: int) -> str:
+    return f"benchmark{index}@example.com"
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    """Parse a mix like `list=40,retrieve=30`, missing operations are not run."""
+
+    mix = {}
+    for item in value.split(","):
+        operation, weight = item.split("=")
+        if operation not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation {operation}")
+        mix[operation] = int(weight)
+
+    return mix
+
+
+class Client:
+    """A logged in user running operations of the mix."""
+
+    def __init__(
+        self, http: httpx.AsyncClient, email: str, record_ids: list[int], seed: int
+    ) -> None:
+        self.http = http
+        self.email = email
+        self.record_ids = record_ids
+        self.created: list[int] = []
+        self.random = random.Random(seed)
+        self.headers: dict[str, str] = {}
+
+    async def login(self) -> httpx.Response:
+        response = await self.http.post(
+            "/api/v1/login/", json={"email": self.email, "password": PASSWORD}
+        )
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['jwt']}"}
+        return response
+
+    async def start(self, attempts: int = 10) -> None:
+        """Log in before the run, retrying while the server sheds the logins."""
+
+        for _ in range(attempts):
+            response = await self.login()
+            if response.status_code == 200:
+                return
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+        response.raise_for_status()
+
+    async def list(self) -> httpx.Response:
+        return await self.http.get("/api/v1/records/?limit=20", headers=self.headers)
+
+    async def retrieve(self) -> httpx.Response:
+        record_id = self.random.choice(self.record_ids)
+        return await self.http.get(
+            f"/api/v1/records/{record_id}/", headers=self.headers
+        )
+
+    async def create(self) -> httpx.Response:
+        data = {
+            "title": f"Load {self.random.random()}",
+            "img": "http://load.images.com/load.png",
+        }
+        response = await self.http.post(
+            "/api/v1/records/", json=data, headers=self.headers
+        )
+        if response.status_code == 201:
+            # ETags are W/"<id>-<version>"
+            self.created.append(int(response.headers["ETag"][3:].split("-")[0]))
+        return response
+
+    async def update(self) -> httpx.Response:
+        record_id = self.random.choice(self.record_ids)
+        data = {"title": f"Updated {self.random.random()}"}
+        return await self.http.patch(
+            f"/api/v1/records/{record_id}/", json=data, headers=self.headers
+        )
+
+    async def delete(self) -> httpx.Response:
+        # Only records created by this client, the seeded ones must stay
+        record_id = self.created.pop()
+        return await self.http.delete(
+            f"/api/v1/records/{record_id}/", headers=self.headers
+        )
+
+
+async def run(
+    base_url: str,
+    emails: list[str],
+    record_ids: list[int],
+    concurrency: int,
+    duration: float,
+    mix: dict[str, int],
+    seed: int = 0,
+) -> dict[str, list[tuple[float, bool]]]:
+    """Run the mix and return the latency in milliseconds and success of every
+    request, by operation."""
+
+    operations, weights = list(mix), list(mix.values())
+    samples: dict[str, list[tuple[float, bool]]] = defaultdict(list)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        clients = [
+            Client(http, emails[i % len(emails)], record_ids, seed + i)
+            for i in range(concurrency)
+        ]
+        await asyncio.gather(*(client.start() for client in clients))
+
+        deadline = time.perf_counter() + duration
+
+        async def client_loop(client: Client) -> None:
+            while time.perf_counter() < deadline:
+                operation = client.random.choices(operations, weights)[0]
+                if operation == "delete" and not client.created:
+                    operation = "create"
+
+                start = time.perf_counter()
+                try:
+                    response = await getattr(client, operation)()
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                samples[operation].append(((time.perf_counter() - start) * 1e3, ok))
+
+        await asyncio.gather(*(client_loop(client) for client in clients))
+
+    return samples
+
+
+def summarize(samples: list[tuple[float, bool]], duration: float) -> dict[str, Any]:
+    """Get the throughput, errors and latency percentiles of some requests."""
+
+    latencies = sorted(latency for latency, _ in samples)
+    if len(latencies) > 1:
+        quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+
+    return {
+        "requests": len(samples),
+        "errors": sum(not ok for _, ok in samples),
+        "rps": round(len(samples) / duration, 2),
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+    }
+
+
+def report(
+    samples: dict[str, list[tuple[float, bool]]],
+    duration: float,
+    config: dict[str, Any],
+) -> dict[str, Any]:
+    """Build the JSON report of a run.
+
+    Args:
+        samples (dict[str, list[tuple[float, bool]]]): What `run` returned.
+        duration (float): Seconds the mix ran.
+        config (dict[str, Any]): Parameters of the run, kept in the report.
+
+    Returns:
+        dict[str, Any]: The report, with the figures by operation and in total.
+    """
+
+    return {
+        "config": config,
+        "operations": {
+            operation: summarize(operation_samples, duration)
+            for operation, operation_samples in sorted(samples.items())
+        },
+        "total": summarize(
+            [sample for operation in samples.values() for sample in operation],
+            duration,
+        ),
+    }
+
+
+def compare(
+    current: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    """Find the regressions of a report against a baseline report.
+
+    An operation regresses when its throughput drops, or one of its latency
+    percentiles grows, by more than tolerance, or when it has errors the
+    baseline did not have.
+
+    Args:
+        current (dict[str, Any]): The report.
+        baseline (dict[str, Any]): The baseline report.
+        tolerance (float): Accepted relative change, 0.2 is 20%.
+
+    Returns:
+        list[str]: Description of each regression, empty if there is none.
+    """
+
+    regressions = []
+    for operation, base in baseline["operations"].items():
+        if (figures := current["operations"].get(operation)) is None:
+            continue
+
+        if figures["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{operation}: {figures['rps']} req/s, baseline {base['rps']}"
+            )
+        for percentile in ("p50_ms", "p95_ms", "p99_ms"):
+            if figures[percentile] > base[percentile] * (1 + tolerance):
+                regressions.append(
+                    f"{operation}: {percentile} {figures[percentile]}, "
+                    f"baseline {base[percentile]}"
+                )
+        if figures["errors"] and not base["errors"]:
+            regressions.append(f"{operation}: {figures['errors']} errors")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a load report to a baseline.")
+    parser.add_argument("report")
+    parser.add_argument("baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with open(args.report) as current, open(args.baseline) as baseline:
+        regressions = compare(json.load(current), json.load(baseline), args.tolerance)
+
+    for regression in regressions:
+        print(regression)
+
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,47 @@
+"""Load benchmark of the records and auth API, run with `pytest benchmarks`.
+"""
+
+import asyncio
+import json
+from typing import Any
+
+import pytest
+
+from . import load
+
+
+def test_mixed_workload(
+    request: pytest.FixtureRequest,
+    capsys: pytest.CaptureFixture,
+    server: str,
+    seeded: tuple[list[str], list[int]],
+    load_options: dict[str, Any],
+):
+    emails, record_ids = seeded
+    samples = asyncio.run(
+        load.run(
+            server,
+            emails,
+            record_ids,
+            load_options["concurrency"],
+            load_options["duration"],
+            load_options["mix"],
+        )
+    )
+    result = load.report(samples, load_options["duration"], load_options)
+
+    with capsys.disabled():
+        print(json.dumps(result, indent=2))
+
+    if output := request.config.getoption("--load-output"):
+        with open(output, "w") as file:
+            json.dump(result, file, indent=2)
+
+    if baseline_path := request.config.getoption("--load-baseline"):
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+
+        tolerance = request.config.getoption("--load-tolerance")
+        regressions = load.compare(result, baseline, tolerance)
+
+        assert not regressions, "Regressions:\n" + "\n".join(regressions)
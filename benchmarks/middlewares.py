@@ -0,0 +1,136 @@
+"""Micro-benchmark of the per-request overhead of the middleware stack.
+
+It compares an app without middlewares, the previous BaseHTTPMiddleware based
+AuthMiddleware/DatabaseSessionMiddleware and the current ASGI ones. Requests are
+anonymous and the handler does not touch the database, so only the middleware
+overhead is measured. The app is called directly, without a server.
+
+Usage:
+    python -m benchmarks.middlewares --requests 20000 --concurrency 1
+"""
+
+import asyncio
+import argparse
+import time
+
+from fastapi import FastAPI, Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+
+from app.database import SessionLocal
+from app.middlewares import AuthMiddleware, DatabaseSessionMiddleware
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    """AuthMiddleware as it was implemented with BaseHTTPMiddleware."""
+
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        request.state.user = None
+        return await call_next(request)
+
+
+class LegacyDatabaseSessionMiddleware(BaseHTTPMiddleware):
+    """DatabaseSessionMiddleware as it was implemented with BaseHTTPMiddleware."""
+
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        try:
+            request.state.db = SessionLocal()
+            response = await call_next(request)
+        finally:
+            request.state.db.close()
+        return response
+
+
+def build_app(auth_middleware=None, db_middleware=None) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/")
+    async def handler():
+        return {"test": "test"}
+
+    if auth_middleware:
+        app.add_middleware(auth_middleware)
+    if db_middleware:
+        app.add_middleware(db_middleware)
+
+    return app
+
+
+async def call(app: FastAPI) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/",
+        "raw_path": b"/",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"benchmark")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("benchmark", 80),
+    }
+
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            response_complete.set()
+
+    await app(scope, receive, send)
+
+
+async def run(app: FastAPI, requests: int, concurrency: int) -> float:
+    """Run the requests and return the mean time per request in microseconds."""
+
+    # Warm up the app, the middleware stack is built on the first call
+    for _ in range(100):
+        await call(app)
+
+    start = time.perf_counter()
+    for _ in range(requests // concurrency):
+        await asyncio.gather(*(call(app) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return elapsed / requests * 1e6
+
+
+async def main(requests: int, concurrency: int) -> None:
+    variants = {
+        "no middlewares": build_app(),
+        "BaseHTTPMiddleware": build_app(
+            LegacyAuthMiddleware, LegacyDatabaseSessionMiddleware
+        ),
+        "ASGI middleware": build_app(AuthMiddleware, DatabaseSessionMiddleware),
+    }
+
+    baseline = None
+    for name, app in variants.items():
+        per_request = await run(app, requests, concurrency)
+        baseline = baseline or per_request
+        print(
+            f"{name:<20} {per_request:8.1f} us/request"
+            f"  ({per_request - baseline:+7.1f} us overhead)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.concurrency))
@@ -1,7 +1,10 @@
 """
 """
 
+import asyncio
+
 import pytest
+from pytest_mock import MockerFixture
 from pytest_postgresql.factories import postgresql
 
 from passlib.context import CryptContext
@@ -9,12 +12,17 @@ from passlib.context import CryptContext
 from fastapi.testclient import TestClient
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.pool import NullPool
 
+from app.config import settings
 from app.main import app
 from app.models import User, Record
 from app.database import Base
+from app.dependencies import record_cache
+from app.middlewares.auth import user_cache
+from app.routers.v1.records import count_cache, estimate_cache
 
 
 @pytest.fixture
@@ -34,6 +42,36 @@ def db_session(postgresql) -> scoped_session:
         yield session
     finally:
         session.close()
+        # Caches outlive the database, ids are reused by the next test
+        record_cache.clear()
+        user_cache.clear()
+        count_cache.clear()
+        estimate_cache.clear()
+
+
+@pytest.fixture
+def async_session_local(
+    postgresql, db_session: scoped_session, mocker: MockerFixture
+) -> async_sessionmaker:
+    """Serve the requests with AsyncSessions of the test database, as with
+    `DATABASE_ASYNC`."""
+
+    connection = f"postgresql+asyncpg://{postgresql.info.user}:@{postgresql.info.host}:{postgresql.info.port}/{postgresql.info.dbname}"
+
+    # Each TestClient request runs in its own event loop, connections can not
+    # be pooled between them
+    engine = create_async_engine(connection, poolclass=NullPool)
+    session_local = async_sessionmaker(
+        autoflush=False, expire_on_commit=False, bind=engine
+    )
+    mocker.patch.object(settings, "DATABASE_ASYNC", True)
+    mocker.patch("app.middlewares.database_session.AsyncSessionLocal", session_local)
+    mocker.patch("app.database.async_engine", engine)
+
+    try:
+        yield session_local
+    finally:
+        asyncio.run(engine.dispose())
 
 
 @pytest.fixture
@@ -0,0 +1,176 @@
+"""Module to add the smoke tests of the request path with `DATABASE_ASYNC`.
+"""
+
+import json
+
+from pytest_mock import MockerFixture
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import scoped_session
+
+from . import client, user, record, db_session, async_session_local
+
+from app.database import Replica, replicas
+from app.models import User, Record, RefreshToken
+
+
+class TestAsyncRecordRouter:
+    def test_record_list(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        async_session_local: async_sessionmaker,
+    ):
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/?count=exact", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["X-Total-Count"] == "1"
+        assert [item["title"] for item in response.json()] == [record.title]
+
+    def test_record_retrieve(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        async_session_local: async_sessionmaker,
+    ):
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get(f"/api/v1/records/{record.id}", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["title"] == record.title
+
+    def test_record_create_update_delete(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        async_session_local: async_sessionmaker,
+    ):
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        data = {"title": "Fake Title", "img": "http://fake.img.com"}
+        response = client.post("/api/v1/records/", json=data, headers=headers)
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+        record_id = db_session.query(Record).filter_by(title="Fake Title").one().id
+        response = client.patch(
+            f"/api/v1/records/{record_id}", json={"title": "New"}, headers=headers
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["title"] == "New"
+        assert db_session.get(Record, record_id).title == "New"
+
+        response = client.delete(f"/api/v1/records/{record_id}", headers=headers)
+
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        db_session.expire_all()
+
+        assert db_session.get(Record, record_id) is None
+
+    def test_record_bulk_create(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        async_session_local: async_sessionmaker,
+    ):
+        data = [
+            {"title": f"Fake Title {i}", "img": "http://fake.img.com"} for i in range(3)
+        ]
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.post(
+            "/api/v1/records/bulk/?batch_size=2", json=data, headers=headers
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(response.json()["ids"]) == 3
+        assert db_session.query(Record).count() == 3
+
+    def test_record_export(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        async_session_local: async_sessionmaker,
+        mocker: MockerFixture,
+    ):
+        mocker.patch("app.config.settings.RECORDS_EXPORT_BATCH_SIZE", 2)
+        db_session.add_all(
+            Record(id=i, title=f"title {i}", img="http://test.record.image.com")
+            for i in range(1, 6)
+        )
+        db_session.commit()
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/export/", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        assert [line["title"] for line in lines] == [f"title {i}" for i in range(1, 6)]
+
+    def test_session_closed(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        async_session_local: async_sessionmaker,
+        mocker: MockerFixture,
+    ):
+        close = mocker.spy(AsyncSession, "close")
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/export/", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        close.assert_called_once()
+
+    def test_replica_down(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        async_session_local: async_sessionmaker,
+        mocker: MockerFixture,
+    ):
+        replica = Replica(
+            "replica-test", "postgresql://postgres@127.0.0.1:1/missing", 10
+        )
+        mocker.patch.object(replicas, "replicas", [replica])
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get(f"/api/v1/records/{record.id}", headers=headers)
+
+        # The read is retried on the primary and the replica is skipped
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["title"] == record.title
+        assert not replica.available
+
+
+class TestAsyncAuthRouter:
+    def test_login_and_refresh(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        async_session_local: async_sessionmaker,
+    ):
+        data = {"email": user.email, "password": "123456"}
+        response = client.post("/api/v1/login/", json=data)
+
+        assert response.status_code == status.HTTP_200_OK
+
+        data = {"refresh_token": response.json()["refresh_token"]}
+        response = client.post("/api/v1/token/refresh/", json=data)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert db_session.query(RefreshToken).count() == 2
@@ -0,0 +1,187 @@
+"""Module to add all tests for caches.
+"""
+
+import asyncio
+
+import pytest
+import redis
+
+from app.cache import TTLCache, InMemoryStore, SharedCache, create_cache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTTLCache:
+    def test_get_set(self):
+        cache = TTLCache("test", maxsize=2, ttl=10)
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("b", 2) == 2
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache("test", maxsize=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert len(cache) == 2
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_entries_expire(self):
+        timer = FakeTimer()
+        cache = TTLCache("test", maxsize=2, ttl=10, timer=timer)
+        cache.set("a", 1)
+
+        timer.now = 9
+        assert cache.get("a") == 1
+
+        timer.now = 10
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_pop(self):
+        cache = TTLCache("test", maxsize=2, ttl=10)
+        cache.set("a", 1)
+        cache.pop("a")
+        cache.pop("missing")
+
+        assert cache.get("a") is None
+
+    def test_disabled(self):
+        cache = TTLCache("test", maxsize=0, ttl=10)
+        cache.set("a", 1)
+
+        assert cache.get("a") is None
+
+    def test_hit_ratio(self):
+        cache = TTLCache("test", maxsize=2, ttl=10)
+
+        assert cache.hit_ratio == 0.0
+
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+
+        assert cache.hit_ratio == 0.75
+
+
+class FailingStore:
+    def get(self, name: str):
+        raise ConnectionError()
+
+    def set(self, name: str, value: bytes, ex: int | None = None):
+        raise ConnectionError()
+
+    def delete(self, *names: str):
+        raise ConnectionError()
+
+
+class TestSharedCache:
+    def test_get_set(self):
+        cache = SharedCache("test", InMemoryStore(), ttl=10)
+        cache.set("a", {"id": 1})
+
+        assert cache.get("a") == {"id": 1}
+        assert cache.get("b") is None
+        assert cache.hit_ratio == 0.5
+
+    def test_shared_by_caches_with_the_same_store(self):
+        store = InMemoryStore()
+        cache = SharedCache("test", store, ttl=10)
+        other = SharedCache("test", store, ttl=10)
+        cache.set("a", 1)
+
+        assert other.get("a") == 1
+
+        other.pop("a")
+
+        assert cache.get("a") is None
+
+    def test_entries_expire(self):
+        timer = FakeTimer()
+        cache = SharedCache("test", InMemoryStore(timer=timer), ttl=10)
+        cache.set("a", 1)
+
+        timer.now = 10
+        assert cache.get("a") is None
+
+    def test_pop_many_and_clear(self):
+        store = InMemoryStore()
+        cache = SharedCache("test", store, ttl=10)
+        other = SharedCache("other", store, ttl=10)
+        for key in range(3):
+            cache.set(key, key)
+        other.set(0, 0)
+
+        cache.pop_many([0, 1])
+
+        assert cache.get(0) is None
+        assert cache.get(2) == 2
+
+        cache.clear()
+
+        assert cache.get(2) is None
+        assert other.get(0) == 0
+
+    def test_failing_store(self):
+        cache = SharedCache("test", FailingStore(), ttl=10)
+        cache.set("a", 1)
+
+        assert cache.get("a") is None
+
+        # The write invalidating the entry is done, it expires with the TTL
+        cache.pop("a")
+        cache.pop_many(["a", "b"])
+
+    def test_async(self):
+        cache = SharedCache("test", InMemoryStore(), ttl=10)
+
+        async def run():
+            await cache.aset("a", 1)
+            await cache.aset("b", 2)
+            assert await cache.aget("a") == 1
+            await cache.apop("a")
+            await cache.apop_many(key for key in ["b"])
+            assert await cache.aget("b", "default") == "default"
+
+        asyncio.run(run())
+
+
+class TestCreateCache:
+    def test_backends(self):
+        assert isinstance(create_cache("test", "local", maxsize=1, ttl=1), TTLCache)
+        assert isinstance(
+            create_cache("test", "shared", maxsize=1, ttl=1, client=InMemoryStore()),
+            SharedCache,
+        )
+        assert isinstance(create_cache("test", "shared", maxsize=0, ttl=1), TTLCache)
+
+    def test_shared_url(self):
+        cache = create_cache(
+            "test",
+            "shared",
+            maxsize=1,
+            ttl=1,
+            url="redis://localhost:6379/0",
+            timeout=1,
+        )
+
+        assert isinstance(cache.client, redis.Redis)
+        assert cache.client.connection_pool.connection_kwargs["socket_timeout"] == 1
+
+    def test_shared_without_store(self):
+        with pytest.raises(ValueError):
+            create_cache("test", "shared", maxsize=1, ttl=1)
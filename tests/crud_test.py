@@ -0,0 +1,42 @@
+"""Module to add all tests for crud helpers that do not need a database.
+"""
+
+import pytest
+
+from app.crud.record import like_prefix, list_sort_supported
+from app.crud.refresh_token import hash_refresh_token
+from app.schemas import RecordFilters
+
+
+class TestRecordListHelpers:
+    @pytest.mark.parametrize(
+        "filters,sort,supported",
+        [
+            ({}, "id", True),
+            ({}, "-title", True),
+            ({"id_gte": 1, "id_lte": 10}, "-id", True),
+            ({"id_gte": 1}, "title", False),
+            ({"title": "test", "id_gte": 1}, "title", True),
+            ({"title_prefix": "te"}, "-title", True),
+            ({"img_host": "example.com"}, "id", True),
+            ({"img_host": "example.com"}, "title", False),
+            ({"img_prefix": "http://"}, "title", False),
+            ({"title": "test", "img_host": "example.com"}, "id", False),
+        ],
+    )
+    def test_list_sort_supported(self, filters: dict, sort: str, supported: bool):
+        assert list_sort_supported(RecordFilters(**filters), sort) is supported
+
+    def test_like_prefix(self):
+        assert like_prefix("te") == "te%"
+        assert like_prefix("50%_\\") == "50\\%\\_\\\\%"
+
+
+class TestRefreshTokenHelpers:
+    def test_hash_refresh_token(self):
+        token_hash = hash_refresh_token("token")
+
+        assert token_hash == hash_refresh_token("token")
+        assert token_hash != hash_refresh_token("other token")
+        assert len(token_hash) == 64
+        assert "token" not in token_hash
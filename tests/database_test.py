@@ -0,0 +1,123 @@
+"""Module to add all tests for the database pool helpers.
+"""
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from prometheus_client import REGISTRY
+
+from sqlalchemy import Engine, create_engine, exc, text
+
+from app.database import (
+    TimedQueuePool,
+    async_engine,
+    engine,
+    forget_inherited_connections,
+    ping,
+    track_statements,
+    warm_pool,
+)
+
+
+@pytest.fixture
+def pool_engine(tmp_path: Path) -> Engine:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=2,
+        max_overflow=1,
+        pool_timeout=0.1,
+    )
+    engine.pool.metric_label = "test"
+
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+def sample(name: str) -> float | None:
+    return REGISTRY.get_sample_value(name, {"engine": "test"})
+
+
+class TestPool:
+    def test_warm_pool(self, pool_engine: Engine):
+        asyncio.run(warm_pool(pool_engine, 2))
+
+        assert pool_engine.pool.checkedin() == 2
+        assert sample("db_pool_checked_in") == 2
+        assert sample("db_pool_checked_out") == 0
+
+    def test_pool_gauges(self, pool_engine: Engine):
+        connections = [pool_engine.connect() for _ in range(3)]
+
+        assert sample("db_pool_checked_out") == 3
+        assert sample("db_pool_overflow") == 1
+
+        for connection in connections:
+            connection.close()
+
+        assert sample("db_pool_checked_out") == 0
+        assert sample("db_pool_overflow") == 0
+        assert sample("db_pool_checked_in") == 2
+
+    def test_pool_gauges_dispose(self, pool_engine: Engine):
+        pool_engine.connect().close()
+
+        assert sample("db_pool_checked_in") == 1
+
+        pool_engine.dispose()
+
+        assert pool_engine.pool.metric_label == "test"
+        assert sample("db_pool_checked_in") == 0
+
+    def test_checkout_timeout(self, pool_engine: Engine, mocker):
+        mocker.patch.object(TimedQueuePool, "metric_label", "test")
+        connections = [pool_engine.connect() for _ in range(3)]
+        checkouts = sample("db_pool_checkout_seconds_count")
+
+        with pytest.raises(exc.TimeoutError):
+            pool_engine.connect()
+
+        assert sample("db_pool_checkout_seconds_count") == checkouts + 1
+        assert sample("db_pool_timeouts_total") == 1
+
+        for connection in connections:
+            connection.close()
+
+    def test_ping(self, pool_engine: Engine):
+        asyncio.run(ping(pool_engine))
+
+        assert pool_engine.pool.checkedin() == 1
+
+    def test_forget_inherited_connections(self):
+        pool, async_pool = engine.pool, async_engine.pool
+
+        forget_inherited_connections()
+
+        assert engine.pool is not pool
+        assert async_engine.pool is not async_pool
+        assert engine.pool.metric_label == "sync"
+
+
+class TestStatements:
+    def test_track_statements(self, pool_engine: Engine):
+        track_statements(pool_engine, "test")
+
+        with pool_engine.connect() as connection:
+            connection.execute(text("CREATE TABLE items (id INTEGER)"))
+            connection.execute(text("INSERT INTO items VALUES (1)"))
+            connection.execute(text("SELECT id FROM items")).all()
+            connection.execute(text("select id from items")).all()
+
+        def count(operation: str) -> float:
+            return REGISTRY.get_sample_value(
+                "sql_statement_seconds_count",
+                {"engine": "test", "operation": operation},
+            )
+
+        assert count("SELECT") == 2
+        assert count("INSERT") == 1
+        assert count("OTHER") == 1
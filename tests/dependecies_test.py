@@ -1,6 +1,8 @@
 """Module to add all tests for dependecies.
 """
 
+import asyncio
+
 import pytest
 
 from fastapi import Request, HTTPException
@@ -10,6 +12,7 @@ from sqlalchemy.orm import scoped_session
 from . import user, db_session, record
 
 from app.models import User, Record
+from app.database import LazySession
 from app.schemas import UserAuth
 from app.dependencies import (
     get_current_user,
@@ -44,17 +47,26 @@ class TestDatabaseDependencies:
     def test_get_db(self, db_session: scoped_session):
         request = Request(scope={"type": "http"})
 
-        request.state.db = db_session
+        request.state.db = LazySession(lambda: db_session)
 
+        assert not request.state.db.opened
         assert get_db(request=request) == db_session
+        assert request.state.db.opened
 
 
 class TestRecordDependencies:
     def test_get_record(self, record: Record, db_session: scoped_session):
-        assert get_record(record_id=record.id, db=db_session) == record
+        db_record = asyncio.run(get_record(record_id=record.id, db=db_session))
+
+        assert db_record.id == record.id
+        assert db_record.title == record.title
+        assert db_record.img == record.img
+
+    def test_get_record_not_found(self, db_session: scoped_session):
+        assert asyncio.run(get_record(record_id=1000, db=db_session)) is None
 
 
 class TestUserDependencies:
     def test_get_record(self, user: User, db_session: scoped_session):
         user_auth = UserAuth(email=user.email, password="password")
-        assert get_user(user=user_auth, db=db_session) == user
+        assert asyncio.run(get_user(user=user_auth, db=db_session)) == user
@@ -0,0 +1,52 @@
+"""Module to add all tests for ETag helpers.
+"""
+
+from collections import namedtuple
+
+import pytest
+
+from app.etags import record_etag, records_etag, etag_matches, if_match_versions
+
+
+RecordRow = namedtuple("RecordRow", ["id", "version"])
+
+
+class TestETags:
+    def test_record_etag(self):
+        assert record_etag(1, 2) == 'W/"1-2"'
+
+    def test_records_etag(self):
+        etag = records_etag([RecordRow(1, 1), RecordRow(2, 1)])
+
+        assert etag.startswith('W/"')
+        assert etag == records_etag([RecordRow(1, 1), RecordRow(2, 1)])
+        assert etag != records_etag([RecordRow(1, 1), RecordRow(2, 2)])
+        assert etag != records_etag([RecordRow(1, 1)])
+
+    @pytest.mark.parametrize(
+        "header,matches",
+        [
+            (None, False),
+            ('W/"1-2"', True),
+            ('"1-2"', True),
+            ('W/"1-1", W/"1-2"', True),
+            ("*", True),
+            ('W/"1-1"', False),
+        ],
+    )
+    def test_etag_matches(self, header: str | None, matches: bool):
+        assert etag_matches(header, record_etag(1, 2)) is matches
+
+    @pytest.mark.parametrize(
+        "header,versions",
+        [
+            (None, None),
+            ("*", None),
+            ('W/"1-2"', [2]),
+            ('"1-2", W/"1-3", W/"2-4"', [2, 3]),
+            ('W/"2-4"', []),
+            ('"garbage"', []),
+        ],
+    )
+    def test_if_match_versions(self, header: str | None, versions: list[int] | None):
+        assert if_match_versions(header, 1) == versions
@@ -0,0 +1,62 @@
+"""Module to add all tests for the metrics handler.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+
+# Worker process holding a connection of a test pool, or scraping /metrics too
+WORKER = """
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from app.database import TimedQueuePool
+from app.main import app
+
+engine = create_engine(sys.argv[1], poolclass=TimedQueuePool, pool_size=2)
+engine.pool.metric_label = "test"
+connection = engine.connect()
+
+if sys.argv[2] == "scrape":
+    print(TestClient(app).get("/metrics").text)
+else:
+    # Keep the connection until the test closes stdin
+    print("ready", flush=True)
+    sys.stdin.read()
+"""
+
+
+def start_worker(tmp_path: Path, action: str) -> subprocess.Popen:
+    multiproc_dir = tmp_path / "prometheus"
+    multiproc_dir.mkdir(exist_ok=True)
+
+    return subprocess.Popen(
+        [sys.executable, "-c", WORKER, f"sqlite:///{tmp_path / 'pool.db'}", action],
+        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir)},
+        cwd=Path(__file__).parent.parent,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+
+class TestMetricsRouter:
+    def test_multiprocess_pool_gauges(self, tmp_path: Path):
+        worker = start_worker(tmp_path, "checkout")
+        try:
+            assert worker.stdout.readline() == "ready\n"
+
+            scraper = start_worker(tmp_path, "scrape")
+            metrics, _ = scraper.communicate(timeout=60)
+        finally:
+            worker.communicate(timeout=60)
+
+        assert scraper.returncode == 0
+        # Summed over the two live workers, without a pid label
+        assert 'db_pool_checked_out{engine="test"} 2.0' in metrics
+        assert 'db_pool_checked_in{engine="test"} 0.0' in metrics
+        assert 'db_pool_overflow{engine="test"} 0.0' in metrics
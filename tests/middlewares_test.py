@@ -1,19 +1,43 @@
 """Module to add all tests for middlewares.
 """
 
+import asyncio
+import gzip
+import zlib
+from pathlib import Path
+
 import pytest
+import zstandard
+from prometheus_client import REGISTRY
 from pytest_mock import MockerFixture
 
-from fastapi import FastAPI, Request
+from fastapi import APIRouter, FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.testclient import TestClient
 
-from sqlalchemy.orm import scoped_session, Session
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import scoped_session, sessionmaker, Session
 
 from . import user, db_session
 
 from app.models import User
-from app.database import SessionLocal
-from app.middlewares import AuthMiddleware, DatabaseSessionMiddleware
+from app.config import settings
+from app.database import SessionLocal, Replica, ReplicaSet, run_db
+from app.dependencies import get_db
+from app.middlewares import (
+    AdmissionControlMiddleware,
+    AuthMiddleware,
+    CompressionMiddleware,
+    DatabaseSessionMiddleware,
+    InstrumentedRoute,
+    MetricsMiddleware,
+)
+from app.middlewares.admission import AdaptiveLimiter, Overloaded, default_groups
+from app.middlewares import compression
+from app.middlewares.auth import user_cache
+from app.middlewares.compression import negotiate
+from app.middlewares.database_session import PRIMARY_COOKIE
+from app.routers import metrics_router
 
 
 @pytest.fixture
@@ -67,6 +91,14 @@ class TestAuthMiddleware:
         response = client.get("/", headers=headers)
         assert response.status_code == 401
 
+    def test_auth_middleware_malformed_auth_header(
+        self, client: TestClient, auth_middleware
+    ):
+        headers = {"Authorization": "Bearer"}
+        response = client.get("/", headers=headers)
+        assert response.status_code == 401
+        assert response.headers["WWW-Authenticate"] == "Bearer"
+
     def test_auth_middleware_valid_jwt(
         self,
         mocker: MockerFixture,
@@ -90,6 +122,66 @@ class TestAuthMiddleware:
         response = client.get("/me", headers=headers)
         assert response.status_code == 200
 
+    def test_auth_middleware_cached_user(
+        self,
+        mocker: MockerFixture,
+        app: FastAPI,
+        client: TestClient,
+        all_middlewares,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        user = User(id=1000, email="cached@example.com")
+        user_cache.set(user.id, user)
+
+        @app.get("/me")
+        async def get_me(request: Request):
+            assert request.state.user is user
+            return {"test": "test"}
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/me", headers=headers)
+        user_cache.pop(user.id)
+
+        assert response.status_code == 200
+        mock_session_local.assert_not_called()
+
+    def test_auth_middleware_trust_jwt_claims(
+        self,
+        mocker: MockerFixture,
+        app: FastAPI,
+        client: TestClient,
+        all_middlewares,
+    ):
+        mocker.patch.object(settings, "AUTH_TRUST_JWT_CLAIMS", True)
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        user = User(id=1001, email="claims@example.com")
+
+        @app.get("/me")
+        async def get_me(request: Request):
+            assert request.state.user.id == user.id
+            assert request.state.user.email == user.email
+            return {"test": "test"}
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/me", headers=headers)
+
+        assert response.status_code == 200
+        mock_session_local.assert_not_called()
+
+    def test_user_cache_invalidated_on_update(
+        self, user: User, db_session: scoped_session
+    ):
+        user_cache.set(user.id, user)
+
+        user.email = "updated@example.com"
+        db_session.commit()
+
+        assert user_cache.get(user.id) is None
+
 
 class TestDatabaseSessionMiddleware:
     def test_data_base_session_middleware(
@@ -97,8 +189,439 @@ class TestDatabaseSessionMiddleware:
     ):
         @app.get("/db")
         async def db(request: Request):
-            assert isinstance(request.state.db, Session)
+            assert isinstance(get_db(request), Session)
             return {"test": "test"}
 
         response = client.get("/db")
         assert response.status_code == 200
+
+    def test_data_base_session_middleware_lazy_session(
+        self,
+        mocker: MockerFixture,
+        app: FastAPI,
+        client: TestClient,
+        database_session_middleware,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+
+        response = client.get("/")
+        assert response.status_code == 200
+        mock_session_local.assert_not_called()
+
+    def test_data_base_session_middleware_streaming_response(
+        self,
+        mocker: MockerFixture,
+        app: FastAPI,
+        client: TestClient,
+        database_session_middleware,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        session = mock_session_local.return_value
+
+        @app.get("/stream")
+        async def stream(request: Request):
+            get_db(request)
+
+            def chunks():
+                for chunk in ("a", "b", "c"):
+                    # The session must stay open until the whole body is sent
+                    session.close.assert_not_called()
+                    yield chunk
+
+            return StreamingResponse(chunks())
+
+        response = client.get("/stream")
+        assert response.status_code == 200
+        assert response.text == "abc"
+        session.close.assert_called_once()
+
+    def test_data_base_session_middleware_replicas(
+        self, tmp_path: Path, app: FastAPI, client: TestClient
+    ):
+        replica = Replica("replica-test", f"sqlite:///{tmp_path / 'replica.db'}", 10)
+        app.add_middleware(DatabaseSessionMiddleware, replica_set=ReplicaSet([replica]))
+
+        @app.get("/db")
+        async def read(request: Request):
+            return {"replica": get_db(request).bind is replica.engine}
+
+        @app.post("/db")
+        async def write(request: Request):
+            return {"replica": get_db(request).bind is replica.engine}
+
+        response = client.get("/db")
+
+        assert response.json() == {"replica": True}
+        assert PRIMARY_COOKIE not in response.cookies
+
+        response = client.post("/db")
+
+        assert response.json() == {"replica": False}
+        assert PRIMARY_COOKIE in response.cookies
+
+        # The client reads its writes from the primary
+        response = client.get("/db")
+
+        assert response.json() == {"replica": False}
+
+    def test_data_base_session_middleware_replica_down(
+        self, mocker: MockerFixture, tmp_path: Path, app: FastAPI, client: TestClient
+    ):
+        primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+        mocker.patch("app.database.engine", primary)
+        mocker.patch(
+            "app.middlewares.database_session.SessionLocal",
+            sessionmaker(bind=primary),
+        )
+        replica = Replica("replica-test", f"sqlite:///{tmp_path / 'missing/db'}", 10)
+        app.add_middleware(DatabaseSessionMiddleware, replica_set=ReplicaSet([replica]))
+
+        @app.get("/db")
+        async def read(request: Request):
+            db = get_db(request)
+            value = await run_db(db, lambda db: db.execute(text("SELECT 1")).scalar())
+            return {"value": value, "primary": db.bind is primary}
+
+        # The read is retried on the primary and the replica is skipped
+        for _ in range(2):
+            response = client.get("/db")
+
+            assert response.json() == {"value": 1, "primary": True}
+            assert not replica.available
+
+        primary.dispose()
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestAdaptiveLimiter:
+    def test_limit_adapts_to_latency(self):
+        timer = FakeTimer()
+        limiter = AdaptiveLimiter(
+            "test", max_limit=8, target_latency=1, queue_timeout=1, timer=timer
+        )
+
+        assert limiter.limit == 2
+
+        limiter.in_flight = 2
+        for _ in range(4):
+            limiter.observe(0.1)
+
+        assert limiter.limit == pytest.approx(3.5, abs=0.1)
+
+        # Slow responses decrease the limit once per target latency
+        limiter.observe(2)
+        limiter.observe(2)
+
+        assert limiter.limit == pytest.approx(3.5 * 0.9, abs=0.1)
+
+        timer.now = 1
+        limiter.observe(2)
+
+        assert limiter.limit == pytest.approx(3.5 * 0.81, abs=0.1)
+
+    def test_queue_and_shed(self):
+        limiter = AdaptiveLimiter(
+            "test", max_limit=1, target_latency=1, queue_timeout=0.05, initial_limit=1
+        )
+
+        async def scenario():
+            await limiter.acquire()
+
+            # The queue has one place, the waiter times out
+            with pytest.raises(Overloaded) as cm:
+                await limiter.acquire()
+            assert cm.value.reason == "timeout"
+
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            assert limiter.queue_depth == 1
+
+            with pytest.raises(Overloaded) as cm:
+                await limiter.acquire()
+            assert cm.value.reason == "queue_full"
+
+            # The slot is handed over to the waiter
+            limiter.release()
+            await waiter
+            assert limiter.in_flight == 1
+            assert limiter.queue_depth == 0
+
+            limiter.release()
+            assert limiter.in_flight == 0
+
+        asyncio.run(scenario())
+
+
+class TestAdmissionControlMiddleware:
+    def test_admission_control_middleware(self, app: FastAPI, client: TestClient):
+        limiter = AdaptiveLimiter(
+            "test", max_limit=1, target_latency=1, queue_timeout=1, initial_limit=1
+        )
+        app.add_middleware(AdmissionControlMiddleware, groups=[(("/",), limiter)])
+
+        response = client.get("/")
+
+        assert response.status_code == 200
+        assert limiter.in_flight == 0
+
+    def test_admission_control_middleware_sheds_load(
+        self, app: FastAPI, client: TestClient
+    ):
+        limiter = AdaptiveLimiter(
+            "test", max_limit=1, target_latency=1, queue_timeout=3, initial_limit=1
+        )
+        limiter.in_flight = 1
+        limiter._waiters.append(None)
+        app.add_middleware(
+            AdmissionControlMiddleware, groups=[(("/limited",), limiter)]
+        )
+
+        response = client.get("/limited")
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+
+        # Paths out of the groups are not limited
+        response = client.get("/")
+
+        assert response.status_code == 200
+
+    def test_admission_control_middleware_export_group(
+        self, app: FastAPI, client: TestClient
+    ):
+        groups = default_groups()
+        limiters = {limiter.name: limiter for _, limiter in groups}
+        in_flight = []
+
+        @app.get("/api/v1/records/export/")
+        async def export():
+            async def chunks():
+                for _ in range(3):
+                    in_flight.append(
+                        (limiters["export"].in_flight, limiters["records"].in_flight)
+                    )
+                    yield "{}\n"
+
+            return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+        app.add_middleware(AdmissionControlMiddleware, groups=groups)
+
+        response = client.get("/api/v1/records/export/")
+
+        assert response.status_code == 200
+        # The stream holds an export slot, records requests keep all theirs
+        assert in_flight == [(1, 0)] * 3
+        assert limiters["export"].in_flight == 0
+
+
+class TestMetricsMiddleware:
+    def test_metrics_middleware(self, app: FastAPI, client: TestClient):
+        router = APIRouter(route_class=InstrumentedRoute)
+
+        @router.get("/items/{item_id}")
+        async def item(item_id: int):
+            return {"test": "test"}
+
+        app.include_router(router)
+        app.include_router(metrics_router)
+        app.add_middleware(MetricsMiddleware)
+
+        assert client.get("/items/1").status_code == 200
+        assert client.get("/items/2").status_code == 200
+        assert client.get("/missing").status_code == 404
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert (
+            'http_responses_total{method="GET",route="/items/{item_id}",status="200"} 2.0'
+            in response.text
+        )
+        assert (
+            'http_requests_in_flight{method="GET",route="/items/{item_id}"} 0.0'
+            in response.text
+        )
+        assert 'route="unmatched",status="404"' in response.text
+
+
+BODY = "record " * 1000
+
+
+@pytest.fixture
+def compression_app(app: FastAPI) -> FastAPI:
+    @app.get("/large")
+    async def large():
+        return PlainTextResponse(BODY, headers={"ETag": '"v1"'})
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(10):
+                yield BODY
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.get("/image")
+    async def image():
+        return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+    return app
+
+
+class TestCompressionMiddleware:
+    def test_negotiate(self):
+        encodings = ("zstd", "br", "gzip")
+
+        assert negotiate("gzip, deflate, br", encodings) == "br"
+        assert negotiate("gzip, br;q=0.5", encodings) == "gzip"
+        assert negotiate("GZIP;q=0.2, zstd;q=0.2", encodings) == "zstd"
+        assert negotiate("*", encodings) == "zstd"
+        assert negotiate("zstd;q=0, *", encodings) == "br"
+        assert negotiate("br;q=0, *;q=0.1", ("br", "gzip")) == "gzip"
+        assert negotiate("identity", encodings) is None
+        assert negotiate("gzip;q=0", encodings) is None
+        assert negotiate("", encodings) is None
+
+    def test_compression_middleware(self, compression_app: FastAPI, client: TestClient):
+        compression_app.add_middleware(CompressionMiddleware, min_size=100)
+        saved_before = (
+            REGISTRY.get_sample_value(
+                "http_compression_saved_bytes_total", {"encoding": "gzip"}
+            )
+            or 0
+        )
+
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert response.headers["ETag"] == 'W/"v1"'
+        assert int(response.headers["Content-Length"]) < 1000
+        assert response.text == BODY
+
+        saved = REGISTRY.get_sample_value(
+            "http_compression_saved_bytes_total", {"encoding": "gzip"}
+        )
+        assert saved - saved_before == len(BODY) - int(
+            response.headers["Content-Length"]
+        )
+
+    def test_compression_middleware_brotli(
+        self, compression_app: FastAPI, client: TestClient
+    ):
+        compression_app.add_middleware(CompressionMiddleware, min_size=100)
+
+        response = client.get("/large", headers={"Accept-Encoding": "gzip, br"})
+
+        assert response.headers["Content-Encoding"] == "br"
+        assert response.text == BODY
+
+    def test_compression_middleware_zstd(
+        self, compression_app: FastAPI, client: TestClient
+    ):
+        compression_app.add_middleware(CompressionMiddleware, min_size=100)
+
+        with client.stream(
+            "GET", "/large", headers={"Accept-Encoding": "zstd, br, gzip"}
+        ) as response:
+            body = b"".join(response.iter_raw())
+
+        assert response.headers["Content-Encoding"] == "zstd"
+        assert len(body) < len(BODY)
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        assert decompressor.decompress(body).decode() == BODY
+
+    def test_compression_middleware_small_response(
+        self, compression_app: FastAPI, client: TestClient
+    ):
+        compression_app.add_middleware(CompressionMiddleware, min_size=100)
+
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+        assert response.json() == {"test": "test"}
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Vary"] == "Accept-Encoding"
+
+    def test_compression_middleware_not_accepted(
+        self, compression_app: FastAPI, client: TestClient
+    ):
+        compression_app.add_middleware(CompressionMiddleware, min_size=100)
+
+        response = client.get("/large", headers={"Accept-Encoding": "identity"})
+
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert response.headers["ETag"] == '"v1"'
+        assert response.text == BODY
+
+    def test_compression_middleware_not_compressible(
+        self, compression_app: FastAPI, client: TestClient
+    ):
+        compression_app.add_middleware(CompressionMiddleware, min_size=100)
+
+        response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+
+        assert "Content-Encoding" not in response.headers
+        assert "Vary" not in response.headers
+        assert len(response.content) == 4000
+
+    def test_compression_middleware_stream(self, compression_app: FastAPI):
+        middleware = CompressionMiddleware(compression_app, min_size=100)
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/stream",
+            "raw_path": b"/stream",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"accept-encoding", b"gzip")],
+        }
+        messages = []
+
+        async def receive():
+            # The client stays connected until the response ends
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(middleware(scope, receive, send))
+
+        headers = dict(messages[0]["headers"])
+        assert headers[b"content-encoding"] == b"gzip"
+        assert b"content-length" not in headers
+        # Every chunk is flushed as it comes, not held until the end
+        chunks = [message["body"] for message in messages[1:]]
+        assert len(chunks) == 11
+        assert all(chunks[:10])
+        assert gzip.decompress(b"".join(chunks)).decode() == BODY * 10
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        assert decompressor.decompress(chunks[0]).decode() == BODY
+
+    def test_compression_middleware_threadpool(
+        self, compression_app: FastAPI, client: TestClient, mocker: MockerFixture
+    ):
+        run_in_threadpool = mocker.spy(compression, "run_in_threadpool")
+        compression_app.add_middleware(
+            CompressionMiddleware, min_size=10, threadpool_size=len(BODY)
+        )
+
+        assert client.get("/", headers={"Accept-Encoding": "gzip"}).status_code == 200
+        assert run_in_threadpool.call_count == 0
+
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+        assert response.text == BODY
+        assert run_in_threadpool.call_count == 1
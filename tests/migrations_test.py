@@ -0,0 +1,191 @@
+"""Module to add all tests for the database migrations.
+"""
+
+import pytest
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from sqlalchemy import Connection, create_engine, inspect, text
+from sqlalchemy.pool import NullPool
+
+from app.database import Base
+from app.migrate import alembic_config, expression_index_filter
+from app.migrations import backfill, create_index_concurrently, drop_index_concurrently
+
+
+@pytest.fixture
+def database_url(postgresql) -> str:
+    return f"postgresql+psycopg2://{postgresql.info.user}:@{postgresql.info.host}:{postgresql.info.port}/{postgresql.info.dbname}"
+
+
+@pytest.fixture
+def connection(database_url: str) -> Connection:
+    """A connection to the migrated database."""
+
+    command.upgrade(alembic_config(database_url), "head")
+    engine = create_engine(database_url, poolclass=NullPool)
+
+    with engine.connect() as connection:
+        yield connection
+
+
+def index_names(connection: Connection, table_name: str) -> set[str]:
+    return {index["name"] for index in inspect(connection).get_indexes(table_name)}
+
+
+class TestMigrations:
+    def test_upgrade_matches_models(self, connection: Connection):
+        context = MigrationContext.configure(
+            connection,
+            opts={"include_object": expression_index_filter(Base.metadata)},
+        )
+
+        assert compare_metadata(context, Base.metadata) == []
+        assert {
+            "ix_records_search_vector",
+            "ix_records_title_c_id",
+            "ix_records_img_c",
+            "ix_records_img_host_id",
+        } <= index_names(connection, "records")
+
+    def test_search_vector_backfill(self, database_url: str):
+        command.upgrade(alembic_config(database_url), "0002")
+        engine = create_engine(database_url, poolclass=NullPool)
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    "INSERT INTO records (title) "
+                    "SELECT 'title ' || i FROM generate_series(1, 25) i"
+                )
+            )
+
+        command.upgrade(alembic_config(database_url), "head")
+
+        with engine.begin() as connection:
+            assert (
+                connection.scalar(
+                    text("SELECT count(*) FROM records WHERE search_vector IS NULL")
+                )
+                == 0
+            )
+
+            connection.execute(
+                text("UPDATE records SET title = 'renamed' WHERE id = 1")
+            )
+
+            assert (
+                connection.scalar(
+                    text("SELECT search_vector FROM records WHERE id = 1")
+                )
+                == "'renamed':1"
+            )
+
+    def test_upgrade_created_at_startup(self, database_url: str):
+        command.upgrade(alembic_config(database_url), "0001")
+        engine = create_engine(database_url, poolclass=NullPool)
+        # The tables of the app before migrations, created by create_all
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE alembic_version"))
+            connection.execute(text("INSERT INTO records (title) VALUES ('old')"))
+
+        command.stamp(alembic_config(database_url), "0001")
+        command.upgrade(alembic_config(database_url), "head")
+
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO records (title) VALUES ('new')"))
+            rows = connection.execute(
+                text("SELECT version, search_vector FROM records ORDER BY id")
+            ).all()
+            tables = inspect(connection).get_table_names()
+
+        assert [tuple(row) for row in rows] == [(1, "'old':1"), (1, "'new':1")]
+        assert "refresh_tokens" in tables
+
+    def test_upgrade_sql(self, database_url: str, capsys: pytest.CaptureFixture):
+        command.upgrade(alembic_config(database_url), "head", sql=True)
+
+        output = capsys.readouterr().out
+
+        assert "UPDATE records SET search_vector" in output
+        assert "CREATE INDEX CONCURRENTLY ix_records_search_vector" in output
+
+    def test_downgrade(self, database_url: str, connection: Connection):
+        command.downgrade(alembic_config(database_url), "base")
+
+        assert inspect(connection).get_table_names() == ["alembic_version"]
+
+
+class TestOperations:
+    def test_create_index_concurrently(self, connection: Connection):
+        with Operations.context(MigrationContext.configure(connection)):
+            create_index_concurrently(
+                "ix_records_title_lower", "records", [text("lower(title)")]
+            )
+
+        assert "ix_records_title_lower" in index_names(connection, "records")
+
+    def test_create_index_concurrently_replaces_invalid(self, connection: Connection):
+        connection.execute(text("CREATE INDEX ix_records_title_lower ON records (id)"))
+        # What a failed concurrent build leaves behind
+        connection.execute(
+            text(
+                "UPDATE pg_index SET indisvalid = false "
+                "WHERE indexrelid = 'ix_records_title_lower'::regclass"
+            )
+        )
+        connection.commit()
+
+        with Operations.context(MigrationContext.configure(connection)):
+            create_index_concurrently(
+                "ix_records_title_lower", "records", [text("lower(title)")]
+            )
+
+        definition, valid = connection.execute(
+            text(
+                "SELECT pg_get_indexdef(indexrelid), indisvalid FROM pg_index "
+                "WHERE indexrelid = 'ix_records_title_lower'::regclass"
+            )
+        ).one()
+        assert "lower" in definition
+        assert valid
+
+    def test_drop_index_concurrently(self, connection: Connection):
+        with Operations.context(MigrationContext.configure(connection)):
+            drop_index_concurrently("ix_records_img_c", "records")
+            # Already dropped
+            drop_index_concurrently("ix_records_img_c", "records")
+
+        assert "ix_records_img_c" not in index_names(connection, "records")
+
+    def test_backfill(self, connection: Connection):
+        connection.execute(
+            text(
+                "INSERT INTO records (title) "
+                "SELECT 'title ' || i FROM generate_series(1, 25) i"
+            )
+        )
+        connection.execute(text("ALTER TABLE records ADD COLUMN title_length integer"))
+        connection.execute(text("UPDATE records SET title_length = 0 WHERE id = 3"))
+        connection.commit()
+
+        with Operations.context(MigrationContext.configure(connection)):
+            updated = backfill(
+                "records",
+                "title_length = length(title)",
+                "title_length IS NULL",
+                batch_size=10,
+            )
+
+        assert updated == 24
+        lengths = connection.execute(
+            text("SELECT id, title_length FROM records ORDER BY id")
+        ).all()
+        assert lengths[2] == (3, 0)
+        assert all(length == len(f"title {id}") for id, length in lengths if id != 3)
+
+    def test_backfill_empty_table(self, connection: Connection):
+        with Operations.context(MigrationContext.configure(connection)):
+            assert backfill("records", "version = 2", "version = 1") == 0
@@ -29,6 +29,21 @@ class TestRecordModel:
         assert record.img == "http://test.record.image.com"
         assert record.id is not None
 
+    def test_record_search_vector(self, db_session: scoped_session):
+        record = Record(title="Test Record", img="http://test.record.image.com")
+
+        db_session.add(record)
+        db_session.commit()
+        db_session.refresh(record)
+
+        assert record.search_vector == "'record':2 'test':1"
+
+        record.title = "Renamed"
+        db_session.commit()
+        db_session.refresh(record)
+
+        assert record.search_vector == "'renamed':1"
+
 
 class TestUserModel:
     def test_record_properties(self):
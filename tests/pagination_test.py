@@ -0,0 +1,35 @@
+"""Module to add all tests for pagination helpers.
+"""
+
+import pytest
+
+from fastapi import HTTPException
+from starlette.datastructures import URL
+
+from app.pagination import encode_cursor, decode_cursor, next_page_link
+
+
+class TestCursor:
+    def test_encode_decode(self):
+        cursor = encode_cursor({"id": 42, "title": "test title"})
+
+        assert "=" not in cursor
+        assert decode_cursor(cursor) == {"id": 42, "title": "test title"}
+
+    @pytest.mark.parametrize("cursor", ["", "not a cursor", encode_cursor([1])])
+    def test_decode_invalid_cursor(self, cursor: str):
+        with pytest.raises(HTTPException) as cm:
+            decode_cursor(cursor)
+
+        exc = cm.value
+        assert exc.status_code == 400
+        assert exc.detail == "Invalid cursor"
+
+    def test_next_page_link(self):
+        url = URL("http://testserver/api/v1/records/?skip=10&limit=5")
+
+        link = next_page_link(url, "abc")
+
+        assert (
+            link == '<http://testserver/api/v1/records/?limit=5&cursor=abc>; rel="next"'
+        )
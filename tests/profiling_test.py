@@ -0,0 +1,109 @@
+"""Module to add all tests for request profiling.
+"""
+
+import logging
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+from app.middlewares import ProfilingMiddleware
+from app.profiling import (
+    ProfiledJSONResponse,
+    RequestProfile,
+    current_profile,
+    profile_span,
+    profile_statements,
+)
+
+
+@pytest.fixture
+def app(tmp_path: Path) -> FastAPI:
+    engine = create_engine(f"sqlite:///{tmp_path / 'profiling.db'}")
+    profile_statements(engine)
+
+    _app = FastAPI(title="Profiling Test App")
+    _app.add_middleware(ProfilingMiddleware)
+
+    @_app.get("/items")
+    def items():
+        with engine.connect() as connection:
+            values = [
+                connection.execute(text("SELECT :id"), {"id": i}).scalar()
+                for i in range(3)
+            ]
+        return ProfiledJSONResponse(values)
+
+    return _app
+
+
+class TestRequestProfile:
+    def test_server_timing(self):
+        profile = RequestProfile()
+        profile.add_statement("SELECT 1", 0.002, False)
+        profile.add_statement("INSERT", 0.001, True)
+        profile.add_span("auth", 0.0005)
+
+        assert profile.sql_count == 2
+        assert profile.server_timing().startswith(
+            'sql;dur=3.00;desc="2 queries", auth;dur=0.50, total;dur='
+        )
+
+    def test_repeated_statements(self):
+        profile = RequestProfile()
+        for _ in range(3):
+            profile.add_statement("SELECT 1", 0.001, False)
+            profile.add_statement("INSERT", 0.001, True)
+        profile.add_statement("SELECT 2", 0.001, False)
+
+        assert profile.repeated_statements(3) == [("SELECT 1", 3)]
+
+    def test_profile_span(self):
+        with profile_span("idle"):
+            pass
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            with profile_span("work"):
+                pass
+        finally:
+            current_profile.reset(token)
+
+        assert list(profile.spans) == ["work"]
+
+
+class TestProfilingMiddleware:
+    def test_not_profiled(self, app: FastAPI):
+        response = TestClient(app).get("/items", headers={"X-Profile": "1"})
+
+        assert response.status_code == 200
+        assert "Server-Timing" not in response.headers
+
+    def test_profiled_on_demand(
+        self, mocker: MockerFixture, app: FastAPI, caplog: pytest.LogCaptureFixture
+    ):
+        mocker.patch.object(settings, "PROFILING_ON_DEMAND", True)
+        mocker.patch.object(settings, "PROFILING_REPEATED_STATEMENTS", 3)
+
+        with caplog.at_level(logging.WARNING):
+            response = TestClient(app).get("/items", headers={"X-Profile": "1"})
+
+        assert response.status_code == 200
+        assert response.json() == [0, 1, 2]
+        assert 'desc="3 queries"' in response.headers["Server-Timing"]
+        assert "serialize;dur=" in response.headers["Server-Timing"]
+        assert "Possible N+1 queries in GET /items" in caplog.text
+
+    def test_sampled(self, mocker: MockerFixture, app: FastAPI):
+        mocker.patch.object(settings, "PROFILING_SAMPLE_RATE", 1)
+
+        response = TestClient(app).get("/items")
+
+        assert "Server-Timing" in response.headers
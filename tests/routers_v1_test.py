@@ -5,28 +5,593 @@ import json
 
 from pytest_mock import MockerFixture
 
+from passlib.context import CryptContext
+
 from fastapi import status
 from fastapi.testclient import TestClient
 
-from sqlalchemy.orm import scoped_session
+from sqlalchemy import text
+from sqlalchemy.orm import scoped_session
+
+from . import client, user, record, db_session
+
+from app import crud
+from app.config import settings
+from app.cache import SharedCache, TTLCache
+from app.models import User, Record, RefreshToken
+from app.pagination import encode_cursor
+from app.routers.v1.records import count_cache, estimate_cache
+from app.security import PasswordHasher
+
+
+class TestRecordRouter:
+    def test_record_unauthenticated(self, client: TestClient):
+        response = client.get("/api/v1/records/")
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        content = json.loads(response.content)
+
+        assert "detail" in content
+        assert content["detail"] == "User is not authenticated"
+
+    def test_record_list(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+
+        content = json.loads(response.content)
+
+        assert isinstance(content, list)
+        assert len(content) == 1
+        assert content[0]["title"] == record.title
+        assert content[0]["img"] == record.img
+
+    def test_record_list_cursor(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        db_session.add(Record(id=2, title="second", img="http://second.image.com"))
+        db_session.commit()
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/?limit=1", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item["title"] for item in response.json()] == [record.title]
+        assert 'rel="next"' in response.headers["Link"]
+
+        response = client.get(response.links["next"]["url"], headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item["title"] for item in response.json()] == ["second"]
+
+    def test_record_list_invalid_cursor(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/?cursor=invalid", headers=headers)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_record_list_invalid_page(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        for query in (
+            "skip=-1",
+            "limit=-1",
+            "limit=0",
+            f"limit={settings.RECORDS_MAX_LIMIT + 1}",
+        ):
+            response = client.get(f"/api/v1/records/?{query}", headers=headers)
+
+            assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_record_list_filter_and_sort(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        db_session.add_all(
+            [
+                Record(id=2, title="a title", img="http://OTHER.image.com/a.png"),
+                Record(id=3, title="b title", img="http://other.image.com/b.png"),
+            ]
+        )
+        db_session.commit()
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get(
+            "/api/v1/records/?img_host=other.image.com&sort=-id", headers=headers
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item["title"] for item in response.json()] == ["b title", "a title"]
+
+        response = client.get(
+            "/api/v1/records/?title_prefix=b&sort=title", headers=headers
+        )
+
+        assert [item["title"] for item in response.json()] == ["b title"]
+
+        response = client.get("/api/v1/records/?sort=title&limit=2", headers=headers)
+
+        assert [item["title"] for item in response.json()] == ["a title", "b title"]
+
+        response = client.get(response.links["next"]["url"], headers=headers)
+
+        assert [item["title"] for item in response.json()] == [record.title]
+
+    def test_record_list_count(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        db_session.add(Record(id=2, title="second", img="http://second.image.com"))
+        db_session.commit()
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/?limit=1&count=exact", headers=headers)
+
+        assert response.headers["X-Total-Count"] == "2"
+        assert response.headers["X-Total-Count-Mode"] == "exact"
+
+        # The table has not been analyzed, there is no estimate yet
+        response = client.get("/api/v1/records/?limit=1", headers=headers)
+
+        assert response.headers["X-Total-Count"] == "2"
+        assert response.headers["X-Total-Count-Mode"] == "cached"
+
+        db_session.execute(text("ANALYZE records"))
+        db_session.commit()
+        count_cache.clear()
+
+        response = client.get("/api/v1/records/?limit=1", headers=headers)
+
+        assert response.headers["X-Total-Count"] == "2"
+        assert response.headers["X-Total-Count-Mode"] == "estimated"
+
+        # The estimate is reused, and not computed at all for a 304
+        estimate = mocker.spy(crud, "estimate_count_records")
+        response = client.get("/api/v1/records/?limit=1", headers=headers)
+
+        assert response.headers["X-Total-Count-Mode"] == "estimated"
+
+        estimate_cache.clear()
+        response = client.get(
+            "/api/v1/records/?limit=1",
+            headers={**headers, "If-None-Match": response.headers["ETag"]},
+        )
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert "X-Total-Count" not in response.headers
+        assert estimate.call_count == 0
+
+        response = client.get("/api/v1/records/?title=second", headers=headers)
+
+        assert "X-Total-Count" not in response.headers
+
+    def test_record_list_unsupported_filters(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get(
+            "/api/v1/records/?img_host=example.com&sort=title", headers=headers
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_record_search(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        db_session.add_all(
+            [
+                Record(id=2, title="test test title", img="http://second.image.com"),
+                Record(id=3, title="unrelated", img="http://third.image.com"),
+            ]
+        )
+        db_session.commit()
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/search/?q=test&limit=1", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item["title"] for item in response.json()] == ["test test title"]
+
+        response = client.get(response.links["next"]["url"], headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item["title"] for item in response.json()] == [record.title]
+
+        response = client.get("/api/v1/records/search/?q=-test", headers=headers)
+
+        assert [item["title"] for item in response.json()] == ["unrelated"]
+
+    def test_record_search_equal_ranks(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        db_session.add_all(
+            [
+                Record(id=id, title="foo bar baz", img="http://image.com")
+                for id in range(1, 6)
+            ]
+        )
+        db_session.commit()
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/search/?q=foo&limit=2", headers=headers)
+        pages = [response.json()]
+        while "next" in response.links:
+            response = client.get(response.links["next"]["url"], headers=headers)
+            pages.append(response.json())
+
+        # Every page goes on after the tied rank of the previous one
+        assert [len(page) for page in pages] == [2, 2, 1]
+
+    def test_record_search_invalid_cursor(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        cursor = encode_cursor({"id": 1})
+        response = client.get(
+            f"/api/v1/records/search/?q=test&cursor={cursor}", headers=headers
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_record_create_invalid_img(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = {"title": "Fake Title", "img": "invalid url"}
+        post_data = json.dumps(data)
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.post("/api/v1/records/", data=post_data, headers=headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_record_create(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = {"title": "Fake Title", "img": "http://fake.img.com"}
+        post_data = json.dumps(data)
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.post("/api/v1/records/", data=post_data, headers=headers)
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+        content = json.loads(response.content)
+
+        assert content["title"] == "Fake Title"
+        assert content["img"] == "http://fake.img.com"
+
+        record = (
+            db_session.query(Record)
+            .filter(Record.title == "Fake Title")
+            .filter(Record.img == "http://fake.img.com")
+            .first()
+        )
+
+        assert record is not None
+
+    def test_record_bulk_create(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = [
+            {"title": f"Fake Title {i}", "img": "http://fake.img.com"} for i in range(3)
+        ]
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.post(
+            "/api/v1/records/bulk/?batch_size=2", json=data, headers=headers
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+        content = json.loads(response.content)
+
+        assert len(content["ids"]) == 3
+        assert content["errors"] == []
+
+        titles = [db_session.get(Record, id).title for id in content["ids"]]
+
+        assert titles == ["Fake Title 0", "Fake Title 1", "Fake Title 2"]
+
+    def test_record_bulk_create_invalid_item(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = [
+            {"title": "Fake Title", "img": "http://fake.img.com"},
+            {"title": "Fake Title", "img": "invalid url"},
+        ]
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.post("/api/v1/records/bulk/", json=data, headers=headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert db_session.query(Record).count() == 0
+
+        response = client.post(
+            "/api/v1/records/bulk/?atomic=false", json=data, headers=headers
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+        content = json.loads(response.content)
+
+        assert len(content["ids"]) == 1
+        assert [error["index"] for error in content["errors"]] == [1]
+
+    def test_record_retrieve(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get(f"/api/v1/records/{record.id}/", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+
+        content = json.loads(response.content)
+
+        assert content["title"] == record.title
+        assert content["img"] == record.img
+
+    def test_record_export(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/export/", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+
+        lines = response.text.splitlines()
+
+        assert len(lines) == 1
+        assert json.loads(lines[0]) == {"title": record.title, "img": record.img}
+
+    def test_record_export_json(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get("/api/v1/records/export/?format=json", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == [{"title": record.title, "img": record.img}]
+
+    def test_record_update_invalid_img(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = {"title": "Fake Title", "img": "invalid url"}
+        post_data = json.dumps(data)
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.put(
+            f"/api/v1/records/{record.id}", data=post_data, headers=headers
+        )
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_record_update(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = {"title": "Fake Title", "img": "http://fake.img.com"}
+        post_data = json.dumps(data)
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.put(
+            f"/api/v1/records/{record.id}", data=post_data, headers=headers
+        )
+
+        assert response.status_code == status.HTTP_200_OK
 
-from . import client, user, record, db_session
+        content = json.loads(response.content)
 
-from app.models import User, Record
+        assert content["title"] == "Fake Title"
+        assert content["img"] == "http://fake.img.com"
 
+    def test_record_partially_update(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
 
-class TestRecordRouter:
-    def test_record_unauthenticated(self, client: TestClient):
-        response = client.get("/api/v1/records/")
+        data = {"title": "Fake Title", "img": "http://fake.img.com"}
+        post_data = json.dumps(data)
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.patch(
+            f"/api/v1/records/{record.id}", data=post_data, headers=headers
+        )
 
-        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response.status_code == status.HTTP_200_OK
 
         content = json.loads(response.content)
 
-        assert "detail" in content
-        assert content["detail"] == "User is not authenticated"
+        assert content["title"] == "Fake Title"
+        assert content["img"] == "http://fake.img.com"
 
-    def test_record_list(
+    def test_record_partially_update_null_title(
         self,
         client: TestClient,
         user: User,
@@ -39,22 +604,25 @@ class TestRecordRouter:
         )
         mock_session_local.return_value = db_session
 
+        post_data = json.dumps({"title": None})
         headers = {"Authorization": f"Bearer {user.jwt}"}
-        response = client.get("/api/v1/records/", headers=headers)
+        response = client.patch(
+            f"/api/v1/records/{record.id}", data=post_data, headers=headers
+        )
 
-        assert response.status_code == status.HTTP_200_OK
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
-        content = json.loads(response.content)
+        # Read responses skip the response_model, a null would go out as it is
+        response = client.get(f"/api/v1/records/{record.id}", headers=headers)
 
-        assert isinstance(content, list)
-        assert len(content) == 1
-        assert content[0]["title"] == record.title
-        assert content[0]["img"] == record.img
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"title": record.title, "img": record.img}
 
-    def test_record_create_invalid_img(
+    def test_record_partially_update_null_img(
         self,
         client: TestClient,
         user: User,
+        record: Record,
         db_session: scoped_session,
         mocker: MockerFixture,
     ):
@@ -63,17 +631,23 @@ class TestRecordRouter:
         )
         mock_session_local.return_value = db_session
 
-        data = {"title": "Fake Title", "img": "invalid url"}
-        post_data = json.dumps(data)
+        post_data = json.dumps({"img": None})
         headers = {"Authorization": f"Bearer {user.jwt}"}
-        response = client.post("/api/v1/records/", data=post_data, headers=headers)
+        response = client.patch(
+            f"/api/v1/records/{record.id}", data=post_data, headers=headers
+        )
 
         assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
-    def test_record_create(
+        db_session.expire_all()
+
+        assert db_session.get(Record, record.id).img is not None
+
+    def test_record_delete(
         self,
         client: TestClient,
         user: User,
+        record: Record,
         db_session: scoped_session,
         mocker: MockerFixture,
     ):
@@ -82,28 +656,46 @@ class TestRecordRouter:
         )
         mock_session_local.return_value = db_session
 
-        data = {"title": "Fake Title", "img": "http://fake.img.com"}
-        post_data = json.dumps(data)
         headers = {"Authorization": f"Bearer {user.jwt}"}
-        response = client.post("/api/v1/records/", data=post_data, headers=headers)
+        response = client.delete(f"/api/v1/records/{record.id}", headers=headers)
 
-        assert response.status_code == status.HTTP_201_CREATED
+        assert response.status_code == status.HTTP_204_NO_CONTENT
 
-        content = json.loads(response.content)
+        record = db_session.query(Record).filter(Record.id == record.id).first()
 
-        assert content["title"] == "Fake Title"
-        assert content["img"] == "http://fake.img.com"
+        assert record is None
 
-        record = (
-            db_session.query(Record)
-            .filter(Record.title == "Fake Title")
-            .filter(Record.img == "http://fake.img.com")
-            .first()
+    def test_record_delete_shared_cache_down(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
         )
+        mock_session_local.return_value = db_session
+        store = mocker.Mock()
+        store.get.side_effect = store.set.side_effect = ConnectionError()
+        store.delete.side_effect = ConnectionError()
+        cache = SharedCache("record", store, ttl=10)
+        mocker.patch("app.dependencies.record.record_cache", cache)
+        mocker.patch("app.routers.v1.records.record_cache", cache)
 
-        assert record is not None
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.get(f"/api/v1/records/{record.id}", headers=headers)
 
-    def test_record_retrieve(
+        assert response.status_code == status.HTTP_200_OK
+
+        # The record is deleted, the stale entry would expire with the TTL
+        response = client.delete(f"/api/v1/records/{record.id}", headers=headers)
+
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert store.delete.called
+
+    def test_record_retrieve_cached(
         self,
         client: TestClient,
         user: User,
@@ -115,18 +707,37 @@ class TestRecordRouter:
             "app.middlewares.database_session.SessionLocal"
         )
         mock_session_local.return_value = db_session
+        cache = TTLCache("record", maxsize=16, ttl=30)
+        mocker.patch("app.dependencies.record.record_cache", cache)
+        mocker.patch("app.routers.v1.records.record_cache", cache)
 
         headers = {"Authorization": f"Bearer {user.jwt}"}
+        client.get(f"/api/v1/records/{record.id}/", headers=headers)
+
+        read_record = mocker.patch("app.crud.read_record")
         response = client.get(f"/api/v1/records/{record.id}/", headers=headers)
 
         assert response.status_code == status.HTTP_200_OK
+        assert response.json()["title"] == record.title
+        read_record.assert_not_called()
+
+        # Writes through the API update the cached record
+        client.patch(
+            f"/api/v1/records/{record.id}/",
+            data=json.dumps({"title": "Fake Title"}),
+            headers=headers,
+        )
+        response = client.get(f"/api/v1/records/{record.id}/", headers=headers)
 
-        content = json.loads(response.content)
+        assert response.json()["title"] == "Fake Title"
 
-        assert content["title"] == record.title
-        assert content["img"] == record.img
+        client.delete(f"/api/v1/records/{record.id}/", headers=headers)
+        read_record.return_value = None
+        response = client.get(f"/api/v1/records/{record.id}/", headers=headers)
 
-    def test_record_update_invalid_img(
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_record_retrieve_not_modified(
         self,
         client: TestClient,
         user: User,
@@ -139,16 +750,20 @@ class TestRecordRouter:
         )
         mock_session_local.return_value = db_session
 
-        data = {"title": "Fake Title", "img": "invalid url"}
-        post_data = json.dumps(data)
         headers = {"Authorization": f"Bearer {user.jwt}"}
-        response = client.put(
-            f"/api/v1/records/{record.id}", data=post_data, headers=headers
-        )
+        response = client.get(f"/api/v1/records/{record.id}/", headers=headers)
 
-        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.status_code == status.HTTP_200_OK
 
-    def test_record_update(
+        etag = response.headers["ETag"]
+        headers["If-None-Match"] = etag
+        response = client.get(f"/api/v1/records/{record.id}/", headers=headers)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+
+    def test_record_update_precondition_failed(
         self,
         client: TestClient,
         user: User,
@@ -161,21 +776,33 @@ class TestRecordRouter:
         )
         mock_session_local.return_value = db_session
 
-        data = {"title": "Fake Title", "img": "http://fake.img.com"}
-        post_data = json.dumps(data)
         headers = {"Authorization": f"Bearer {user.jwt}"}
-        response = client.put(
-            f"/api/v1/records/{record.id}", data=post_data, headers=headers
+        response = client.get(f"/api/v1/records/{record.id}/", headers=headers)
+        headers["If-Match"] = response.headers["ETag"]
+
+        response = client.patch(
+            f"/api/v1/records/{record.id}/",
+            data=json.dumps({"title": "First Title"}),
+            headers=headers,
         )
 
         assert response.status_code == status.HTTP_200_OK
+        assert response.headers["ETag"] != headers["If-Match"]
 
-        content = json.loads(response.content)
+        # The ETag sent is stale now, the second write is rejected
+        response = client.patch(
+            f"/api/v1/records/{record.id}/",
+            data=json.dumps({"title": "Second Title"}),
+            headers=headers,
+        )
 
-        assert content["title"] == "Fake Title"
-        assert content["img"] == "http://fake.img.com"
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
 
-    def test_record_partially_update(
+        response = client.delete(f"/api/v1/records/{record.id}/", headers=headers)
+
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+    def test_record_bulk_update(
         self,
         client: TestClient,
         user: User,
@@ -188,21 +815,36 @@ class TestRecordRouter:
         )
         mock_session_local.return_value = db_session
 
-        data = {"title": "Fake Title", "img": "http://fake.img.com"}
-        post_data = json.dumps(data)
+        data = {"where": {"title": record.title}, "values": {"title": "Fake Title"}}
         headers = {"Authorization": f"Bearer {user.jwt}"}
-        response = client.patch(
-            f"/api/v1/records/{record.id}", data=post_data, headers=headers
-        )
+        response = client.patch("/api/v1/records/bulk/", json=data, headers=headers)
 
         assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"count": 1, "ids": [record.id]}
 
-        content = json.loads(response.content)
+        db_session.expire_all()
 
-        assert content["title"] == "Fake Title"
-        assert content["img"] == "http://fake.img.com"
+        assert db_session.get(Record, record.id).title == "Fake Title"
 
-    def test_record_delete(
+    def test_record_bulk_update_without_selection(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = {"where": {}, "values": {"title": "Fake Title"}}
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.patch("/api/v1/records/bulk/", json=data, headers=headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_record_bulk_update_null_title(
         self,
         client: TestClient,
         user: User,
@@ -215,14 +857,38 @@ class TestRecordRouter:
         )
         mock_session_local.return_value = db_session
 
+        data = {"where": {"ids": [record.id]}, "values": {"title": None}}
         headers = {"Authorization": f"Bearer {user.jwt}"}
-        response = client.delete(f"/api/v1/records/{record.id}", headers=headers)
+        response = client.patch("/api/v1/records/bulk/", json=data, headers=headers)
 
-        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
-        record = db_session.query(Record).filter(Record.id == record.id).first()
+        db_session.expire_all()
 
-        assert record is None
+        assert db_session.get(Record, record.id).title == record.title
+
+    def test_record_bulk_delete(
+        self,
+        client: TestClient,
+        user: User,
+        record: Record,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = {"ids": [record.id, 1000]}
+        headers = {"Authorization": f"Bearer {user.jwt}"}
+        response = client.request(
+            "DELETE", "/api/v1/records/bulk/", json=data, headers=headers
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"count": 1, "ids": [record.id]}
+        assert db_session.query(Record).count() == 0
 
 
 class TestAuthRouter:
@@ -324,3 +990,119 @@ class TestAuthRouter:
 
         assert content["token_type"] == "bearer"
         assert isinstance(content["jwt"], str)
+        assert isinstance(content["refresh_token"], str)
+
+        refresh_token = db_session.query(RefreshToken).one()
+
+        assert refresh_token.user_id == user.id
+        assert refresh_token.token_hash != content["refresh_token"]
+
+    def test_login_rehashes_password(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+        # Hash in this process so the patched context is used
+        mocker.patch(
+            "app.routers.v1.auth.password_hasher",
+            PasswordHasher(workers=0, concurrency=1, queue_timeout=1),
+        )
+        mocker.patch(
+            "app.security.pwd_context",
+            CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4),
+        )
+
+        data = {"email": user.email, "password": "123456"}
+        response = client.post("/api/v1/login/", data=json.dumps(data))
+
+        assert response.status_code == status.HTTP_200_OK
+
+        db_session.expire_all()
+        db_user = db_session.get(User, user.id)
+
+        assert db_user.hashed_password.startswith("$2b$04$")
+
+    def test_refresh_token(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = {"email": user.email, "password": "123456"}
+        response = client.post("/api/v1/login/", data=json.dumps(data))
+        refresh_token = response.json()["refresh_token"]
+
+        data = {"refresh_token": refresh_token}
+        response = client.post("/api/v1/token/refresh/", data=json.dumps(data))
+
+        assert response.status_code == status.HTTP_200_OK
+
+        content = json.loads(response.content)
+
+        assert content["token_type"] == "bearer"
+        assert content["refresh_token"] != refresh_token
+
+        headers = {"Authorization": f"Bearer {content['jwt']}"}
+        response = client.get("/api/v1/records/", headers=headers)
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_refresh_token_invalid(
+        self,
+        client: TestClient,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = {"refresh_token": "invalid"}
+        response = client.post("/api/v1/token/refresh/", data=json.dumps(data))
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        content = json.loads(response.content)
+
+        assert content["detail"] == "Invalid refresh token"
+
+    def test_refresh_token_reused(
+        self,
+        client: TestClient,
+        user: User,
+        db_session: scoped_session,
+        mocker: MockerFixture,
+    ):
+        mock_session_local = mocker.patch(
+            "app.middlewares.database_session.SessionLocal"
+        )
+        mock_session_local.return_value = db_session
+
+        data = {"email": user.email, "password": "123456"}
+        response = client.post("/api/v1/login/", data=json.dumps(data))
+        first = {"refresh_token": response.json()["refresh_token"]}
+
+        response = client.post("/api/v1/token/refresh/", data=json.dumps(first))
+        second = {"refresh_token": response.json()["refresh_token"]}
+
+        # Replaying a rotated token revokes the tokens rotated from it too
+        response = client.post("/api/v1/token/refresh/", data=json.dumps(first))
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        response = client.post("/api/v1/token/refresh/", data=json.dumps(second))
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
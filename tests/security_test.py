@@ -0,0 +1,65 @@
+"""Module to add all tests for password hashing.
+"""
+
+import asyncio
+import time
+
+import pytest
+from pytest_mock import MockerFixture
+
+from passlib.context import CryptContext
+
+from fastapi import HTTPException
+
+from app.security import PasswordHasher
+
+
+class TestPasswordHasher:
+    def test_hash_and_verify(self):
+        hasher = PasswordHasher(workers=0, concurrency=1, queue_timeout=1)
+        hashed_password = asyncio.run(hasher.hash("123456"))
+
+        assert asyncio.run(hasher.verify("123456", hashed_password)) == (True, None)
+        assert asyncio.run(hasher.verify("654321", hashed_password)) == (False, None)
+
+    def test_process_pool(self):
+        hasher = PasswordHasher(workers=1, concurrency=1, queue_timeout=5)
+        try:
+            hashed_password = asyncio.run(hasher.hash("123456"))
+            valid, _ = asyncio.run(hasher.verify("123456", hashed_password))
+        finally:
+            hasher.shutdown()
+
+        assert valid
+
+    def test_verify_rehashes_on_cost_change(self, mocker: MockerFixture):
+        hasher = PasswordHasher(workers=0, concurrency=1, queue_timeout=1)
+        old_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+        mocker.patch(
+            "app.security.pwd_context",
+            CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5),
+        )
+
+        valid, new_hash = asyncio.run(
+            hasher.verify("123456", old_context.hash("123456"))
+        )
+
+        assert valid
+        assert new_hash.startswith("$2b$05$")
+
+    def test_queue_timeout(self):
+        hasher = PasswordHasher(workers=0, concurrency=1, queue_timeout=0.05)
+
+        async def run_two():
+            return await asyncio.gather(
+                hasher._run("test", time.sleep, 0.5),
+                hasher._run("test", time.sleep, 0.5),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(run_two())
+
+        assert results[0] is None
+        assert isinstance(results[1], HTTPException)
+        assert results[1].status_code == 503
+        assert "Retry-After" in results[1].headers
@@ -0,0 +1,135 @@
+"""Module to add all tests for the production server and the health checks.
+"""
+
+import asyncio
+import signal
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from fastapi.testclient import TestClient
+
+from sqlalchemy import Engine, create_engine
+from uvicorn import Config
+
+from . import client
+
+from app.config import settings
+from app.database import TimedQueuePool
+from app.main import app
+from app.routers import health
+from app.server import Application, DrainingServer, Worker
+
+
+@pytest.fixture
+def health_engine(tmp_path: Path, mocker: MockerFixture) -> Engine:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'health.db'}", poolclass=TimedQueuePool, pool_size=2
+    )
+    mocker.patch.object(settings, "DATABASE_ASYNC", False)
+    mocker.patch("app.routers.health.engine", engine)
+
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+class TestHealthRouter:
+    def test_live(self, client: TestClient):
+        response = client.get("/health/live")
+
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
+
+    def test_ready(self, client: TestClient, health_engine: Engine):
+        response = client.get("/health/ready")
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "status": "ok",
+            "pool": {"size": 2, "checked_out": 0, "overflow": 0},
+            "replicas": {},
+        }
+
+    def test_ready_database_unavailable(
+        self, client: TestClient, tmp_path: Path, mocker: MockerFixture
+    ):
+        mocker.patch.object(settings, "DATABASE_ASYNC", False)
+        mocker.patch(
+            "app.routers.health.engine",
+            create_engine(f"sqlite:///{tmp_path / 'missing' / 'health.db'}"),
+        )
+
+        response = client.get("/health/ready")
+
+        assert response.status_code == 503
+        assert response.json()["status"] == "unavailable"
+
+    def test_ready_draining(
+        self, client: TestClient, health_engine: Engine, mocker: MockerFixture
+    ):
+        mocker.patch.object(health, "draining", True)
+
+        response = client.get("/health/ready")
+
+        assert response.status_code == 503
+        assert response.json()["status"] == "draining"
+        assert client.get("/health/live").status_code == 200
+
+
+class TestDrainingServer:
+    def test_drain(self, mocker: MockerFixture):
+        mocker.patch.object(settings, "WEB_DRAIN_SECONDS", 0.1)
+        mocker.patch.object(health, "draining", False)
+        server = DrainingServer(Config(app=app))
+
+        async def terminate():
+            server.handle_exit(signal.SIGTERM, None)
+
+            assert health.draining
+            assert not server.should_exit
+
+            await asyncio.sleep(0.2)
+
+            assert server.should_exit
+
+        asyncio.run(terminate())
+
+    def test_second_signal(self, mocker: MockerFixture):
+        mocker.patch.object(settings, "WEB_DRAIN_SECONDS", 10)
+        mocker.patch.object(health, "draining", False)
+        server = DrainingServer(Config(app=app))
+
+        async def terminate():
+            server.handle_exit(signal.SIGTERM, None)
+            server.handle_exit(signal.SIGTERM, None)
+
+            assert server.should_exit
+
+        asyncio.run(terminate())
+
+    def test_no_drain(self, mocker: MockerFixture):
+        mocker.patch.object(settings, "WEB_DRAIN_SECONDS", 0)
+        mocker.patch.object(health, "draining", False)
+        server = DrainingServer(Config(app=app))
+
+        server.handle_exit(signal.SIGTERM, None)
+
+        assert health.draining
+        assert server.should_exit
+
+
+class TestApplication:
+    def test_options(self, mocker: MockerFixture):
+        mocker.patch.object(settings, "WEB_DRAIN_SECONDS", 5)
+        mocker.patch.object(settings, "WEB_GRACEFUL_TIMEOUT", 30)
+
+        application = Application({"workers": 3})
+
+        assert application.cfg.workers == 3
+        assert application.cfg.worker_class is Worker
+        assert application.cfg.preload_app
+        assert application.cfg.graceful_timeout == 35
+        assert Worker.CONFIG_KWARGS == {"loop": "uvloop", "http": "httptools"}